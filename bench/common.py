@@ -0,0 +1,32 @@
+"""Shared setup for the benchmark scripts.
+
+Each benchmark runs against a fresh database in a scratch directory, so it never touches
+the bot's own music_battles.db. Run them from the repository root, e.g.
+`python -m bench.stats_embed`.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+def scratch_dir():
+    """Switch to a new temporary directory; the database pool opens its file relative to it."""
+    path = tempfile.mkdtemp(prefix='music_battles_bench_')
+    os.chdir(path)
+    return path
+
+def connect():
+    """Plain sqlite3 connection for bulk-loading fixture rows quickly."""
+    return sqlite3.connect('music_battles.db')
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
@@ -0,0 +1,87 @@
+"""/enter load test: concurrent entrants through record_entry.
+
+Gives every user enough coins for one entry, fires all entries at once into the same
+pool (the worst case for the pending-battle lock) and reports throughput and latency
+percentiles. It then checks the invariants the transaction exists for: one pending battle
+per pool, one debit per entrant, and balances that agree with the coin journal.
+
+    python -m bench.enter_load [--entrants 200] [--rounds 3]
+"""
+import argparse
+import asyncio
+import time
+
+from bench.common import scratch_dir, percentile
+from utils.database import init_db, close_db, get_db, get_pool_stats
+from utils.entries import record_entry, ENTRY_OK
+from utils.coins import check_integrity
+from utils.user_cache import user_cache
+
+POOL = 5.0
+
+async def seed_users(first, count):
+    async with get_db() as db:
+        users = [(u, f"user{u}") for u in range(first, first + count)]
+        await db.executemany("INSERT INTO users (user_id, username, coins) VALUES (?, ?, 5)", users)
+        await db.executemany(
+            "INSERT INTO coin_transactions (user_id, delta, reason) VALUES (?, 5, 'opening_balance')",
+            [(u,) for u, _ in users]
+        )
+        await db.commit()
+
+async def burst(first, count, genre):
+    latencies = []
+
+    async def enter(user_id):
+        started = time.perf_counter()
+        result = await record_entry(user_id, f"user{user_id}", genre, POOL, 'https://example.invalid/track')
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(enter(u) for u in range(first, first + count)))
+    elapsed = time.perf_counter() - started
+    ok = sum(status == ENTRY_OK for status, _ in results)
+    print(f"{count} concurrent entries into {genre} ${POOL:g}: {count / elapsed:.0f} entries/s, "
+          f"p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms, "
+          f"max {max(latencies) * 1000:.1f} ms, accepted {ok}/{count}")
+    return ok
+
+async def main(args):
+    scratch_dir()
+    await init_db()
+    try:
+        genres = ['Rock', 'Trap', 'Pop', 'Metal', 'Gospel']
+        accepted = 0
+        for i in range(args.rounds):
+            first = 1 + i * args.entrants
+            await seed_users(first, args.entrants)
+            user_cache.clear()
+            accepted += await burst(first, args.entrants, genres[i % len(genres)])
+
+        # A user with coins for one entry racing five entries into different pools
+        await seed_users(10 ** 6, 1)
+        results = await asyncio.gather(*(record_entry(10 ** 6, 'racer', g, POOL, 'x') for g in genres))
+        accepted += sum(status == ENTRY_OK for status, _ in results)
+        print(f"one user, 5 simultaneous entries with coins for one: {sorted(status for status, _ in results)}")
+
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM battles WHERE status = 'pending' GROUP BY genre, pool_amount HAVING COUNT(*) > 1")
+            duplicate_pending = await cursor.fetchall()
+            cursor = await db.execute("SELECT COUNT(*) FROM entrants")
+            entrants = (await cursor.fetchone())[0]
+            cursor = await db.execute("SELECT COUNT(*) FROM users WHERE coins < 0")
+            negative = (await cursor.fetchone())[0]
+        report = await check_integrity(full=True)
+        print(f"entrants stored {entrants} (accepted {accepted}), pools with >1 pending battle: {len(duplicate_pending)}, "
+              f"negative balances: {negative}, journal mismatches: {len(report['balance_mismatches'])}")
+        stats = get_pool_stats()
+        print(f"pool: {stats['acquisitions']} acquisitions, {stats['waits']} waits, max wait {stats['max_wait_seconds'] * 1000:.1f} ms")
+    finally:
+        await close_db()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entrants', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""/payouts at scale: the original winner query vs keyset pages over battle_results.
+
+Loads completed battles with four paid entrants and ten votes each (every 50th battle
+gets no votes), times the original correlated query plus its per-row COUNT(*), then runs
+the migration 10 backfill and times Payments.fetch_payouts pages near the newest and
+oldest ends of the history, with and without the unpaid filter.
+
+    python -m bench.payouts [--battles 100000] [--pages 1000]
+"""
+import argparse
+import asyncio
+import random
+
+from bench.common import scratch_dir, connect, Timer
+from utils.database import init_db, close_db, get_db, _migration_010_battle_results
+from cogs.payments import Payments
+
+# /payouts before battle_results existed: re-tally every completed battle, then N+1 counts
+ORIGINAL_PAYOUTS_SQL = (
+    "SELECT u.username, b.genre, b.pool_amount, b.battle_id FROM battles b JOIN entrants e ON b.battle_id = e.battle_id JOIN users u ON e.user_id = u.user_id "
+    "WHERE b.status = 'completed' AND e.payment_status = 'paid' AND e.entrant_id = (SELECT v.entrant_id FROM votes v WHERE v.battle_id = b.battle_id GROUP BY v.entrant_id ORDER BY COUNT(*) DESC LIMIT 1)"
+)
+
+def load_fixture(battles):
+    random.seed(1)
+    conn = connect()
+    conn.executemany("INSERT INTO users (user_id, username, coins) VALUES (?, ?, 0)", [(u, f"user{u}") for u in range(1, 5001)])
+    conn.executemany("INSERT INTO battles (battle_id, genre, pool_amount, status) VALUES (?, 'Rock', 5, 'completed')", [(b,) for b in range(1, battles + 1)])
+    entrants, votes = [], []
+    entrant_id = 0
+    for battle_id in range(1, battles + 1):
+        ids = []
+        for _ in range(4):
+            entrant_id += 1
+            ids.append(entrant_id)
+            entrants.append((entrant_id, battle_id, random.randint(1, 5000), 'https://example.invalid/track', 'paid'))
+        if battle_id % 50:
+            votes.extend((battle_id, voter, random.choice(ids)) for voter in range(1, 11))
+    conn.executemany("INSERT INTO entrants (entrant_id, battle_id, user_id, track_link, payment_status) VALUES (?, ?, ?, ?, ?)", entrants)
+    conn.executemany("INSERT INTO votes (battle_id, voter_id, entrant_id) VALUES (?, ?, ?)", votes)
+    conn.commit()
+
+    with Timer() as t:
+        rows = conn.execute(ORIGINAL_PAYOUTS_SQL).fetchall()
+        for row in rows:
+            conn.execute("SELECT COUNT(*) FROM entrants WHERE battle_id = ? AND payment_status = 'paid'", (row[3],)).fetchone()
+    conn.close()
+    print(f"{battles} battles, {len(entrants)} entrants, {len(votes)} votes")
+    print(f"original /payouts: {len(rows)} winners + {len(rows)} counts in {t.elapsed * 1000:.0f} ms (all history, every call)")
+
+async def time_pages(payments, label, before, unpaid_only, pages):
+    with Timer() as t:
+        for _ in range(pages):
+            rows = await payments.fetch_payouts(before=before, unpaid_only=unpaid_only)
+    print(f"{label}: {t.elapsed * 1000 / pages:.3f} ms/page ({len(rows)} rows)")
+
+async def main(args):
+    scratch_dir()
+    await init_db()
+    try:
+        # battle_results is still empty, so re-running migration 10 backfills the whole fixture
+        load_fixture(args.battles)
+
+        async with get_db() as db:
+            with Timer() as t:
+                await _migration_010_battle_results(db)
+                await db.commit()
+            cursor = await db.execute("SELECT COUNT(*), COUNT(winner_user_id) FROM battle_results")
+            results, winners = await cursor.fetchone()
+        print(f"migration 10 backfill: {results} results ({winners} with a winner) in {t.elapsed:.2f}s")
+
+        payments = Payments.__new__(Payments)
+        await time_pages(payments, "newest page", None, False, args.pages)
+        await time_pages(payments, "oldest page", 60, False, args.pages)
+        await time_pages(payments, "newest unpaid page", None, True, args.pages)
+
+        # Walk the whole history the way the Older button does
+        with Timer() as t:
+            total, before = 0, None
+            while True:
+                rows = await payments.fetch_payouts(before=before)
+                if not rows:
+                    break
+                total += len(rows)
+                before = rows[-1][0]
+        print(f"paging through all {total} winners: {t.elapsed:.2f}s")
+    finally:
+        await close_db()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--battles', type=int, default=100_000)
+    parser.add_argument('--pages', type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""REST calls per rejected reaction, counted through a fake discord.py HTTP layer.
+
+Replaces the bot's HTTPClient.request with a counter, then drives the Voting cog's raw
+reaction handlers with a mix of valid votes, duplicate votes, replayed duplicate adds
+(as after a RESUME), invalid emoji and the remove events our own removals echo back.
+"before" replays the same rejections through the original fetch_message +
+remove_reaction path for comparison.
+
+    python -m bench.reaction_rejects [--voters 2000]
+"""
+import argparse
+import asyncio
+import types
+from collections import Counter
+
+import discord
+from discord.ext import commands
+
+from bench.common import Timer
+from cogs.voting import Voting
+
+CHANNEL_ID = 10
+BOT_USER_ID = 999
+
+def fake_http(bot, routes):
+    async def request(route, **kwargs):
+        routes[(route.method, route.path)] += 1
+        await asyncio.sleep(0)
+        if route.method == 'GET':
+            # Just enough of a message payload for fetch_message to build a Message
+            return {
+                'id': 1, 'channel_id': CHANNEL_ID, 'type': 0, 'content': '',
+                'author': {'id': BOT_USER_ID, 'username': 'bot', 'discriminator': '0', 'avatar': None},
+                'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None, 'tts': False,
+                'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [],
+                'embeds': [], 'pinned': False,
+            }
+    bot.http.request = request
+
+def reaction(kind, message_id, user_id, emoji="✅", guild_id=1):
+    data = {'message_id': message_id, 'channel_id': CHANNEL_ID, 'user_id': user_id, 'burst': False, 'type': 0}
+    if guild_id is not None:
+        data['guild_id'] = guild_id
+    return discord.RawReactionActionEvent(data, discord.PartialEmoji(name=emoji), kind)
+
+async def original_reject(bot, payload):
+    """The pre-rewrite rejection: fetch the full message, then remove the reaction from it."""
+    channel = bot.get_partial_messageable(payload.channel_id)
+    message = await channel.fetch_message(payload.message_id)
+    await message.remove_reaction(payload.emoji, discord.Object(id=payload.user_id))
+
+async def main(args):
+    routes = Counter()
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.default())
+    fake_http(bot, routes)
+    bot._connection.user = types.SimpleNamespace(id=BOT_USER_ID)
+    voting = Voting(bot)
+    # Battle 1: entrant 1 has an announcement (100) and a submission (101), entrant 2 a submission (201)
+    voting.message_index.add(100, 1, 1, 'announcement')
+    voting.message_index.add(101, 1, 1, 'submission')
+    voting.message_index.add(201, 2, 1, 'submission')
+
+    rejected = 0
+    with Timer() as t:
+        for user_id in range(1000, 1000 + args.voters):
+            await voting.on_raw_reaction_add(reaction('REACTION_ADD', 100, user_id))           # valid vote
+            await voting.on_raw_reaction_add(reaction('REACTION_ADD', 201, user_id))           # duplicate vote
+            await voting.on_raw_reaction_add(reaction('REACTION_ADD', 201, user_id))           # replayed duplicate
+            await voting.on_raw_reaction_add(reaction('REACTION_ADD', 100, user_id, "🔥"))     # invalid emoji
+            await voting.on_raw_reaction_remove(reaction('REACTION_REMOVE', 201, user_id))     # echo of our removal
+            await voting.on_raw_reaction_remove(reaction('REACTION_REMOVE', 100, user_id, "🔥"))
+            rejected += 3
+    after_calls = sum(routes.values())
+    assert voting.ledger.votes_for(1, 1) == args.voters and voting.ledger.votes_for(1, 2) == 0, "rejections changed the tally"
+    print(f"after: {rejected} rejected reactions -> {after_calls} REST calls "
+          f"({after_calls / rejected:.2f} per rejection) in {t.elapsed:.2f}s")
+    for (method, path), count in sorted(routes.items()):
+        print(f"    {method} {path}: {count}")
+
+    # A reaction outside a guild has no guild_id; the original handler crashed on it
+    await voting.on_raw_reaction_add(reaction('REACTION_ADD', 100, 7, "🔥", guild_id=None))
+
+    routes.clear()
+    with Timer() as t:
+        for user_id in range(1000, 1000 + args.voters):
+            for message_id, emoji in ((201, "✅"), (201, "✅"), (100, "🔥")):
+                await original_reject(bot, reaction('REACTION_ADD', message_id, user_id, emoji))
+    before_calls = sum(routes.values())
+    print(f"before: {rejected} rejected reactions -> {before_calls} REST calls "
+          f"({before_calls / rejected:.2f} per rejection) in {t.elapsed:.2f}s")
+    for (method, path), count in sorted(routes.items()):
+        print(f"    {method} {path}: {count}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--voters', type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""Live-stats embed build time: per-pool leaderboard queries vs the standings query.
+
+Loads one open battle per genre/pool, spreads the entrants across them and casts the
+votes, then times building the full board both ways. "before" is the original loop: one
+correlated top-3 query per pool with entrants (up to 33). "after" is
+Payments.get_stats_embed: two queries plus vote counts from the in-memory ledger.
+
+    python -m bench.stats_embed [--entrants 10000] [--votes 1000000] [--runs 3]
+"""
+import argparse
+import asyncio
+import random
+
+from bench.common import scratch_dir, connect, Timer
+from utils.database import init_db, close_db, get_db
+from utils.constants import GENRES, POOLS, WINNER_PAYOUT_PERCENT
+from cogs.payments import Payments
+from cogs.voting import VoteLedger
+
+# The leaderboard query get_stats_embed ran for every pool before the standings rewrite
+PER_POOL_LEADERS_SQL = """
+    SELECT u.username, COUNT(v.vote_id) as vote_count
+    FROM entrants e
+    JOIN users u ON e.user_id = u.user_id
+    LEFT JOIN votes v ON e.entrant_id = v.entrant_id
+    WHERE e.battle_id = (
+        SELECT battle_id FROM battles
+        WHERE genre = ? AND pool_amount = ? AND status IN ('pending', 'active', 'voting')
+        ORDER BY created_at DESC LIMIT 1
+    )
+    AND e.payment_status = 'paid'
+    AND e.disqualified = 0
+    GROUP BY e.entrant_id
+    ORDER BY vote_count DESC, e.entrant_id ASC
+    LIMIT 3
+"""
+
+class _Bot:
+    def __init__(self, voting):
+        self._voting = voting
+
+    def get_cog(self, name):
+        return self._voting if name == 'Voting' else None
+
+class _Voting:
+    def __init__(self):
+        self.ledger = VoteLedger()
+
+async def build_before():
+    """The original get_stats_embed data path: pool_totals, then one query per pool."""
+    lines = []
+    async with get_db() as db:
+        cursor = await db.execute("SELECT genre, pool_type, total_amount, entrant_count FROM pool_totals")
+        stats_map = {(r[0], r[1]): (r[2], r[3]) for r in await cursor.fetchall()}
+        for g in GENRES:
+            for p in POOLS:
+                total, count = stats_map.get((g, p), (0.0, 0))
+                lines.append(f"**${p} Pool**: `${total:.2f}` (Winner: `${total * WINNER_PAYOUT_PERCENT:.2f}`)")
+                if count:
+                    cursor = await db.execute(PER_POOL_LEADERS_SQL, (g, float(p)))
+                    lines.extend(f"{name} (`{votes}v`)" for name, votes in await cursor.fetchall())
+    return lines
+
+def load_fixture(entrants, votes):
+    random.seed(1)
+    conn = connect()
+    pools = [(g, p) for g in GENRES for p in POOLS]
+    conn.executemany(
+        "INSERT INTO battles (battle_id, genre, pool_amount, status) VALUES (?, ?, ?, 'voting')",
+        [(i, g, p) for i, (g, p) in enumerate(pools, 1)]
+    )
+    per_pool = entrants // len(pools)
+    conn.executemany(
+        "INSERT INTO pool_totals (genre, pool_type, total_amount, entrant_count) VALUES (?, ?, ?, ?)",
+        [(g, p, p * per_pool, per_pool) for g, p in pools]
+    )
+    conn.executemany("INSERT INTO users (user_id, username, coins) VALUES (?, ?, 0)", [(u, f"user{u}") for u in range(1, entrants + 1)])
+    by_battle = {}
+    rows = []
+    for entrant_id in range(1, entrants + 1):
+        battle_id = (entrant_id - 1) % len(pools) + 1
+        by_battle.setdefault(battle_id, []).append(entrant_id)
+        rows.append((entrant_id, battle_id, entrant_id, 'https://example.invalid/track', 'paid'))
+    conn.executemany("INSERT INTO entrants (entrant_id, battle_id, user_id, track_link, payment_status) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.executemany(
+        "INSERT INTO votes (battle_id, voter_id, entrant_id) VALUES (?, ?, ?)",
+        ((i % len(pools) + 1, 100000 + i // len(pools), random.choice(by_battle[i % len(pools) + 1])) for i in range(votes))
+    )
+    conn.commit()
+    conn.close()
+
+async def main(args):
+    scratch_dir()
+    await init_db()
+    try:
+        print(f"Loading {args.entrants} entrants and {args.votes} votes...")
+        load_fixture(args.entrants, args.votes)
+
+        voting = _Voting()
+        with Timer() as t:
+            await voting.ledger.load()
+        print(f"ledger load (once at startup): {t.elapsed:.2f}s")
+
+        payments = Payments.__new__(Payments)
+        payments.bot = _Bot(voting)
+        for label, build in (('before', build_before), ('after', payments.get_stats_embed)):
+            times = []
+            for _ in range(args.runs):
+                with Timer() as t:
+                    await build()
+                times.append(t.elapsed)
+            print(f"{label}: best {min(times) * 1000:.1f} ms, worst {max(times) * 1000:.1f} ms over {args.runs} runs")
+    finally:
+        await close_db()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entrants', type=int, default=10_000)
+    parser.add_argument('--votes', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
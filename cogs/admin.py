@@ -1,7 +1,9 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from utils.database import get_db
+from utils.database import get_db, commit, after_commit
+from utils.coins import apply_coins, check_integrity, REASON_REFUND
+from utils.guild_registry import guild_registry
 from utils.constants import COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, VOTING_DURATION_HOURS, GENRES, POOLS
 from datetime import datetime, timedelta
 import logging
@@ -157,7 +159,7 @@ class Admin(commands.Cog):
             # 2. Database Transaction: Refund and Cleanup
             try:
                 # Refund coins
-                await db.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (refund_amt, user.id))
+                await apply_coins(db, user.id, refund_amt, REASON_REFUND, f"entrant:{ent_id}")
                 
                 # Update pool totals
                 await db.execute(
@@ -166,13 +168,26 @@ class Admin(commands.Cog):
                     (pool_amt, genre, pool_amt)
                 )
                 
-                # Delete votes for this entrant
+                # Delete votes for this entrant; the in-memory ledger follows only once this commits
+                voting_cog = self.bot.get_cog('Voting')
+                if voting_cog:
+                    after_commit(db, lambda: voting_cog.ledger.discard_entrant(battle_id, ent_id))
                 await db.execute("DELETE FROM votes WHERE entrant_id = ?", (ent_id,))
                 
                 # Delete the entrant
                 await db.execute("DELETE FROM entrants WHERE entrant_id = ?", (ent_id,))
+                # A removed entry shouldn't keep the user locked out of the pool
+                await db.execute(
+                    "DELETE FROM entry_cooldowns WHERE user_id = ? AND genre = ? AND pool_amount = ?",
+                    (user.id, genre, pool_amt)
+                )
                 
-                await db.commit()
+                await commit(db)
+                if voting_cog:
+                    voting_cog.message_index.remove_entrant(ent_id)
+                payments_cog = self.bot.get_cog('Payments')
+                if payments_cog:
+                    payments_cog.mark_stats_dirty(genre)
                 logger.info(f"Admin removed {user.name} from {genre} ${pool_amt} (Battle #{battle_id}). Refunded {refund_amt} coins.")
             except Exception as e:
                 logger.error(f"Error during entrant removal database sync: {e}")
@@ -181,13 +196,9 @@ class Admin(commands.Cog):
         # 3. Discord Cleanup: Deleting messages
         # Delete announcement in pool channel
         try:
-            category = discord.utils.get(interaction.guild.categories, name=genre)
-            if category:
-                chan_name = f"{int(pool_amt)}-pool"
-                channel = discord.utils.get(category.text_channels, name=chan_name)
-                if channel and ann_msg_id:
-                    msg = await channel.fetch_message(ann_msg_id)
-                    await msg.delete()
+            channel = guild_registry.pool_channel(interaction.guild, genre, pool_amt)
+            if channel and ann_msg_id:
+                await channel.get_partial_message(ann_msg_id).delete()
         except:
             pass
 
@@ -208,6 +219,34 @@ class Admin(commands.Cog):
         )
         await interaction.followup.send(embed=embed)
 
+    @app_commands.command(name="audit_coins")
+    @app_commands.describe(full="Replay the whole journal instead of starting from the latest snapshots")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def audit_coins(self, interaction: discord.Interaction, full: bool = False):
+        """Admin: Check every balance against the coin transaction journal."""
+        # defer() is now handled globally in main.py
+        report = await check_integrity(full=full)
+        mismatches = report['balance_mismatches']
+        snapshot_mismatches = report['snapshot_mismatches']
+        ok = not mismatches and not snapshot_mismatches
+
+        embed = discord.Embed(
+            title="Coin Audit",
+            description=f"Checked **{report['journal_rows']}** journal entries in {report['seconds']:.2f}s "
+                        f"({'full replay' if full else 'from snapshots'}).",
+            color=COLOR_SUCCESS if ok else COLOR_ERROR
+        )
+        if ok:
+            embed.add_field(name="Result", value="All balances match the journal.", inline=False)
+        if mismatches:
+            lines = [f"<@{user_id}>: balance `{coins}`, journal `{expected}`" for user_id, coins, expected in mismatches[:15]]
+            if len(mismatches) > 15:
+                lines.append(f"...and {len(mismatches) - 15} more")
+            embed.add_field(name=f"Balance Mismatches ({len(mismatches)})", value="\n".join(lines), inline=False)
+        if snapshot_mismatches:
+            embed.add_field(name="Snapshot Mismatches", value=f"`{len(snapshot_mismatches)}` snapshots disagree with the journal.", inline=False)
+        await interaction.followup.send(embed=embed)
+
     @app_commands.command(name="sync")
     @app_commands.checks.has_permissions(administrator=True)
     async def sync_slash(self, interaction: discord.Interaction):
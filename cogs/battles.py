@@ -2,22 +2,43 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 from utils.database import get_db
-from utils.constants import GENRES, POOLS, COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, CREATOR_ROLE_NAME, VOTING_DURATION_HOURS
+from utils.entries import precheck_entry, record_entry, ENTRY_OK, ENTRY_COOLDOWN
+from utils.audio_cache import audio_cache
+from utils.media_relay import media_relay, MediaRejected
+from utils.provisioning import plan_setup, plan_teardown, apply_plan
+from utils.guild_registry import guild_registry
+from utils.chatter import ChatterSweeper
+from utils.constants import COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, CREATOR_ROLE_NAME, VOTING_DURATION_HOURS, TRACK_FETCH_CONCURRENCY, TRACK_FETCH_TIMEOUT_SECONDS, PROVISION_CONCURRENCY, CHATTER_DELETE_WINDOW_SECONDS, CHATTER_MAX_BACKOFF_SECONDS, STATS_LOG_MINUTES, VOTING_MODE
 import asyncio
 from datetime import datetime, timedelta
 import logging
 import aiohttp
-import io
+import time
 
 logger = logging.getLogger('music_battles.battles')
 
 class Battles(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.http_session = None
+        self.chatter = ChatterSweeper(CHATTER_DELETE_WINDOW_SECONDS, CHATTER_MAX_BACKOFF_SECONDS)
         self.daily_battle_start.start()
 
-    def cog_unload(self):
+    async def cog_load(self):
+        await guild_registry.load()
+        self.log_chatter_stats.start()
+        # One pooled session for all track downloads instead of a new one per track
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=TRACK_FETCH_CONCURRENCY),
+            timeout=aiohttp.ClientTimeout(total=TRACK_FETCH_TIMEOUT_SECONDS)
+        )
+
+    async def cog_unload(self):
         self.daily_battle_start.cancel()
+        self.log_chatter_stats.cancel()
+        await self.chatter.close()
+        if self.http_session:
+            await self.http_session.close()
 
     async def _call_with_retry(self, func, *args, **kwargs):
         """Helper to retry Discord API calls on transient 503 errors and connection issues."""
@@ -45,58 +66,43 @@ class Battles(commands.Cog):
                 raise e
 
     async def _get_or_create_role(self, guild, role_name):
-        role = discord.utils.get(guild.roles, name=role_name)
+        role = guild_registry.role(guild, role_name)
         if not role:
             role = await guild.create_role(name=role_name, color=discord.Color.blue())
         return role
 
+    def _welcome_embed(self, genre, pool):
+        return discord.Embed(
+            title=f"Welcome to {genre} ${pool} Pool",
+            description=f"Entry Fee: **{int(pool)} Coins**.\n\n1. Upload your music file.\n2. Type `/enter`.\n\nIf you need coins, use `/buy_coins <amount>`.",
+            color=COLOR_SUCCESS
+        )
+
     @app_commands.command(name="setup_server")
+    @app_commands.describe(dry_run="Only show what would be created, without changing the server")
     @app_commands.checks.has_permissions(administrator=True)
-    async def setup_server(self, interaction: discord.Interaction):
+    async def setup_server(self, interaction: discord.Interaction, dry_run: bool = False):
         """Initial server setup: creates categories and pool channels."""
         # defer() is now handled globally in main.py
-        embed = discord.Embed(title="Server Setup", description="Setting up server structure...", color=COLOR_INFO)
+        from utils.constants import VOTER_ROLE_NAME
+        plan = plan_setup(interaction.guild, [CREATOR_ROLE_NAME, VOTER_ROLE_NAME])
+        if dry_run:
+            embed = discord.Embed(title="Server Setup (dry run)", description=plan.summary(), color=COLOR_INFO)
+            await interaction.followup.send(embed=embed)
+            return
+
+        embed = discord.Embed(title="Server Setup", description=f"Setting up server structure ({plan.api_calls} API calls)...", color=COLOR_INFO)
         status_msg = await interaction.followup.send(embed=embed)
-        
-        info_category_name = "Battle Information"
-        info_category = discord.utils.get(interaction.guild.categories, name=info_category_name)
-        if not info_category:
-            info_category = await self._call_with_retry(interaction.guild.create_category, info_category_name)
-            await asyncio.sleep(0.5)
-
-        general_channels = ["live-stats", "results-winners", "announcements"]
-        for ch_name in general_channels:
-            ch = discord.utils.get(info_category.text_channels, name=ch_name)
-            if not ch: 
-                ch = await self._call_with_retry(interaction.guild.create_text_channel, ch_name, category=info_category)
-                await asyncio.sleep(0.5) 
-            await ch.set_permissions(interaction.guild.default_role, send_messages=False)
-            await ch.set_permissions(interaction.guild.me, send_messages=True)
 
-        from utils.constants import VOTER_ROLE_NAME
-        await self._get_or_create_role(interaction.guild, CREATOR_ROLE_NAME)
-        await self._get_or_create_role(interaction.guild, VOTER_ROLE_NAME)
-
-        for genre in GENRES:
-            category = discord.utils.get(interaction.guild.categories, name=genre)
-            if not category: 
-                category = await self._call_with_retry(interaction.guild.create_category, genre)
-                await asyncio.sleep(0.5) 
-            for pool in POOLS:
-                channel_name = f"{int(pool)}-pool"
-                channel = discord.utils.get(category.text_channels, name=channel_name)
-                if not channel:
-                    channel = await self._call_with_retry(interaction.guild.create_text_channel, channel_name, category=category)
-                    await asyncio.sleep(0.5) 
-                    welcome_embed = discord.Embed(
-                        title=f"Welcome to {genre} ${pool} Pool",
-                        description=f"Entry Fee: **{int(pool)} Coins**.\n\n1. Upload your music file.\n2. Type `/enter`.\n\nIf you need coins, use `/buy_coins <amount>`.",
-                        color=COLOR_SUCCESS
-                    )
-                    await self._call_with_retry(channel.send, embed=welcome_embed)
+        failures = await apply_plan(plan, interaction.guild, self._call_with_retry,
+                                    concurrency=PROVISION_CONCURRENCY, welcome_embed=self._welcome_embed)
 
-        embed.description = "Server setup complete!"
-        embed.color = COLOR_SUCCESS
+        if failures:
+            embed.description = f"Server setup finished with {failures} failed steps. Run `/setup_server` again to retry them."
+            embed.color = COLOR_ERROR
+        else:
+            embed.description = "Server setup complete!"
+            embed.color = COLOR_SUCCESS
         try:
             await status_msg.edit(embed=embed)
         except (discord.NotFound, discord.HTTPException):
@@ -105,88 +111,74 @@ class Battles(commands.Cog):
             except:
                 pass
 
+    async def _refuse_entry(self, interaction, result, data, genre, pool_amount):
+        required_coins = int(pool_amount)
+        if result == ENTRY_COOLDOWN:
+            embed = discord.Embed(
+                title="Entry Restricted", 
+                description=f"You have already entered the **{genre} ${pool_amount}** pool in the last 24 hours. Please wait before entering this pool again.", 
+                color=COLOR_ERROR
+            )
+        else:
+            embed = discord.Embed(
+                title="Insufficient Balance", 
+                description=f"This battle requires **{required_coins} coins**.\nYour Balance: **{data} coins**.\n\nUse `/buy_coins {required_coins}` to top up.", 
+                color=COLOR_ERROR
+            )
+        await interaction.followup.send(embed=embed)
+
     @app_commands.command(name="enter")
     async def enter_battle(self, interaction: discord.Interaction, track: discord.Attachment):
         """Enter a battle using Coins. Upload your track as an attachment."""
         # defer() is now handled globally in main.py
-        if not interaction.channel.category or interaction.channel.category.name not in GENRES:
+        pool = guild_registry.pool_of(interaction.channel_id)
+        if not pool:
             embed = discord.Embed(title="Error", description="Use this command in a genre pool channel.", color=COLOR_ERROR)
             return await interaction.followup.send(embed=embed)
-        
-        genre = interaction.channel.category.name
-        try:
-            pool_amount = float(interaction.channel.name.split('-')[0])
-            required_coins = int(pool_amount)
-        except:
-            embed = discord.Embed(title="Error", description="Invalid pool channel structure.", color=COLOR_ERROR)
-            return await interaction.followup.send(embed=embed)
+
+        genre, pool_amount = pool[0], float(pool[1])
+        required_coins = int(pool_amount)
 
         track_url = track.url
 
-        async with get_db() as db:
-            await db.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (interaction.user.id, interaction.user.name))
-            
-            # Check for 24h restriction: 1 entry per genre/pool per 24h
-            check_cursor = await db.execute(
-                """
-                SELECT e.entrant_id 
-                FROM entrants e 
-                JOIN battles b ON e.battle_id = b.battle_id 
-                WHERE e.user_id = ? 
-                AND b.genre = ? 
-                AND b.pool_amount = ? 
-                AND e.created_at > datetime('now', '-24 hours')
-                LIMIT 1
-                """,
-                (interaction.user.id, genre, pool_amount)
-            )
-            existing_entry = await check_cursor.fetchone()
-            
-            if existing_entry:
-                embed = discord.Embed(
-                    title="Entry Restricted", 
-                    description=f"You have already entered the **{genre} ${pool_amount}** pool in the last 24 hours. Please wait before entering this pool again.", 
-                    color=COLOR_ERROR
-                )
-                return await interaction.followup.send(embed=embed)
+        # Turn away cooldowns and short balances before spending a download on the upload
+        result, data = await precheck_entry(interaction.user.id, genre, pool_amount)
+        if result != ENTRY_OK:
+            return await self._refuse_entry(interaction, result, data, genre, pool_amount)
 
-            cursor = await db.execute("SELECT coins FROM users WHERE user_id = ?", (interaction.user.id,))
-            row = await cursor.fetchone()
-            user_coins = row[0] if row else 0
-
-            if user_coins < required_coins:
-                embed = discord.Embed(
-                    title="Insufficient Balance", 
-                    description=f"This battle requires **{required_coins} coins**.\nYour Balance: **{user_coins} coins**.\n\nUse `/buy_coins {required_coins}` to top up.", 
-                    color=COLOR_ERROR
-                )
-                return await interaction.followup.send(embed=embed)
+        # Stream the upload to the local cache before taking any coins: oversized or
+        # non-audio files are rejected from their first bytes
+        track_sha256 = None
+        track_path = None
+        try:
+            relayed = await media_relay.fetch(self.http_session, track_url, declared_size=track.size)
+        except MediaRejected as e:
+            embed = discord.Embed(title="Invalid Track", description=str(e), color=COLOR_ERROR)
+            return await interaction.followup.send(embed=embed)
+        except Exception as e:
+            logger.error(f"Failed to download entry track: {e}")
+        else:
+            try:
+                track_path = await audio_cache.put_file(relayed.file, relayed.sha256, relayed.size, track.filename)
+                track_sha256 = relayed.sha256
+            except Exception as e:
+                logger.error(f"Failed to cache entry track: {e}")
+            finally:
+                await relayed.close()
 
-            await db.execute("UPDATE users SET coins = coins - ? WHERE user_id = ?", (required_coins, interaction.user.id))
-            
-            cursor = await db.execute("SELECT battle_id FROM battles WHERE genre = ? AND pool_amount = ? AND status = 'pending'", (genre, pool_amount))
-            row = await cursor.fetchone()
-            battle_id = row[0] if row else None
-            
-            if not battle_id:
-                cursor = await db.execute("INSERT INTO battles (genre, pool_amount, status) VALUES (?, ?, 'pending')", (genre, pool_amount))
-                battle_id = cursor.lastrowid
-            
-            entrant_cursor = await db.execute(
-                "INSERT INTO entrants (battle_id, user_id, track_link, payment_status) VALUES (?, ?, ?, 'paid')",
-                (battle_id, interaction.user.id, track_url)
-            )
-            entrant_id = entrant_cursor.lastrowid
-            
-            await db.execute(
-                "INSERT INTO pool_totals (genre, pool_type, total_amount, entrant_count) VALUES (?, ?, ?, 1) "
-                "ON CONFLICT(genre, pool_type) DO UPDATE SET total_amount = total_amount + ?, entrant_count = entrant_count + 1",
-                (genre, pool_amount, pool_amount, pool_amount)
-            )
-            await db.commit()
+        result, data = await record_entry(
+            interaction.user.id, interaction.user.name, genre, pool_amount, track_url, track_sha256
+        )
+        if result != ENTRY_OK:
+            return await self._refuse_entry(interaction, result, data, genre, pool_amount)
+        battle_id, entrant_id = data
+
+        payments_cog = self.bot.get_cog('Payments')
+        if payments_cog:
+            payments_cog.mark_stats_dirty(genre)
 
         creator_role = await self._get_or_create_role(interaction.guild, CREATOR_ROLE_NAME)
-        if creator_role not in interaction.user.roles: await interaction.user.add_roles(creator_role)
+        if not interaction.user.get_role(creator_role.id): await interaction.user.add_roles(creator_role)
 
         embed = discord.Embed(
             title="Entry Successful",
@@ -203,29 +195,43 @@ class Battles(commands.Cog):
         )
         public_embed.set_thumbnail(url=interaction.user.display_avatar.url)
         
+        voting_cog = self.bot.get_cog('Voting')
+        view = voting_cog.vote_view(battle_id, entrant_id) if voting_cog and VOTING_MODE == 'buttons' else None
         announcement_msg = None
         try:
             # Send the track as an audio file instead of a link
-            file = await track.to_file()
-            announcement_msg = await interaction.channel.send(embed=public_embed, file=file)
+            if not track_path:
+                raise FileNotFoundError("Entry track could not be downloaded")
+            file = discord.File(track_path, filename=track.filename)
+            announcement_msg = await interaction.channel.send(embed=public_embed, file=file, view=view)
         except Exception as e:
             logger.error(f"Failed to send public entry announcement: {e}")
             # Fallback to link ONLY if file upload fails
             public_embed.add_field(name="Track", value=f"[Listen Here]({track_url})", inline=False)
-            announcement_msg = await interaction.channel.send(embed=public_embed)
+            announcement_msg = await interaction.channel.send(embed=public_embed, view=view)
 
         if announcement_msg:
             try:
-                await announcement_msg.add_reaction("✅")
+                if not view:
+                    await announcement_msg.add_reaction("✅")
                 async with get_db() as db:
                     await db.execute(
                         "UPDATE entrants SET announcement_message_id = ? WHERE entrant_id = ?",
                         (announcement_msg.id, entrant_id)
                     )
                     await db.commit()
+                if voting_cog:
+                    voting_cog.message_index.add(announcement_msg.id, entrant_id, battle_id, 'announcement', genre)
             except Exception as e:
                 logger.error(f"Error finalising entry announcement: {e}")
 
+    @tasks.loop(minutes=STATS_LOG_MINUTES)
+    async def log_chatter_stats(self):
+        stats = self.chatter.stats()
+        logger.info(f"Chatter sweeper: {stats['deleted']}/{stats['queued']} deleted in {stats['api_calls']} calls "
+                    f"({stats['coalesced']} coalesced), {stats['depth']} queued, "
+                    f"{stats['rate_limited']} rate limited, {stats['dropped']} dropped")
+
     @tasks.loop(hours=24)
     async def daily_battle_start(self):
         """Automatically start all pending battles that have enough entrants once a day."""
@@ -233,41 +239,70 @@ class Battles(commands.Cog):
         async with get_db() as db:
             cursor = await db.execute("SELECT battle_id FROM battles WHERE status = 'pending'")
             battles = await cursor.fetchall()
-            
-            for (battle_id,) in battles:
-                # Check for each guild the bot is in (usually 1 for this type of bot)
-                for guild in self.bot.guilds:
-                    try:
-                        await self.start_battle_internal(guild, battle_id)
-                        logger.info(f"Automated start for Battle #{battle_id} in {guild.name}")
-                    except Exception as e:
-                        # Silently skip if battle doesn't belong to this guild or not enough entrants
-                        pass
+
+        # Release the pooled connection first: start_battle_internal borrows its own
+        for (battle_id,) in battles:
+            # Check for each guild the bot is in (usually 1 for this type of bot)
+            for guild in self.bot.guilds:
+                try:
+                    await self.start_battle_internal(guild, battle_id)
+                    logger.info(f"Automated start for Battle #{battle_id} in {guild.name}")
+                except Exception as e:
+                    # Silently skip if battle doesn't belong to this guild or not enough entrants
+                    pass
     
     async def cleanup_pool_announcements(self, guild, genre, pool_amount, battle_id):
         """Cleanup 'New Entry' announcements in the pool channel for a specific battle."""
-        category = discord.utils.get(guild.categories, name=genre)
-        if not category: return
-        
-        channel_name = f"{int(pool_amount)}-pool"
-        channel = discord.utils.get(category.text_channels, name=channel_name)
+        channel = guild_registry.pool_channel(guild, genre, pool_amount)
         if not channel: return
         
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT announcement_message_id FROM entrants WHERE battle_id = ? AND announcement_message_id IS NOT NULL",
+                (battle_id,)
+            )
+            message_ids = [row[0] for row in await cursor.fetchall()]
+        if not message_ids:
+            return
+
+        # Bulk delete only accepts messages younger than 14 days; leave a little slack for clock skew
+        cutoff = discord.utils.utcnow() - timedelta(days=14) + timedelta(minutes=5)
+        recent = [discord.Object(id=m) for m in message_ids if discord.utils.snowflake_time(m) > cutoff]
+        old = [m for m in message_ids if discord.utils.snowflake_time(m) <= cutoff]
+
+        deleted = 0
         try:
-            # We look for bot messages that mention the battle ID or generic join messages
-            # In a real scenario, we'd check embed fields/titles for the battle ID if stored
-            # For now, we'll search the last 100 messages and delete bot messages that mention the user joined
-            async for message in channel.history(limit=100):
-                if message.author == self.bot.user and message.embeds:
-                    embed = message.embeds[0]
-                    if "has joined the" in (embed.description or "") and str(pool_amount) in (embed.description or ""):
-                        await message.delete()
-                        await asyncio.sleep(0.1)
+            for i in range(0, len(recent), 100):
+                chunk = recent[i:i + 100]
+                await self._call_with_retry(channel.delete_messages, chunk, reason=f"Battle #{battle_id} closed")
+                deleted += len(chunk)
+            for message_id in old:
+                await self._call_with_retry(channel.get_partial_message(message_id).delete)
+                deleted += 1
         except Exception as e:
-            logger.error(f"Error cleaning up pool announcements: {e}")
+            logger.error(f"Error cleaning up pool announcements for Battle #{battle_id}: {e}")
+        logger.info(f"Removed {deleted}/{len(message_ids)} announcements for Battle #{battle_id} ({len(old)} single deletes)")
+
+    async def _fetch_track(self, track_link, track_sha256, semaphore):
+        """Resolve one track to a cached file path, downloading it on a miss. None on failure."""
+        if track_sha256:
+            cached = await audio_cache.get(track_sha256)
+            if cached:
+                return cached[0]
+        async with semaphore:
+            try:
+                relayed = await media_relay.fetch(self.http_session, track_link)
+                try:
+                    return await audio_cache.put_file(relayed.file, relayed.sha256, relayed.size)
+                finally:
+                    await relayed.close()
+            except Exception as e:
+                logger.error(f"Failed to download track for voting: {e}")
+        return None
 
     async def start_battle_internal(self, guild, battle_id):
         """Logic to move a battle to voting phase. Shared by Admin command and Daily task."""
+        started = time.perf_counter()
         async with get_db() as db:
             cursor = await db.execute(
                 "SELECT genre, pool_amount, status FROM battles WHERE battle_id = ?",
@@ -280,16 +315,30 @@ class Battles(commands.Cog):
             if status != 'pending': return False, f"Battle is already `{status}`."
 
             cursor = await db.execute(
-                "SELECT e.entrant_id, u.username, e.track_link FROM entrants e JOIN users u ON e.user_id = u.user_id WHERE e.battle_id = ? AND e.payment_status = 'paid' AND e.disqualified = 0",
+                "SELECT e.entrant_id, u.username, e.track_link, e.track_sha256 FROM entrants e JOIN users u ON e.user_id = u.user_id WHERE e.battle_id = ? AND e.payment_status = 'paid' AND e.disqualified = 0",
                 (battle_id,)
             )
             entrants = await cursor.fetchall()
 
-            if len(entrants) < 2:
-                return False, "At least 2 paid entrants are required to start a battle."
+        if len(entrants) < 2:
+            return False, "At least 2 paid entrants are required to start a battle."
+
+        # Start downloading every track now; posting below consumes them in submission order
+        semaphore = asyncio.Semaphore(TRACK_FETCH_CONCURRENCY)
+        cache_hits_before = audio_cache.hits
+        downloads = [
+            asyncio.create_task(self._fetch_track(track_link, track_sha256, semaphore))
+            for _, _, track_link, track_sha256 in entrants
+        ]
+        fetch_elapsed = None
+        def _fetch_done(_):
+            nonlocal fetch_elapsed
+            fetch_elapsed = time.perf_counter() - started
+        asyncio.gather(*downloads).add_done_callback(_fetch_done)
 
+        try:
             category_name = f"{genre} Battles"
-            category = discord.utils.get(guild.categories, name=category_name)
+            category = guild_registry.category(guild, category_name)
             if not category:
                 category = await guild.create_category(category_name)
 
@@ -297,64 +346,100 @@ class Battles(commands.Cog):
                 f"battle-{battle_id}-voting",
                 category=category
             )
+        except Exception:
+            for download in downloads:
+                download.cancel()
+            raise
 
-            voting_ends_at = datetime.utcnow() + timedelta(hours=VOTING_DURATION_HOURS)
-            
-            await db.execute(
-                "UPDATE battles SET status = 'voting', voting_channel_id = ?, voting_ends_at = ? WHERE battle_id = ?",
+        voting_ends_at = datetime.utcnow() + timedelta(hours=VOTING_DURATION_HOURS)
+
+        async with get_db() as db:
+            cursor = await db.execute(
+                "UPDATE battles SET status = 'voting', voting_channel_id = ?, voting_ends_at = ? WHERE battle_id = ? AND status = 'pending'",
                 (voting_channel.id, voting_ends_at.isoformat(), battle_id)
             )
             await db.commit()
-
-            header_embed = discord.Embed(
-                title=f"Voting Started: {genre}", 
-                description=(
-                    f"**Battle ID:** {battle_id}\n"
-                    f"**Prize Pool:** ${pool_amount}\n"
-                    f"**Voting Ends:** {VOTING_DURATION_HOURS} hours from now.\n\n"
-                    "React with ✅ to vote for your favorite tracks!"
-                ),
-                color=COLOR_INFO
+        if cursor.rowcount == 0:
+            # Another caller started this battle while we were creating the channel
+            for download in downloads:
+                download.cancel()
+            await self._call_with_retry(voting_channel.delete)
+            return False, "Battle is already `voting`."
+        setup_elapsed = time.perf_counter() - started
+
+        if VOTING_MODE == 'buttons':
+            vote_hint = "Press **Vote** under your favorite track! You can move your vote any time."
+        else:
+            vote_hint = "React with ✅ to vote for your favorite tracks!"
+        header_embed = discord.Embed(
+            title=f"Voting Started: {genre}", 
+            description=(
+                f"**Battle ID:** {battle_id}\n"
+                f"**Prize Pool:** ${pool_amount}\n"
+                f"**Voting Ends:** {VOTING_DURATION_HOURS} hours from now.\n\n"
+                f"{vote_hint}"
+            ),
+            color=COLOR_INFO
+        )
+        await voting_channel.send(embed=header_embed)
+
+        voting_cog = self.bot.get_cog('Voting')
+        if voting_cog:
+            voting_cog.scheduler.schedule(battle_id, voting_ends_at)
+
+        submissions = []
+        for i, ((entrant_id, username, track_link, _), download) in enumerate(zip(entrants, downloads), 1):
+            submission_embed = discord.Embed(
+                title=f"Submission #{i}",
+                description=f"**Artist:** {username}",
+                color=COLOR_SUCCESS
             )
-            await voting_channel.send(embed=header_embed)
-
-            for i, (entrant_id, username, track_link) in enumerate(entrants, 1):
-                submission_embed = discord.Embed(
-                    title=f"Submission #{i}",
-                    description=f"**Artist:** {username}",
-                    color=COLOR_SUCCESS
-                )
-                
-                # Fetch the track and send as an audio file for the player
-                file = None
+            
+            # Send the track as an audio file for the player, falling back to a link
+            file = None
+            track_path = await download
+            if track_path:
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(track_link) as resp:
-                            if resp.status == 200:
-                                data = await resp.read()
-                                file = discord.File(io.BytesIO(data), filename=f"submission_{i}.mp3")
-                except Exception as e:
-                    logger.error(f"Failed to download track for voting: {e}")
-                    submission_embed.description += f"\n**Track:** [Listen Here]({track_link})"
+                    file = discord.File(track_path, filename=f"submission_{i}.mp3")
+                except OSError as e:
+                    logger.error(f"Cached track for submission #{i} is gone: {e}")
+            if not file:
+                submission_embed.description += f"\n**Track:** [Listen Here]({track_link})"
 
-                try:
-                    msg = await voting_channel.send(embed=submission_embed, file=file)
-                except Exception as e:
-                    logger.error(f"Failed to send submission message: {e}")
-                    continue
+            view = voting_cog.vote_view(battle_id, entrant_id) if voting_cog and VOTING_MODE == 'buttons' else None
+            try:
+                msg = await voting_channel.send(embed=submission_embed, file=file, view=view)
+            except Exception as e:
+                logger.error(f"Failed to send submission message: {e}")
+                continue
 
+            if not view:
                 try:
                     await msg.add_reaction("✅")
                 except Exception as e:
                     logger.error(f"Failed to add reaction to submission #{i}: {e}")
-                
-                await db.execute(
-                    "UPDATE entrants SET submission_message_id = ? WHERE entrant_id = ?",
-                    (msg.id, entrant_id)
-                )
             
+            submissions.append((msg.id, entrant_id))
+            if voting_cog:
+                voting_cog.message_index.add(msg.id, entrant_id, battle_id, 'submission', genre)
+
+        async with get_db() as db:
+            await db.executemany(
+                "UPDATE entrants SET submission_message_id = ? WHERE entrant_id = ?",
+                submissions
+            )
             await db.commit()
-            return True, voting_channel
+
+        total_elapsed = time.perf_counter() - started
+        fetched = sum(1 for download in downloads if download.result() is not None)
+        cache_stats = audio_cache.stats()
+        logger.info(
+            f"Battle #{battle_id} opened with {len(submissions)}/{len(entrants)} submissions ({fetched} files, "
+            f"{audio_cache.hits - cache_hits_before} from cache; cache hit rate {cache_stats['hit_rate']:.0%}, "
+            f"{cache_stats['bytes_saved'] / 1024 ** 2:.1f} MB saved; peak buffered {media_relay.budget.peak / 1024 ** 2:.1f} MB): "
+            f"setup {setup_elapsed:.2f}s, downloads done at {fetch_elapsed or total_elapsed:.2f}s, total {total_elapsed:.2f}s"
+        )
+        return True, voting_channel
 
     @app_commands.command(name="battles")
     async def list_battles(self, interaction: discord.Interaction):
@@ -373,10 +458,17 @@ class Battles(commands.Cog):
             await interaction.followup.send(embed=embed)
 
     @app_commands.command(name="delete_setup")
+    @app_commands.describe(dry_run="Only show what would be deleted, without changing the server")
     @app_commands.checks.has_permissions(administrator=True)
-    async def delete_setup(self, interaction: discord.Interaction):
+    async def delete_setup(self, interaction: discord.Interaction, dry_run: bool = False):
         """Deletes all categories and channels created during setup."""
         # defer() is now handled globally in main.py
+        plan = plan_teardown(interaction.guild)
+        if dry_run:
+            embed = discord.Embed(title="Delete Setup (dry run)", description=plan.summary(), color=COLOR_INFO)
+            await interaction.followup.send(embed=embed)
+            return
+
         embed = discord.Embed(
             title="Delete Setup", 
             description="Deleting all battle categories and channels...", 
@@ -384,40 +476,27 @@ class Battles(commands.Cog):
         )
         status_msg = await interaction.followup.send(embed=embed)
 
-        info_category = discord.utils.get(interaction.guild.categories, name="Battle Information")
-        if info_category:
-            for channel in info_category.channels:
-                await self._call_with_retry(channel.delete)
-                await asyncio.sleep(0.1)
-            await self._call_with_retry(info_category.delete)
-            await asyncio.sleep(0.1)
-
-        for genre in GENRES:
-            category = discord.utils.get(interaction.guild.categories, name=genre)
-            if category:
-                for channel in category.channels:
-                    await self._call_with_retry(channel.delete)
-                    await asyncio.sleep(0.1)
-                await self._call_with_retry(category.delete)
-                await asyncio.sleep(0.1)
-            
-            battle_category = discord.utils.get(interaction.guild.categories, name=f"{genre} Battles")
-            if battle_category:
-                for channel in battle_category.channels:
-                    await self._call_with_retry(channel.delete)
-                    await asyncio.sleep(0.1)
-                await self._call_with_retry(battle_category.delete)
-                await asyncio.sleep(0.1)
+        await apply_plan(plan, interaction.guild, self._call_with_retry, concurrency=PROVISION_CONCURRENCY)
 
         # Sync Database: Clear all battle-related data
+        voting_cog = self.bot.get_cog('Voting')
+        if voting_cog:
+            voting_cog.ledger.reset()
         async with get_db() as db:
             await db.execute("DELETE FROM votes")
             await db.execute("DELETE FROM entrants")
+            await db.execute("DELETE FROM entry_cooldowns")
             await db.execute("DELETE FROM battles")
             await db.execute("DELETE FROM pool_totals")
             await db.commit()
             logger.info("Cleared all battle data from database during /delete_setup")
 
+        if voting_cog:
+            voting_cog.message_index.clear()
+        payments_cog = self.bot.get_cog('Payments')
+        if payments_cog:
+            payments_cog.mark_stats_dirty()
+
         embed.description = "All battle-related channels, categories, and database records have been deleted."
         embed.color = COLOR_SUCCESS
         try:
@@ -431,21 +510,46 @@ class Battles(commands.Cog):
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         """Auto-cleanup non-bot messages in pool channels."""
-        if message.author.bot:
+        if message.channel.id not in guild_registry.pool_channel_ids or message.author.bot:
             return
+        # Deleted in batches so a spam burst doesn't flood the API
+        self.chatter.enqueue(message)
 
-        if not message.guild:
-            return
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        await guild_registry.rebuild(guild)
 
-        # Check if channel is a pool channel
-        if message.channel.category and message.channel.category.name in GENRES:
-            if "-" in message.channel.name and message.channel.name.endswith("-pool"):
-                try:
-                    await message.delete()
-                except discord.Forbidden:
-                    logger.warning(f"Permission denied deleting message in {message.channel.name}")
-                except Exception as e:
-                    logger.error(f"Error in on_message cleanup: {e}")
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        await guild_registry.rebuild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        await guild_registry.forget(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        await guild_registry.resource_changed(None, channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        await guild_registry.resource_changed(channel, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        await guild_registry.resource_changed(before, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        await guild_registry.resource_changed(None, role)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        await guild_registry.resource_changed(role, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        await guild_registry.resource_changed(before, after)
 
 async def setup(bot):
     await bot.add_cog(Battles(bot))
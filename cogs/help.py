@@ -51,7 +51,8 @@ class HelpCommand(commands.Cog):
                     "`/close_pool <genre> <amt>` - Close entries for a pool.\n"
                     "`/disqualify @user <id>` - Remove an entrant (no refund).\n"
                     "`/add_coins @user <amt>` - Manually credit coins.\n"
-                    "`/payouts` - View pending winner payouts.\n"
+                    "`/payouts [unpaid_only]` - View winner payouts.\n"
+                    "`/mark_paid <battle_id>` - Record a payout as sent.\n"
                     "`/sync` - Sync slash commands manually."
                 ),
                 inline=False
@@ -1,18 +1,27 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-from utils.database import get_db
-from utils.constants import COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, STRIPE_API_KEY, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_API_BASE, GENRES, POOLS, WINNER_PAYOUT_PERCENT
+from utils.database import get_db, commit, get_pool_stats
+from utils.user_cache import user_cache, ensure_user, get_balance
+from utils.coins import apply_coins, take_snapshots, REASON_PURCHASE, REASON_ADMIN_GRANT
+from utils.paypal import PayPalClient
+from utils.webhooks import WebhookServer
+from utils.reconciler import PurchaseReconciler
+from utils.guild_registry import guild_registry
+from utils.constants import COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, STRIPE_API_KEY, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_API_BASE, PAYPAL_WEBHOOK_ID, STRIPE_WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, RECONCILE_INTERVAL_SECONDS, RECONCILE_BATCH_SIZE, RECONCILE_CONCURRENCY, RECONCILE_RATE_PER_SECOND, PURCHASE_EXPIRE_HOURS, COIN_SNAPSHOT_MINUTES, STATS_LOG_MINUTES, GENRES, POOLS, WINNER_PAYOUT_PERCENT, LIVE_STATS_DEBOUNCE_SECONDS, LIVE_STATS_PER_GENRE
 import stripe
 import asyncio
 import logging
-import aiohttp
-import base64
+import heapq
+import hashlib
+import json
+from collections import defaultdict
 
 logger = logging.getLogger('music_battles.payments')
 stripe.api_key = STRIPE_API_KEY
 
 COIN_PRICE = 1.00
+PAYOUTS_PAGE_SIZE = 10
 
 class VerifyCoinPaymentView(discord.ui.View):
     def __init__(self, session_id, user_id, coins_to_add, method, cog):
@@ -40,17 +49,14 @@ class VerifyCoinPaymentView(discord.ui.View):
                 status = await self.cog._verify_paypal_order(self.session_id)
                 if status == 'APPROVED':
                     capture_status = await self.cog._capture_paypal_order(self.session_id)
-                    is_paid = (capture_status == 'COMPLETED')
+                    # A webhook can capture first, in which case ours fails but the order is COMPLETED
+                    is_paid = (capture_status == 'COMPLETED' or await self.cog._verify_paypal_order(self.session_id) == 'COMPLETED')
                 else:
                     is_paid = (status == 'COMPLETED')
 
             if is_paid:
-                async with get_db() as db:
-                    await db.execute(
-                        "UPDATE users SET coins = coins + ? WHERE user_id = ?",
-                        (self.coins_to_add, self.user_id)
-                    )
-                    await db.commit()
+                # The webhook may already have credited this checkout; crediting is idempotent
+                await self.cog.credit_purchase(self.method, self.session_id, self.user_id, self.coins_to_add, notify=False)
 
                 button.disabled = True
                 button.label = "Verified"
@@ -74,6 +80,28 @@ class VerifyCoinPaymentView(discord.ui.View):
             else:
                 await interaction.followup.send(embed=embed, ephemeral=True)
 
+class PayoutsView(discord.ui.View):
+    """Pages through battle_results by battle_id, so each page is one index range scan."""
+
+    def __init__(self, cog, user_id, cursor, unpaid_only):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.user_id = user_id
+        self.cursor = cursor
+        self.unpaid_only = unpaid_only
+
+    @discord.ui.button(label="Older", style=discord.ButtonStyle.gray)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.user_id:
+            embed = discord.Embed(title="Access Denied", description="This button is not for you.", color=COLOR_ERROR)
+            return await interaction.response.send_message(embed=embed, ephemeral=True)
+        rows = await self.cog.fetch_payouts(before=self.cursor, unpaid_only=self.unpaid_only)
+        if rows:
+            self.cursor = rows[-1][0]
+        if len(rows) < PAYOUTS_PAGE_SIZE:
+            button.disabled = True
+        await interaction.response.edit_message(embed=self.cog._payouts_embed(rows, self.unpaid_only), view=self)
+
 class BuyCoinsView(discord.ui.View):
     def __init__(self, user_id, amount_usd, cog):
         super().__init__(timeout=300)
@@ -100,6 +128,8 @@ class BuyCoinsView(discord.ui.View):
                     'quantity': 1,
                 }],
                 mode='payment',
+                client_reference_id=str(self.user_id),
+                metadata={'user_id': str(self.user_id), 'coins': str(int(self.amount_usd))},
                 success_url='https://discord.com',
                 cancel_url='https://discord.com',
             )
@@ -109,6 +139,7 @@ class BuyCoinsView(discord.ui.View):
                 color=COLOR_INFO
             )
             embed.add_field(name="Link", value=f"[Open Payment Page]({session.url})", inline=False)
+            await self.cog.reconciler.record('stripe', session.id, self.user_id, int(self.amount_usd))
             view = VerifyCoinPaymentView(session.id, self.user_id, int(self.amount_usd), 'stripe', self.cog)
             await interaction.followup.send(embed=embed, view=view, ephemeral=True)
         except Exception as e:
@@ -123,7 +154,8 @@ class BuyCoinsView(discord.ui.View):
 
         await interaction.response.defer(ephemeral=True)
         try:
-            order = await self.cog._create_paypal_order(self.amount_usd, f"{int(self.amount_usd)} Battle Coins")
+            order = await self.cog._create_paypal_order(self.amount_usd, f"{int(self.amount_usd)} Battle Coins",
+                                                        custom_id=f"{self.user_id}:{int(self.amount_usd)}")
             approve_url = next(link['href'] for link in order['links'] if link['rel'] == 'approve')
             embed = discord.Embed(
                 title="PayPal Checkout", 
@@ -131,6 +163,7 @@ class BuyCoinsView(discord.ui.View):
                 color=COLOR_INFO
             )
             embed.add_field(name="Link", value=f"[Open Payment Page]({approve_url})", inline=False)
+            await self.cog.reconciler.record('paypal', order['id'], self.user_id, int(self.amount_usd))
             view = VerifyCoinPaymentView(order['id'], self.user_id, int(self.amount_usd), 'paypal', self.cog)
             await interaction.followup.send(embed=embed, view=view, ephemeral=True)
         except Exception as e:
@@ -140,134 +173,301 @@ class BuyCoinsView(discord.ui.View):
 class Payments(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self._stats_messages = {}  # (guild_id, section) -> (channel_id, message_id, content_hash)
+        self._stats_dirty = set()  # genres with changes; None marks the whole board
+        self._stats_event = asyncio.Event()
+        self._stats_task = None
+        self.stats_edits = 0
+        self.stats_skipped = 0
+        self.paypal = PayPalClient(PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_API_BASE)
+        self.webhooks = None
+        self.reconciler = PurchaseReconciler(
+            self._check_purchase, self.credit_purchase,
+            batch_size=RECONCILE_BATCH_SIZE, concurrency=RECONCILE_CONCURRENCY, rate=RECONCILE_RATE_PER_SECOND,
+            expire_after=PURCHASE_EXPIRE_HOURS * 3600
+        )
+        self._webhook_task = None
+
+    async def cog_load(self):
+        async with get_db() as db:
+            cursor = await db.execute("SELECT guild_id, section, channel_id, message_id, content_hash FROM stats_messages")
+            for guild_id, section, channel_id, message_id, content_hash in await cursor.fetchall():
+                self._stats_messages[(guild_id, section)] = (channel_id, message_id, content_hash)
+        self._stats_task = asyncio.create_task(self._stats_publisher())
         self.update_live_stats.start()
+        self.reconcile_purchases.start()
+        self.snapshot_coins.start()
+        self.log_stats.start()
+        if STRIPE_WEBHOOK_SECRET or PAYPAL_WEBHOOK_ID:
+            self.webhooks = WebhookServer(
+                WEBHOOK_HOST, WEBHOOK_PORT, self.credit_purchase,
+                stripe_secret=STRIPE_WEBHOOK_SECRET, paypal=self.paypal, paypal_webhook_id=PAYPAL_WEBHOOK_ID
+            )
+            self._webhook_task = asyncio.create_task(self.webhooks.serve())
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.update_live_stats.cancel()
+        self.reconcile_purchases.cancel()
+        self.snapshot_coins.cancel()
+        self.log_stats.cancel()
+        if self._stats_task:
+            self._stats_task.cancel()
+        if self.webhooks:
+            self.webhooks.stop()
+            await asyncio.gather(self._webhook_task, return_exceptions=True)
+        await self.paypal.close()
 
-    async def _get_paypal_token(self):
-        auth = base64.b64encode(f"{PAYPAL_CLIENT_ID}:{PAYPAL_CLIENT_SECRET}".encode()).decode()
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{PAYPAL_API_BASE}/v1/oauth2/token",
-                headers={"Authorization": f"Basic {auth}"},
-                data={"grant_type": "client_credentials"}
-            ) as resp:
-                data = await resp.json()
-                if resp.status != 200:
-                    logger.error(f"PayPal Token Error: {resp.status} - {data}")
-                    return None
-                return data.get('access_token')
-
-    async def _create_paypal_order(self, amount, desc):
-        token = await self._get_paypal_token()
-        if not token:
-            raise Exception("Failed to get PayPal access token.")
-            
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{PAYPAL_API_BASE}/v2/checkout/orders",
-                headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
-                json={"intent": "CAPTURE", "purchase_units": [{"amount": {"currency_code": "USD", "value": str(amount)}, "description": desc}]}
-            ) as resp:
-                data = await resp.json()
-                if resp.status not in [200, 201]:
-                    logger.error(f"PayPal Order Error: {resp.status} - {data}")
-                    raise Exception(f"PayPal API error: {data.get('message', 'Unknown error')}")
-                return data
+    async def credit_purchase(self, provider, payment_id, user_id, coins, notify=True):
+        """Credit a completed checkout exactly once. Returns False if it was already credited."""
+        async with get_db() as db:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO processed_payments (payment_id, provider, user_id, coins) VALUES (?, ?, ?, ?)",
+                (payment_id, provider, user_id, coins)
+            )
+            await db.execute("UPDATE pending_purchases SET status = 'credited' WHERE payment_id = ?", (payment_id,))
+            if cursor.rowcount == 0:
+                await db.commit()
+                return False
+            await ensure_user(db, user_id, None)
+            await apply_coins(db, user_id, coins, REASON_PURCHASE, f"{provider}:{payment_id}")
+            await commit(db)
+        logger.info(f"Credited {coins} coins to {user_id} for {provider} payment {payment_id}")
+        if notify:
+            await self._notify_purchase(user_id, coins)
+        return True
+
+    async def _check_purchase(self, provider, payment_id):
+        """Ask the provider where a checkout stands: 'paid', 'pending' or 'void'."""
+        if provider == 'stripe':
+            session = await asyncio.to_thread(stripe.checkout.Session.retrieve, payment_id)
+            if session.payment_status == 'paid':
+                return 'paid'
+            return 'void' if session.status == 'expired' else 'pending'
+        status = await self.paypal.get_order_status(payment_id)
+        if status == 'APPROVED':
+            status = await self.paypal.capture_order(payment_id)
+            if status != 'COMPLETED':
+                status = await self.paypal.get_order_status(payment_id)
+        if status == 'COMPLETED':
+            return 'paid'
+        return 'void' if status == 'VOIDED' else 'pending'
+
+    @tasks.loop(minutes=COIN_SNAPSHOT_MINUTES)
+    async def snapshot_coins(self):
+        try:
+            updated = await take_snapshots()
+            if updated:
+                logger.info(f"Updated coin snapshots for {updated} users")
+        except Exception as e:
+            logger.error(f"Coin snapshot failed: {e}")
+
+    @tasks.loop(minutes=STATS_LOG_MINUTES)
+    async def log_stats(self):
+        # Each source is logged on its own so one failure doesn't hide the others
+        try:
+            stats = user_cache.stats()
+            logger.info(f"User cache: {stats['entries']} entries, hit rate {stats['hit_rate']:.1%}, "
+                        f"{stats['evictions']} evictions, ~{stats['memory_bytes'] / 1024:.0f} KiB")
+        except Exception as e:
+            logger.error(f"Logging user cache stats failed: {e}")
+        try:
+            stats = self.paypal.stats()
+            latency = ", ".join(
+                f"{endpoint} {s['calls']} calls avg {s['avg_ms']:.0f}ms max {s['max_ms']:.0f}ms"
+                for endpoint, s in sorted(stats['latency'].items())
+            )
+            logger.info(f"PayPal: token hit rate {stats['token_hit_rate']:.1%} "
+                        f"({stats['token_misses']} fetches){'; ' + latency if latency else ''}")
+        except Exception as e:
+            logger.error(f"Logging PayPal stats failed: {e}")
+        try:
+            stats = get_pool_stats()
+            logger.info(f"DB pool: {stats['in_use']}/{stats['open']} in use, {stats['acquisitions']} acquisitions, "
+                        f"{stats['waits']} waits (avg {stats['avg_wait_seconds'] * 1000:.1f}ms, max {stats['max_wait_seconds'] * 1000:.1f}ms)")
+        except Exception as e:
+            logger.error(f"Logging DB pool stats failed: {e}")
+
+    @tasks.loop(seconds=RECONCILE_INTERVAL_SECONDS)
+    async def reconcile_purchases(self):
+        try:
+            checked = await self.reconciler.run_once()
+            if checked:
+                stats = await self.reconciler.stats()
+                logger.info(f"Reconciled {checked} pending purchases; queue depth {stats['depth']}, "
+                            f"oldest {stats['oldest_age_seconds']:.0f}s, credited {stats['credited']}, expired {stats['expired']}")
+        except Exception as e:
+            logger.error(f"Purchase reconciliation failed: {e}")
+
+    async def _notify_purchase(self, user_id, coins):
+        try:
+            user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+            embed = discord.Embed(
+                title="Payment Confirmed",
+                description=f"Successfully added **{coins}** coins to your account.",
+                color=COLOR_SUCCESS
+            )
+            await user.send(embed=embed)
+        except (discord.Forbidden, discord.NotFound, discord.HTTPException) as e:
+            logger.warning(f"Could not DM purchase confirmation to {user_id}: {e}")
+
+    def mark_stats_dirty(self, genre=None):
+        """Flag live stats for re-publishing. Pass a genre to limit the edit to that genre."""
+        self._stats_dirty.add(genre)
+        self._stats_event.set()
+
+    async def _stats_publisher(self):
+        await self.bot.wait_until_ready()
+        self.mark_stats_dirty()
+        while True:
+            await self._stats_event.wait()
+            # Debounce: let a burst of entries/votes settle into a single edit
+            await asyncio.sleep(LIVE_STATS_DEBOUNCE_SECONDS)
+            self._stats_event.clear()
+            dirty, self._stats_dirty = self._stats_dirty, set()
+            try:
+                await self.publish_live_stats(dirty)
+            except Exception as e:
+                logger.error(f"Failed to publish live stats: {e}")
+
+    async def publish_live_stats(self, dirty):
+        if LIVE_STATS_PER_GENRE:
+            sections = GENRES if None in dirty else [g for g in GENRES if g in dirty]
+        else:
+            sections = ['']
+        if not sections:
+            return
+
+        totals, standings = await self._load_standings()
+        embeds = {section: await self.get_stats_embed(section or None, (totals, standings)) for section in sections}
+        hashes = {
+            section: hashlib.sha256(json.dumps(embed.to_dict(), sort_keys=True).encode()).hexdigest()
+            for section, embed in embeds.items()
+        }
+
+        for guild in self.bot.guilds:
+            channel = guild_registry.channel(guild, "live-stats")
+            if not channel:
+                continue
+            for section in sections:
+                await self._publish_stats_message(guild, channel, section, embeds[section], hashes[section])
+
+    async def _publish_stats_message(self, guild, channel, section, embed, content_hash):
+        channel_id, message_id, old_hash = self._stats_messages.get((guild.id, section), (None, None, None))
+        if channel_id == channel.id and old_hash == content_hash:
+            self.stats_skipped += 1
+            return
+
+        if channel_id is None and section == '':
+            # First publish since upgrading: adopt the board the old minutely loop left behind
+            async for old_message in channel.history(limit=5):
+                if old_message.author == self.bot.user:
+                    channel_id, message_id = channel.id, old_message.id
+                    break
+
+        message = None
+        if channel_id == channel.id and message_id:
+            try:
+                message = await channel.get_partial_message(message_id).edit(embed=embed)
+            except discord.NotFound:
+                message = None
+        if message is None:
+            message = await channel.send(embed=embed)
+        self.stats_edits += 1
+
+        self._stats_messages[(guild.id, section)] = (channel.id, message.id, content_hash)
+        async with get_db() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO stats_messages (guild_id, section, channel_id, message_id, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (guild.id, section, channel.id, message.id, content_hash)
+            )
+            await db.commit()
+
+    async def _create_paypal_order(self, amount, desc, custom_id=None):
+        return await self.paypal.create_order(amount, desc, custom_id=custom_id)
 
     async def _verify_paypal_order(self, order_id):
-        token = await self._get_paypal_token()
-        if not token: return None
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{PAYPAL_API_BASE}/v2/checkout/orders/{order_id}", headers={"Authorization": f"Bearer {token}"}) as resp:
-                data = await resp.json()
-                return data.get('status')
+        return await self.paypal.get_order_status(order_id)
 
     async def _capture_paypal_order(self, order_id):
-        token = await self._get_paypal_token()
-        if not token: return None
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{PAYPAL_API_BASE}/v2/checkout/orders/{order_id}/capture", headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}) as resp:
-                data = await resp.json()
-                return data.get('status')
-
-    @tasks.loop(minutes=1)
+        return await self.paypal.capture_order(order_id)
+
+    @tasks.loop(minutes=10)
     async def update_live_stats(self):
-        for guild in self.bot.guilds:
-            channel = discord.utils.get(guild.text_channels, name="live-stats")
-            if channel:
-                stats_embed = await self.get_stats_embed()
-                async for message in channel.history(limit=5):
-                    if message.author == self.bot.user:
-                        await message.edit(embed=stats_embed)
-                        break
-                else:
-                    await channel.send(embed=stats_embed)
+        """Safety net: re-check the whole board periodically. Unchanged boards aren't edited."""
+        self.mark_stats_dirty()
 
-    async def get_stats_embed(self, genre_filter=None):
+    async def _load_standings(self, genre_filter=None):
+        """Pool totals plus the live entrants of the latest open battle in every pool, in two queries."""
         async with get_db() as db:
             cursor = await db.execute("SELECT genre, pool_type, total_amount, entrant_count FROM pool_totals")
+            totals = {(r[0], r[1]): (r[2], r[3]) for r in await cursor.fetchall()}
+
+            cursor = await db.execute(
+                """
+                SELECT b.genre, b.pool_amount, b.battle_id, e.entrant_id, u.username
+                FROM (
+                    SELECT battle_id, genre, pool_amount,
+                           ROW_NUMBER() OVER (PARTITION BY genre, pool_amount ORDER BY created_at DESC, battle_id DESC) AS rn
+                    FROM battles
+                    WHERE status IN ('pending', 'active', 'voting') AND (? IS NULL OR genre = ?)
+                ) b
+                JOIN entrants e ON e.battle_id = b.battle_id
+                JOIN users u ON e.user_id = u.user_id
+                WHERE b.rn = 1 AND e.payment_status = 'paid' AND e.disqualified = 0
+                """,
+                (genre_filter, genre_filter)
+            )
             rows = await cursor.fetchall()
-            
-            # Map existing stats for quick lookup
-            stats_map = {(r[0], r[1]): (r[2], r[3]) for r in rows}
-            
-            title = f"Live Prize Pools: {genre_filter}" if genre_filter else "Live Prize Pools"
-            embed = discord.Embed(title=title, color=COLOR_INFO)
-            embed.set_footer(text="Join a pool by entering its channel and typing /enter")
-            
-            genres_to_show = [genre_filter] if genre_filter else GENRES
-            for i, g in enumerate(genres_to_show):
-                category_stats = []
-                for p in POOLS:
-                    total, count = stats_map.get((g, p), (0.0, 0))
-                    winner_prize = total * WINNER_PAYOUT_PERCENT
-                    
-                    status = f"**${p} Pool**: `${total:.2f}` (Winner: `${winner_prize:.2f}`)"
-                    if count == 0:
-                        status += "\n*No entrants*"
-                    else:
-                        # Query for the top 3 leaders in this genre/pool
-                        leader_cursor = await db.execute(
-                            """
-                            SELECT u.username, COUNT(v.vote_id) as vote_count 
-                            FROM entrants e 
-                            JOIN users u ON e.user_id = u.user_id 
-                            LEFT JOIN votes v ON e.entrant_id = v.entrant_id 
-                            WHERE e.battle_id = (
-                                SELECT battle_id FROM battles 
-                                WHERE genre = ? AND pool_amount = ? AND status IN ('pending', 'active', 'voting') 
-                                ORDER BY created_at DESC LIMIT 1
-                            ) 
-                            AND e.payment_status = 'paid'
-                            AND e.disqualified = 0
-                            GROUP BY e.entrant_id 
-                            ORDER BY vote_count DESC, e.entrant_id ASC
-                            LIMIT 3
-                            """,
-                            (g, float(p))
-                        )
-                        leaders = await leader_cursor.fetchall()
-                        if leaders:
-                            leaderboard = []
-                            for idx, (name, votes) in enumerate(leaders, 1):
-                                emoji = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉"
-                                leaderboard.append(f"{emoji} {name} (`{votes}v`)")
-                            status += "\n" + "\n".join(leaderboard)
-                    
-                    category_stats.append(status + "\n")
-                
-                embed.add_field(
-                    name=f"--- {g} ---",
-                    value="\n".join(category_stats),
-                    inline=True
-                )
-                
-                # Add a blank field after every 2 genres to force a new row on desktop (3-column layout)
-                if not genre_filter and (i + 1) % 2 == 0:
-                    embed.add_field(name="\u200b", value="\u200b", inline=True)
-            return embed
+
+        standings = defaultdict(list)
+        for genre, pool, battle_id, entrant_id, username in rows:
+            standings[(genre, pool)].append((battle_id, entrant_id, username))
+        return totals, standings
+
+    async def get_stats_embed(self, genre_filter=None, standings=None):
+        totals, standings = standings or await self._load_standings(genre_filter)
+        voting_cog = self.bot.get_cog('Voting')
+
+        title = f"Live Prize Pools: {genre_filter}" if genre_filter else "Live Prize Pools"
+        embed = discord.Embed(title=title, color=COLOR_INFO)
+        embed.set_footer(text="Join a pool by entering its channel and typing /enter")
+
+        genres_to_show = [genre_filter] if genre_filter else GENRES
+        for i, g in enumerate(genres_to_show):
+            category_stats = []
+            for p in POOLS:
+                total, count = totals.get((g, p), (0.0, 0))
+                winner_prize = total * WINNER_PAYOUT_PERCENT
+
+                status = f"**${p} Pool**: `${total:.2f}` (Winner: `${winner_prize:.2f}`)"
+                if count == 0:
+                    status += "\n*No entrants*"
+                else:
+                    # Top 3 leaders in this genre/pool, vote counts straight from the live ledger
+                    ranked = [
+                        (voting_cog.ledger.votes_for(battle_id, entrant_id) if voting_cog else 0, entrant_id, username)
+                        for battle_id, entrant_id, username in standings.get((g, float(p)), ())
+                    ]
+                    leaders = heapq.nsmallest(3, ranked, key=lambda r: (-r[0], r[1]))
+                    if leaders:
+                        leaderboard = []
+                        for idx, (votes, _, name) in enumerate(leaders, 1):
+                            emoji = "🥇" if idx == 1 else "🥈" if idx == 2 else "🥉"
+                            leaderboard.append(f"{emoji} {name} (`{votes}v`)")
+                        status += "\n" + "\n".join(leaderboard)
+
+                category_stats.append(status + "\n")
+
+            embed.add_field(
+                name=f"--- {g} ---",
+                value="\n".join(category_stats),
+                inline=True
+            )
+
+            # Add a blank field after every 2 genres to force a new row on desktop (3-column layout)
+            if not genre_filter and (i + 1) % 2 == 0:
+                embed.add_field(name="\u200b", value="\u200b", inline=True)
+        return embed
 
     @app_commands.command(name="pools")
     @app_commands.choices(genre=[
@@ -294,9 +494,10 @@ class Payments(commands.Cog):
             embed = discord.Embed(title="Invalid Amount", description="Please specify a positive number of coins.", color=COLOR_ERROR)
             return await interaction.followup.send(embed=embed)
         
-        async with get_db() as db:
-            await db.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (interaction.user.id, interaction.user.name))
-            await db.commit()
+        if interaction.user.id not in user_cache:
+            async with get_db() as db:
+                await ensure_user(db, interaction.user.id, interaction.user.name)
+                await commit(db)
 
         embed = discord.Embed(
             title="Purchase Coins", 
@@ -323,10 +524,7 @@ class Payments(commands.Cog):
             embed = discord.Embed(title="Access Denied", description="You do not have permission to check other users' balances.", color=COLOR_ERROR)
             return await interaction.followup.send(embed=embed)
 
-        async with get_db() as db:
-            cursor = await db.execute("SELECT coins FROM users WHERE user_id = ?", (target.id,))
-            row = await cursor.fetchone()
-            coins = row[0] if row else 0
+        coins = await get_balance(target.id)
         
         title = "Account Balance" if target == interaction.user else f"Balance for {target.display_name}"
         desc = f"You currently have **{coins}** Battle Coins." if target == interaction.user else f"{target.mention} currently has **{coins}** Battle Coins."
@@ -340,35 +538,69 @@ class Payments(commands.Cog):
         """Admin: Manually add coins to a user."""
         # defer() is now handled globally in main.py
         async with get_db() as db:
-            await db.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user.id, user.name))
-            await db.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (amount, user.id))
-            await db.commit()
+            await ensure_user(db, user.id, user.name)
+            await apply_coins(db, user.id, amount, REASON_ADMIN_GRANT, f"admin:{interaction.user.id}")
+            await commit(db)
         
         embed = discord.Embed(title="Coins Added", description=f"Successfully added **{amount}** coins to {user.mention}.", color=COLOR_SUCCESS)
         await interaction.followup.send(embed=embed)
 
+    async def fetch_payouts(self, before=None, unpaid_only=False, limit=PAYOUTS_PAGE_SIZE):
+        """One page of settled winners, newest first, strictly older than battle `before`."""
+        unpaid = "AND paid_out = 0 " if unpaid_only else ""
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT battle_id, winner_name, genre, pool_amount, entrant_count, payout, paid_out FROM battle_results "
+                f"WHERE battle_id < ? AND winner_user_id IS NOT NULL {unpaid}ORDER BY battle_id DESC LIMIT ?",
+                (before if before is not None else 2 ** 63 - 1, limit)
+            )
+            return await cursor.fetchall()
+
+    def _payouts_embed(self, rows, unpaid_only):
+        title = "Owed Payouts" if unpaid_only else "Payouts"
+        if not rows:
+            return discord.Embed(title=title, description="No payouts found.", color=COLOR_INFO)
+        embed = discord.Embed(title=title, color=COLOR_SUCCESS)
+        for bid, username, genre, pool, entrants, payout, paid_out in rows:
+            status = "Paid" if paid_out else "Owed"
+            embed.add_field(
+                name=f"Battle #{bid}: {username}",
+                value=f"**Genre:** {genre}\n**Pool:** ${pool} x {entrants}\n**{status}:** `${payout:.2f}`",
+                inline=False
+            )
+        return embed
+
     @app_commands.command(name="payouts")
     @app_commands.checks.has_permissions(administrator=True)
-    async def payouts(self, interaction: discord.Interaction):
+    @app_commands.describe(unpaid_only="Only show winners who have not been paid yet")
+    async def payouts(self, interaction: discord.Interaction, unpaid_only: bool = False):
         """Admin: View winners and amounts owed."""
         # defer() is now handled globally in main.py
+        rows = await self.fetch_payouts(unpaid_only=unpaid_only)
+        embed = self._payouts_embed(rows, unpaid_only)
+        if len(rows) < PAYOUTS_PAGE_SIZE:
+            return await interaction.followup.send(embed=embed)
+        view = PayoutsView(self, interaction.user.id, rows[-1][0], unpaid_only)
+        await interaction.followup.send(embed=embed, view=view)
+
+    @app_commands.command(name="mark_paid")
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(battle_id="Battle whose winner has been paid")
+    async def mark_paid(self, interaction: discord.Interaction, battle_id: int):
+        """Admin: Record that a battle's winner payout has been sent."""
+        # defer() is now handled globally in main.py
         async with get_db() as db:
             cursor = await db.execute(
-                "SELECT u.username, b.genre, b.pool_amount, b.battle_id FROM battles b JOIN entrants e ON b.battle_id = e.battle_id JOIN users u ON e.user_id = u.user_id "
-                "WHERE b.status = 'completed' AND e.payment_status = 'paid' AND e.entrant_id = (SELECT v.entrant_id FROM votes v WHERE v.battle_id = b.battle_id GROUP BY v.entrant_id ORDER BY COUNT(*) DESC LIMIT 1)"
+                "UPDATE battle_results SET paid_out = 1 WHERE battle_id = ? AND winner_user_id IS NOT NULL AND paid_out = 0",
+                (battle_id,)
             )
-            rows = await cursor.fetchall()
-            
-            if not rows:
-                embed = discord.Embed(title="Owed Payouts", description="No pending payouts found.", color=COLOR_INFO)
-                return await interaction.followup.send(embed=embed)
-                
-            embed = discord.Embed(title="Owed Payouts", color=COLOR_SUCCESS)
-            for username, genre, pool, bid in rows:
-                count_cursor = await db.execute("SELECT COUNT(*) FROM entrants WHERE battle_id = ? AND payment_status = 'paid'", (bid,))
-                n = (await count_cursor.fetchone())[0]
-                embed.add_field(name=f"Battle #{bid}: {username}", value=f"**Genre:** {genre}\n**Pool:** ${pool}\n**Owed:** `${(n*pool)*0.7:.2f}`", inline=False)
-            await interaction.followup.send(embed=embed)
+            await commit(db)
+        if cursor.rowcount == 0:
+            embed = discord.Embed(title="Not Owed", description=f"Battle #{battle_id} has no unpaid winner payout.", color=COLOR_ERROR)
+            return await interaction.followup.send(embed=embed)
+        logger.info(f"Battle #{battle_id} payout marked paid by {interaction.user.id}")
+        embed = discord.Embed(title="Payout Recorded", description=f"Battle #{battle_id} is now marked as paid.", color=COLOR_SUCCESS)
+        await interaction.followup.send(embed=embed)
 
 async def setup(bot):
     await bot.add_cog(Payments(bot))
@@ -1,54 +1,761 @@
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
-from utils.database import get_db
-from utils.constants import VOTING_DURATION_HOURS, PLATFORM_FEE_PERCENT, WINNER_PAYOUT_PERCENT, COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, VOTER_ROLE_NAME
+from utils.database import get_db, commit
+from utils.coins import apply_coins, REASON_PAYOUT
+from utils.guild_registry import guild_registry
+from utils.constants import VOTING_DURATION_HOURS, PLATFORM_FEE_PERCENT, WINNER_PAYOUT_PERCENT, COLOR_SUCCESS, COLOR_ERROR, COLOR_INFO, VOTER_ROLE_NAME, VOTE_FLUSH_SECONDS, VOTING_CHANNEL_TTL_SECONDS, REACTION_REJECT_TTL_SECONDS, REACTION_RECONCILE_CONCURRENCY, REACTION_RECONCILE_MAX_CALLS, REACTION_RECONCILE_FULL_HOURS, VOTING_MODE, VOTING_CLOSE_RETRY_SECONDS, VOTING_CLOSE_MAX_RETRY_SECONDS
 from datetime import datetime, timedelta
+from collections import defaultdict, Counter, OrderedDict
+import asyncio
+import heapq
 import logging
+import math
+import time
 
 logger = logging.getLogger('music_battles.voting')
 
+class MessageIndex:
+    """In-process map of battle message ids to (entrant_id, battle_id, kind)."""
+
+    def __init__(self):
+        self._entries = {}
+        self._by_battle = defaultdict(set)
+        self._by_entrant = defaultdict(set)
+        self._genres = {}  # battle_id -> genre
+
+    async def load(self):
+        """Rebuild the index from entrants of battles that are still open."""
+        self.clear()
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT e.entrant_id, e.battle_id, e.submission_message_id, e.announcement_message_id, b.genre "
+                "FROM entrants e JOIN battles b ON e.battle_id = b.battle_id WHERE b.status != 'completed'"
+            )
+            rows = await cursor.fetchall()
+        for entrant_id, battle_id, submission_id, announcement_id, genre in rows:
+            if submission_id:
+                self.add(submission_id, entrant_id, battle_id, 'submission', genre)
+            if announcement_id:
+                self.add(announcement_id, entrant_id, battle_id, 'announcement', genre)
+        logger.info(f"Indexed {len(self._entries)} battle messages")
+
+    def get(self, message_id):
+        return self._entries.get(message_id)
+
+    def genre_of(self, battle_id):
+        return self._genres.get(battle_id)
+
+    def has_battle(self, battle_id):
+        return battle_id in self._by_battle
+
+    def battle_of_entrant(self, entrant_id):
+        """Battle of a tracked entrant, or None if it was removed or settled."""
+        messages = self._by_entrant.get(entrant_id)
+        return self._entries[next(iter(messages))][1] if messages else None
+
+    def battle_ids(self):
+        return list(self._by_battle)
+
+    def messages_for(self, battle_id):
+        """[(message_id, entrant_id, kind)] for every tracked message of a battle."""
+        return [(m, self._entries[m][0], self._entries[m][2]) for m in self._by_battle.get(battle_id, ())]
+
+    def add(self, message_id, entrant_id, battle_id, kind, genre=None):
+        self._entries[message_id] = (entrant_id, battle_id, kind)
+        if genre:
+            self._genres[battle_id] = genre
+        self._by_battle[battle_id].add(message_id)
+        self._by_entrant[entrant_id].add(message_id)
+
+    def remove_entrant(self, entrant_id):
+        for message_id in self._by_entrant.pop(entrant_id, ()):
+            _, battle_id, _ = self._entries.pop(message_id)
+            self._by_battle[battle_id].discard(message_id)
+
+    def remove_battle(self, battle_id):
+        self._genres.pop(battle_id, None)
+        for message_id in self._by_battle.pop(battle_id, ()):
+            entrant_id, _, _ = self._entries.pop(message_id)
+            self._by_entrant[entrant_id].discard(message_id)
+            if not self._by_entrant[entrant_id]:
+                del self._by_entrant[entrant_id]
+
+    def clear(self):
+        self._entries.clear()
+        self._genres.clear()
+        self._by_battle.clear()
+        self._by_entrant.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class VoteLedger:
+    """Authoritative in-memory votes and tallies, persisted to the votes table in batches.
+
+    Every accepted or retracted vote updates the in-memory state immediately and queues
+    one pending write per (battle_id, voter_id); later changes to the same key overwrite
+    earlier ones, so a burst of toggles costs a single row write on the next flush.
+    """
+
+    def __init__(self):
+        self._voters = defaultdict(dict)  # battle_id -> {voter_id: entrant_id}
+        self._tallies = defaultdict(Counter)  # battle_id -> Counter({entrant_id: votes})
+        self._pending = {}  # (battle_id, voter_id) -> entrant_id, or None to delete
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+
+    async def load(self):
+        """Rebuild state from the votes table for every battle that is still open."""
+        async with self._flush_lock:
+            async with get_db() as db:
+                cursor = await db.execute(
+                    "SELECT v.battle_id, v.voter_id, v.entrant_id FROM votes v "
+                    "JOIN battles b ON v.battle_id = b.battle_id WHERE b.status != 'completed'"
+                )
+                rows = await cursor.fetchall()
+            self._voters.clear()
+            self._tallies.clear()
+            self._pending.clear()
+            for battle_id, voter_id, entrant_id in rows:
+                self._voters[battle_id][voter_id] = entrant_id
+                self._tallies[battle_id][entrant_id] += 1
+        logger.info(f"Recovered {len(rows)} votes across {len(self._voters)} open battles")
+
+    def record(self, battle_id, voter_id, entrant_id):
+        """Accept a vote. Returns False if the voter already voted in this battle."""
+        voters = self._voters[battle_id]
+        if voter_id in voters:
+            return False
+        voters[voter_id] = entrant_id
+        self._tallies[battle_id][entrant_id] += 1
+        self._pending[(battle_id, voter_id)] = entrant_id
+        return True
+
+    def change(self, battle_id, voter_id, entrant_id):
+        """Point a voter's vote at `entrant_id`, recording it if they hadn't voted.
+
+        Returns the entrant they voted for before (None for a new vote). A change is one
+        pending write, flushed as a single upsert of the (battle_id, voter_id) row.
+        """
+        voters = self._voters[battle_id]
+        previous = voters.get(voter_id)
+        if previous == entrant_id:
+            return previous
+        if previous is not None:
+            self._decrement(battle_id, previous)
+        voters[voter_id] = entrant_id
+        self._tallies[battle_id][entrant_id] += 1
+        self._pending[(battle_id, voter_id)] = entrant_id
+        return previous
+
+    def retract(self, battle_id, voter_id, entrant_id):
+        """Withdraw a vote. Returns False if the voter wasn't voting for this entrant."""
+        voters = self._voters.get(battle_id)
+        if not voters or voters.get(voter_id) != entrant_id:
+            return False
+        del voters[voter_id]
+        self._decrement(battle_id, entrant_id)
+        self._pending[(battle_id, voter_id)] = None
+        return True
+
+    def discard_entrant(self, battle_id, entrant_id):
+        """Drop all votes for a removed entrant."""
+        voters = self._voters.get(battle_id, {})
+        for voter_id in [v for v, e in voters.items() if e == entrant_id]:
+            del voters[voter_id]
+            self._pending[(battle_id, voter_id)] = None
+        self._tallies.get(battle_id, Counter()).pop(entrant_id, None)
+
+    def drop_battle(self, battle_id):
+        """Forget a settled battle. Its votes must already be flushed."""
+        self._voters.pop(battle_id, None)
+        self._tallies.pop(battle_id, None)
+
+    def reset(self):
+        self._voters.clear()
+        self._tallies.clear()
+        self._pending.clear()
+
+    def _decrement(self, battle_id, entrant_id):
+        tally = self._tallies[battle_id]
+        tally[entrant_id] -= 1
+        if tally[entrant_id] <= 0:
+            del tally[entrant_id]
+
+    def tally(self, battle_id):
+        """Vote counts for a battle as [(entrant_id, votes)], most votes first."""
+        return sorted(self._tallies.get(battle_id, {}).items(), key=lambda item: (-item[1], item[0]))
+
+    def voters(self, battle_id):
+        """Copy of {voter_id: entrant_id} for a battle."""
+        return dict(self._voters.get(battle_id, {}))
+
+    def votes_for(self, battle_id, entrant_id):
+        return self._tallies.get(battle_id, {}).get(entrant_id, 0)
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    async def flush(self):
+        """Write all pending vote changes in a single transaction."""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            upserts = [(b, v, e) for (b, v), e in batch.items() if e is not None]
+            deletes = [(b, v) for (b, v), e in batch.items() if e is None]
+            try:
+                async with get_db() as db:
+                    if deletes:
+                        await db.executemany("DELETE FROM votes WHERE battle_id = ? AND voter_id = ?", deletes)
+                    if upserts:
+                        await db.executemany(
+                            "INSERT INTO votes (battle_id, voter_id, entrant_id) VALUES (?, ?, ?) "
+                            "ON CONFLICT(battle_id, voter_id) DO UPDATE SET entrant_id = excluded.entrant_id",
+                            upserts
+                        )
+                    await db.commit()
+            except Exception:
+                # Requeue the batch without clobbering anything that changed meanwhile
+                for key, entrant_id in batch.items():
+                    self._pending.setdefault(key, entrant_id)
+                raise
+            self.flushes += 1
+            self.rows_written += len(batch)
+
+class VoteButton(discord.ui.DynamicItem[discord.ui.Button], template=r'vote:(?P<battle_id>[0-9]+):(?P<entrant_id>[0-9]+)'):
+    """Vote button whose custom_id carries the battle and entrant, so it routes without
+    a lookup and keeps working across restarts once the class is registered."""
+
+    def __init__(self, battle_id, entrant_id):
+        super().__init__(discord.ui.Button(
+            label="Vote", emoji="✅", style=discord.ButtonStyle.green,
+            custom_id=f"vote:{battle_id}:{entrant_id}"
+        ))
+        self.battle_id = battle_id
+        self.entrant_id = entrant_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match['battle_id']), int(match['entrant_id']))
+
+    async def callback(self, interaction: discord.Interaction):
+        voting_cog = interaction.client.get_cog('Voting')
+        if voting_cog:
+            await voting_cog.button_vote(interaction, self.battle_id, self.entrant_id)
+
+class RecentSet:
+    """Keys remembered for `ttl` seconds. Entries share one TTL, so insertion order is
+    expiry order and pruning only ever pops from the front."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._expires = OrderedDict()
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._expires and next(iter(self._expires.values())) <= now:
+            self._expires.popitem(last=False)
+
+    def add(self, key):
+        self._prune()
+        self._expires.pop(key, None)
+        self._expires[key] = time.monotonic() + self.ttl
+
+    def discard(self, key):
+        self._expires.pop(key, None)
+
+    def __contains__(self, key):
+        self._prune()
+        return key in self._expires
+
+    def __len__(self):
+        return len(self._expires)
+
+class DeadlineScheduler:
+    """Timer heap that sleeps until the earliest voting deadline and fires a callback for it.
+
+    A deadline is only forgotten once its callback succeeds; a failure re-schedules it
+    `retry_delay` seconds out, doubling per consecutive failure up to `max_retry_delay`.
+    """
+
+    def __init__(self, callback, retry_delay=30.0, max_retry_delay=900.0):
+        self._callback = callback
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._heap = []  # (ends_at, battle_id); superseded entries are skipped lazily
+        self._deadlines = {}  # battle_id -> current ends_at
+        self._failures = {}  # battle_id -> consecutive failed callbacks
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def schedule(self, battle_id, ends_at):
+        self._deadlines[battle_id] = ends_at
+        heapq.heappush(self._heap, (ends_at, battle_id))
+        self._wakeup.set()
+
+    def cancel(self, battle_id):
+        self._deadlines.pop(battle_id, None)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            ends_at, battle_id = self._heap[0]
+            delay = (ends_at - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                # Sleep until the deadline, or until an earlier one is scheduled
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            try:
+                await self._callback(battle_id)
+            except Exception as e:
+                failures = self._failures[battle_id] = self._failures.get(battle_id, 0) + 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+                logger.error(f"Failed to close voting for Battle #{battle_id} (attempt {failures}): {e}; retrying in {delay:.0f}s")
+                self.schedule(battle_id, datetime.utcnow() + timedelta(seconds=delay))
+            else:
+                self._failures.pop(battle_id, None)
+                # The callback may have re-scheduled the battle; only drop the deadline that fired
+                if self._deadlines.get(battle_id) == ends_at:
+                    del self._deadlines[battle_id]
+
+class ReactionReconciler:
+    """Repairs the ledger from the ✅ reactions actually on tracked messages.
+
+    Reaction events sent while the bot is offline are lost. A run reads every tracked
+    message's ✅ count from channel history (up to 100 messages per call) and compares it
+    with that message's checkpoint: the count seen by the last run, kept current by live
+    events. Only entrants with a changed message get their reactors paged, under a
+    concurrency limit and a per-run call budget, and the resulting votes and retractions
+    go through the ledger in one flush. Equal numbers of adds and removes on one message
+    leave its count unchanged, so `full=True` (run periodically by the cog) pages every
+    message regardless. Voters whose live events arrive during a run are left alone: the
+    event is newer than anything the run read. An entrant is only repaired once every one
+    of its tracked messages could be read.
+    """
+
+    def __init__(self, cog, concurrency=4, max_calls=500):
+        self.cog = cog
+        self.concurrency = concurrency
+        self.max_calls = max_calls
+        self._counts = {}  # message_id -> non-bot ✅ reactors at the checkpoint
+        self._task = None
+        self._rerun = False
+        self._rerun_full = False
+        # Set while a run is in progress: voters and messages with live events since it started
+        self._touched_voters = None
+        self._touched_messages = None
+        self.runs = 0
+        self.last_run = {}
+
+    async def load(self):
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT c.message_id, c.reactors FROM reaction_checkpoints c "
+                "JOIN battles b ON b.battle_id = c.battle_id WHERE b.status != 'completed'"
+            )
+            self._counts = dict(await cursor.fetchall())
+
+    async def save(self, message_ids=None):
+        """Persist checkpoints (all of them by default) and drop those of settled battles."""
+        rows = []
+        for message_id in (list(self._counts) if message_ids is None else message_ids):
+            entry = self.cog.message_index.get(message_id)
+            if entry and message_id in self._counts:
+                rows.append((message_id, entry[1], self._counts[message_id]))
+        async with get_db() as db:
+            await db.executemany(
+                "INSERT INTO reaction_checkpoints (message_id, battle_id, reactors) VALUES (?, ?, ?) "
+                "ON CONFLICT(message_id) DO UPDATE SET reactors = excluded.reactors, checked_at = CURRENT_TIMESTAMP",
+                rows
+            )
+            await db.execute(
+                "DELETE FROM reaction_checkpoints WHERE battle_id IN (SELECT battle_id FROM battles WHERE status = 'completed')"
+            )
+            await db.commit()
+
+    def observe(self, message_id, user_id, delta):
+        """Keep a checkpoint current with a live ✅ add (+1) or remove (-1)."""
+        if message_id in self._counts:
+            self._counts[message_id] += delta
+        if self._touched_voters is not None:
+            self._touched_voters.add(user_id)
+            self._touched_messages.add(message_id)
+
+    def trigger(self, full=False):
+        """Start a run in the background, or queue one more if a run is in progress."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_until_settled(full))
+        else:
+            self._rerun = True
+            self._rerun_full = self._rerun_full or full
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _run_until_settled(self, full=False):
+        while True:
+            self._rerun = self._rerun_full = False
+            try:
+                await self.run(full)
+            except Exception as e:
+                logger.error(f"Reaction reconciliation failed: {e}")
+            if not self._rerun:
+                return
+            full = self._rerun_full
+
+    async def _channels(self, battle_ids):
+        """{channel_id: {message_id}} for the tracked messages of `battle_ids`."""
+        bot = self.cog.bot
+        async with get_db() as db:
+            cursor = await db.execute(
+                f"SELECT battle_id, genre, pool_amount, voting_channel_id FROM battles "
+                f"WHERE battle_id IN ({','.join('?' * len(battle_ids))})",
+                battle_ids
+            )
+            battles = await cursor.fetchall()
+        channels = defaultdict(set)
+        for battle_id, genre, pool_amount, voting_channel_id in battles:
+            pool_channel = None
+            for guild in bot.guilds:
+                pool_channel = guild_registry.pool_channel(guild, genre, pool_amount)
+                if pool_channel:
+                    break
+            for message_id, _, kind in self.cog.message_index.messages_for(battle_id):
+                channel_id = voting_channel_id if kind == 'submission' else getattr(pool_channel, 'id', None)
+                if channel_id:
+                    channels[channel_id].add(message_id)
+        return channels
+
+    async def run(self, full=False):
+        """Reconcile every open battle once. Returns the run's counters."""
+        await self.cog.bot.wait_until_ready()
+        self._touched_voters, self._touched_messages = set(), set()
+        try:
+            return await self._reconcile(full)
+        finally:
+            self._touched_voters = self._touched_messages = None
+
+    async def _reconcile(self, full):
+        started = time.perf_counter()
+        bot = self.cog.bot
+        index = self.cog.message_index
+        ledger = self.cog.ledger
+        battle_ids = index.battle_ids()
+        if not battle_ids:
+            return {}
+
+        calls = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        observed = {}  # message_id -> (non-bot ✅ count, Message or None if gone)
+
+        async def scan(channel_id, message_ids):
+            nonlocal calls
+            channel = bot.get_channel(channel_id) or bot.get_partial_messageable(channel_id)
+            last = max(message_ids)
+            seen = 0
+            async with semaphore:
+                try:
+                    async for message in channel.history(limit=None, after=discord.Object(id=min(message_ids) - 1), oldest_first=True):
+                        seen += 1
+                        if message.id in message_ids:
+                            reaction = discord.utils.find(lambda r: str(r.emoji) == "✅", message.reactions)
+                            count = reaction.count - reaction.me if reaction else 0
+                            observed[message.id] = (count, message)
+                        if message.id >= last:
+                            break
+                except (discord.NotFound, discord.Forbidden) as e:
+                    logger.warning(f"Cannot read channel {channel_id} to reconcile votes: {e}")
+                    return
+                finally:
+                    calls += seen // 100 + 1
+            for message_id in message_ids:
+                # Not in history any more: the message was deleted along with its reactions
+                observed.setdefault(message_id, (0, None))
+
+        channels = await self._channels(battle_ids)
+        await asyncio.gather(*(scan(channel_id, ids) for channel_id, ids in channels.items()))
+
+        # An entrant is dirty if any of its messages moved away from its checkpoint. Entrants
+        # with a message we couldn't read are left for a later run: a vote that only shows on
+        # the unread message would otherwise look withdrawn.
+        dirty = {}
+        unobserved = 0
+        for battle_id in battle_ids:
+            messages = index.messages_for(battle_id)
+            unseen = {e for m, e, _ in messages if m not in observed}
+            unobserved += len(unseen)
+            changed = {e for m, e, _ in messages
+                       if e not in unseen and (full or self._counts.get(m) != observed[m][0])}
+            for message_id, entrant_id, _ in messages:
+                if entrant_id in changed:
+                    dirty.setdefault((battle_id, entrant_id), []).append(message_id)
+
+        # Spend the call budget on whole entrants so no entrant is half-paged
+        budget = self.max_calls - calls
+        to_page, deferred = {}, 0
+        for key, message_ids in dirty.items():
+            cost = sum(math.ceil(observed[m][0] / 100) for m in message_ids)
+            if cost > budget:
+                deferred += 1
+                continue
+            budget -= cost
+            to_page[key] = message_ids
+
+        reactors = {}  # message_id -> {user_id}
+
+        async def page(message_id):
+            nonlocal calls
+            count, message = observed[message_id]
+            reaction = message and discord.utils.find(lambda r: str(r.emoji) == "✅", message.reactions)
+            if not count or not reaction:
+                reactors[message_id] = set()
+                return
+            async with semaphore:
+                users = {user.id async for user in reaction.users(limit=None)}
+                calls += math.ceil(reaction.count / 100)
+            users.discard(bot.user.id)
+            reactors[message_id] = users
+
+        await asyncio.gather(*(page(m) for message_ids in to_page.values() for m in message_ids))
+
+        inserts = deletes = skipped_voters = 0
+        touched = self._touched_voters
+        duplicates = []  # (channel_id, message_id, user_id)
+        genres = set()
+        by_battle = defaultdict(dict)
+        for (battle_id, entrant_id), message_ids in to_page.items():
+            by_battle[battle_id][entrant_id] = message_ids
+        for battle_id, entrants in by_battle.items():
+            if not index.messages_for(battle_id):
+                continue  # settled while we were scanning
+            reacting = {e: set().union(*(reactors[m] for m in ids)) for e, ids in entrants.items()}
+            # Retract first so a voter who switched entrants while we were away can vote again
+            for voter_id, entrant_id in ledger.voters(battle_id).items():
+                if entrant_id in reacting and voter_id not in reacting[entrant_id] and voter_id not in touched:
+                    ledger.retract(battle_id, voter_id, entrant_id)
+                    deletes += 1
+            voters = ledger.voters(battle_id)
+            for entrant_id, users in reacting.items():
+                for user_id in users:
+                    if user_id in touched:
+                        skipped_voters += 1
+                        continue
+                    current = voters.get(user_id)
+                    if current is None:
+                        ledger.record(battle_id, user_id, entrant_id)
+                        voters[user_id] = entrant_id
+                        inserts += 1
+                    elif current != entrant_id:
+                        # A second vote in this battle that nobody removed while we were away
+                        duplicates += [(observed[m][1].channel.id, m, user_id)
+                                       for m in entrants[entrant_id] if user_id in reactors[m]]
+            if inserts or deletes:
+                genres.add(index.genre_of(battle_id))
+
+        await ledger.flush()
+        paged = [m for message_ids in to_page.values() for m in message_ids]
+        for message_id in paged:
+            if message_id in self._touched_messages:
+                # Can't tell whether the read saw the live event; re-page it next run
+                self._counts.pop(message_id, None)
+            else:
+                self._counts[message_id] = observed[message_id][0]
+        for message_id in [m for m in self._counts if not index.get(m)]:
+            del self._counts[message_id]
+        await self.save(paged)
+        for genre in genres:
+            self.cog._mark_stats_dirty(genre)
+        # After the checkpoints are set, so each removal's event takes its message back down
+        for channel_id, message_id, user_id in duplicates:
+            await self.cog.remove_reaction(channel_id, message_id, user_id, "✅")
+        conflicts = len(duplicates)
+
+        self.runs += 1
+        self.last_run = {
+            'messages': len(observed),
+            'paged': len(paged),
+            'skipped': len(observed) - len(paged),
+            'deferred_entrants': deferred,
+            'unobserved_entrants': unobserved,
+            'api_calls': calls,
+            'inserts': inserts,
+            'deletes': deletes,
+            'conflicts': conflicts,
+            'skipped_voters': skipped_voters,
+            'seconds': time.perf_counter() - started,
+        }
+        logger.info(
+            f"Reconciled reactions{' (full pass)' if full else ''} on {len(observed)} messages ({len(paged)} paged, {deferred} entrants deferred, {unobserved} unreadable) "
+            f"in {calls} API calls: {inserts} votes added, {deletes} removed, {conflicts} duplicates removed, "
+            f"{skipped_voters} voters left to live events"
+        )
+        return self.last_run
+
 class Voting(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.check_votes.start()
+        self.message_index = MessageIndex()
+        self.ledger = VoteLedger()
+        self.scheduler = DeadlineScheduler(self._close_due_battle, VOTING_CLOSE_RETRY_SECONDS, VOTING_CLOSE_MAX_RETRY_SECONDS)
+        # (message_id, user_id, emoji) whose reaction we are removing; the remove event it
+        # triggers must not retract a vote, and a replayed add must not remove it again
+        self._rejections = RecentSet(REACTION_REJECT_TTL_SECONDS)
+        self.rejections_sent = 0
+        self.rejections_deduped = 0
+        self.reactions = ReactionReconciler(self, REACTION_RECONCILE_CONCURRENCY, REACTION_RECONCILE_MAX_CALLS)
 
-    def cog_unload(self):
-        self.check_votes.cancel()
+    async def cog_load(self):
+        self.bot.add_dynamic_items(VoteButton)
+        self.bot.jobs.register('post_results', self._job_post_results)
+        self.bot.jobs.register('cleanup_announcements', self._job_cleanup_announcements)
+        self.bot.jobs.register('delete_channel', self._job_delete_channel)
 
-    @tasks.loop(minutes=1)
-    async def check_votes(self):
-        """Background task to check for battles whose voting period has ended."""
-        now = datetime.utcnow()
+        await self.message_index.load()
+        await self.ledger.load()
+        await self.reactions.load()
+        self.flush_votes.start()
+        if VOTING_MODE == 'reactions':
+            self.full_reconcile.start()
+
+        # Overdue battles (e.g. after downtime) land at the top of the heap and close immediately
         async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT battle_id, voting_channel_id, genre, pool_amount FROM battles WHERE status = 'voting' AND voting_ends_at <= ?",
-                (now.isoformat(),)
-            )
+            cursor = await db.execute("SELECT battle_id, voting_ends_at FROM battles WHERE status = 'voting'")
             rows = await cursor.fetchall()
-            
-            for row in rows:
-                battle_id, channel_id, genre, pool_amount = row
-                await self.end_voting(battle_id, channel_id, genre, pool_amount)
+        for battle_id, voting_ends_at in rows:
+            ends_at = datetime.fromisoformat(voting_ends_at) if voting_ends_at else datetime.utcnow()
+            self.scheduler.schedule(battle_id, ends_at)
+        self.scheduler.start()
+        logger.info(f"Scheduled {len(self.scheduler)} voting deadlines")
 
-    async def end_voting(self, battle_id, channel_id, genre, pool_amount):
-        """Tally votes and announce the winner."""
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(VoteButton)
+        self.scheduler.stop()
+        self.reactions.stop()
+        self.full_reconcile.cancel()
+        self.flush_votes.cancel()
+        await self.ledger.flush()
+        await self.reactions.save()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # Also fires after a reconnect that had to re-identify
+        if VOTING_MODE == 'reactions':
+            self.reactions.trigger()
+
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        if VOTING_MODE == 'reactions':
+            self.reactions.trigger()
+
+    def vote_view(self, battle_id, entrant_id):
+        """Persistent view with the vote button for one entrant."""
+        view = discord.ui.View(timeout=None)
+        view.add_item(VoteButton(battle_id, entrant_id))
+        return view
+
+    async def button_vote(self, interaction, battle_id, entrant_id):
+        """Record, move or confirm a button vote, answered in one ephemeral response."""
+        if self.message_index.battle_of_entrant(entrant_id) != battle_id:
+            embed = discord.Embed(title="Voting Closed", description="This submission is no longer open for voting.", color=COLOR_ERROR)
+            return await interaction.response.send_message(embed=embed, ephemeral=True)
+
+        previous = self.ledger.change(battle_id, interaction.user.id, entrant_id)
+        if previous == entrant_id:
+            embed = discord.Embed(title="Already Voted", description="You're already voting for this submission.", color=COLOR_INFO)
+        elif previous is None:
+            embed = discord.Embed(title="Vote Recorded", description="Your vote has been counted. You can move it by voting for another submission.", color=COLOR_SUCCESS)
+        else:
+            embed = discord.Embed(title="Vote Changed", description="Your vote has been moved to this submission.", color=COLOR_SUCCESS)
+        if previous != entrant_id:
+            logger.info(f"Recorded button vote from {interaction.user.id} for entrant {entrant_id}")
+            self._mark_stats_dirty(self.message_index.genre_of(battle_id))
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @tasks.loop(hours=REACTION_RECONCILE_FULL_HOURS)
+    async def full_reconcile(self):
+        """Page every voter's reactions, catching offline changes that left a count unchanged."""
+        # The first iteration fires at startup, where on_ready already runs an incremental pass
+        if self.full_reconcile.current_loop:
+            self.reactions.trigger(full=True)
+
+    def _mark_stats_dirty(self, genre):
+        payments_cog = self.bot.get_cog('Payments')
+        if payments_cog:
+            payments_cog.mark_stats_dirty(genre)
+
+    @tasks.loop(seconds=VOTE_FLUSH_SECONDS)
+    async def flush_votes(self):
+        """Persist batched vote changes."""
+        try:
+            await self.ledger.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush {self.ledger.pending_count} pending votes: {e}")
+
+    async def _close_due_battle(self, battle_id):
+        """Scheduler callback: settle a battle whose voting deadline has passed."""
+        await self.bot.wait_until_ready()
         async with get_db() as db:
             cursor = await db.execute(
-                """
-                SELECT entrant_id, COUNT(*) as vote_count 
-                FROM votes 
-                WHERE battle_id = ? 
-                GROUP BY entrant_id 
-                ORDER BY vote_count DESC
-                """,
+                "SELECT voting_channel_id, genre, pool_amount FROM battles WHERE battle_id = ? AND status = 'voting'",
                 (battle_id,)
             )
-            results = await cursor.fetchall()
-            
+            row = await cursor.fetchone()
+        if not row:
+            # Already decided manually or removed
+            return
+        channel_id, genre, pool_amount = row
+        await self.end_voting(battle_id, channel_id, genre, pool_amount)
+
+    async def end_voting(self, battle_id, channel_id, genre, pool_amount):
+        """Tally votes and announce the winner."""
+        self.scheduler.cancel(battle_id)
+        # Settle against persisted votes: the ledger is authoritative but write-behind
+        await self.ledger.flush()
+        results = self.ledger.tally(battle_id)
+
+        total_votes = sum(votes for _, votes in results)
+
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM entrants WHERE battle_id = ? AND payment_status = 'paid'", (battle_id,))
+            num_paid = (await cursor.fetchone())[0]
+            total_pool = num_paid * pool_amount
+
             if not results:
                 await db.execute("UPDATE battles SET status = 'completed' WHERE battle_id = ?", (battle_id,))
+                await db.execute(
+                    "INSERT OR IGNORE INTO battle_results (battle_id, genre, pool_amount, entrant_count, total_pool) VALUES (?, ?, ?, ?, ?)",
+                    (battle_id, genre, pool_amount, num_paid, total_pool)
+                )
                 await db.commit()
+                self.message_index.remove_battle(battle_id)
+                self.ledger.drop_battle(battle_id)
+                self._mark_stats_dirty(genre)
                 return
 
             winner_entrant_id, winner_votes = results[0]
@@ -60,132 +767,172 @@ class Voting(commands.Cog):
             winner_row = await cursor.fetchone()
             winner_name, winner_id, track_link = winner_row
 
-            cursor = await db.execute("SELECT COUNT(*) FROM entrants WHERE battle_id = ? AND payment_status = 'paid'", (battle_id,))
-            num_paid = (await cursor.fetchone())[0]
-            total_pool = num_paid * pool_amount
             payout = total_pool * WINNER_PAYOUT_PERCENT
             fee = total_pool * PLATFORM_FEE_PERCENT
 
+            embed = discord.Embed(title="Battle Results", color=discord.Color.gold())
+            embed.add_field(name="Winner", value=f"<@{winner_id}> ({winner_name})", inline=False)
+            embed.add_field(name="Total Votes", value=f"`{winner_votes}`", inline=True)
+            embed.add_field(name="Total Pool", value=f"`${total_pool:.2f}`", inline=True)
+            embed.add_field(name=f"Winner Payout ({WINNER_PAYOUT_PERCENT:.0%})", value=f"`${payout:.2f}`", inline=True)
+            embed.add_field(name=f"Platform Fee ({PLATFORM_FEE_PERCENT:.0%})", value=f"`${fee:.2f}`", inline=True)
+            embed.add_field(name="Winning Track", value=f"[Download/Listen]({track_link})", inline=False)
+
+            # The result row is the settlement record; if it already exists this battle was paid.
+            # paid_out stays 0 until an admin confirms the cash payout with /mark_paid.
+            cursor = await db.execute(
+                """
+                INSERT OR IGNORE INTO battle_results (
+                    battle_id, genre, pool_amount, winner_entrant_id, winner_user_id, winner_name, winner_votes,
+                    total_votes, entrant_count, total_pool, payout, payout_coins, fee
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (battle_id, genre, pool_amount, winner_entrant_id, winner_id, winner_name, winner_votes,
+                 total_votes, num_paid, total_pool, payout, int(payout), fee)
+            )
+            if cursor.rowcount == 0:
+                logger.warning(f"Battle #{battle_id} was already settled; skipping duplicate payout")
+                # Still drop its in-memory state, or its messages keep being tallied and reconciled
+                self.message_index.remove_battle(battle_id)
+                self.ledger.drop_battle(battle_id)
+                return
+
             await db.execute("UPDATE battles SET status = 'completed' WHERE battle_id = ?", (battle_id,))
             
             # Automated Payout: Credit coins to the winner's balance
-            await db.execute(
-                "UPDATE users SET coins = coins + ? WHERE user_id = ?",
-                (int(payout), winner_id)
-            )
-            
-            await db.commit()
-            logger.info(f"Battle #{battle_id} completed. Winner {winner_name} credited with {int(payout)} coins.")
+            await apply_coins(db, winner_id, int(payout), REASON_PAYOUT, f"battle:{battle_id}")
 
+            # Follow-ups are queued in the settlement transaction so a restart can't lose them
             channel = self.bot.get_channel(channel_id)
             if channel:
-                embed = discord.Embed(title="Battle Results", color=discord.Color.gold())
-                embed.add_field(name="Winner", value=f"<@{winner_id}> ({winner_name})", inline=False)
-                embed.add_field(name="Total Votes", value=f"`{winner_votes}`", inline=True)
-                embed.add_field(name="Total Pool", value=f"`${total_pool:.2f}`", inline=True)
-                embed.add_field(name="Winner Payout (70%)", value=f"`${payout:.2f}`", inline=True)
-                embed.add_field(name="Platform Fee (30%)", value=f"`${fee:.2f}`", inline=True)
-                embed.add_field(name="Winning Track", value=f"[Download/Listen]({track_link})", inline=False)
-                
+                guilds = [channel.guild]
+            else:
+                # The voting channel is gone; the battle belongs to the guild that hosts its pool
+                guilds = [g for g in self.bot.guilds if guild_registry.pool_channel(g, genre, pool_amount)]
+                if len(guilds) != 1:
+                    logger.warning(f"Can't tell which guild Battle #{battle_id} ran in "
+                                   f"({len(guilds)} candidates); not posting its results")
+                    guilds = []
+            for guild in guilds:
+                await self.bot.jobs.enqueue('post_results', {'guild_id': guild.id, 'embed': embed.to_dict()}, db=db)
+                await self.bot.jobs.enqueue(
+                    'cleanup_announcements',
+                    {'guild_id': guild.id, 'genre': genre, 'pool_amount': pool_amount, 'battle_id': battle_id},
+                    db=db
+                )
+            if channel:
+                # Keep the voting channel up for a while so people can see the results
+                await self.bot.jobs.enqueue('delete_channel', {'channel_id': channel.id}, delay=VOTING_CHANNEL_TTL_SECONDS, db=db)
+            
+            await commit(db)
+            self.bot.jobs.notify()
+            self.message_index.remove_battle(battle_id)
+            self.ledger.drop_battle(battle_id)
+            self._mark_stats_dirty(genre)
+            logger.info(f"Battle #{battle_id} completed. Winner {winner_name} credited with {int(payout)} coins.")
+
+        if channel:
+            try:
                 await channel.send(embed=embed)
                 await channel.set_permissions(channel.guild.default_role, send_messages=False)
-                
-                # Cleanup flow: Clear pool announcements and delete voting channel
-                battles_cog = self.bot.get_cog('Battles')
-                if battles_cog:
-                    await battles_cog.cleanup_pool_announcements(channel.guild, genre, pool_amount, battle_id)
-                
-                # Auto-delete voting channel after 1 hour (to allow people to see results)
-                # Or immediately if the user wants "instant" results and everything over
-                # Based on "create new setup and everything over", I'll set it to delete after 5 minutes
-                await asyncio.sleep(300) 
-                try:
-                    await channel.delete()
-                except:
-                    pass
+            except discord.HTTPException as e:
+                logger.error(f"Failed to post results in voting channel for Battle #{battle_id}: {e}")
 
-            results_channel = discord.utils.get(channel.guild.text_channels, name="results-winners")
-            if results_channel:
-                await results_channel.send(embed=embed)
+    async def _job_post_results(self, payload):
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(payload['guild_id'])
+        if not guild:
+            return
+        results_channel = guild_registry.channel(guild, "results-winners")
+        if results_channel:
+            await results_channel.send(embed=discord.Embed.from_dict(payload['embed']))
+
+    async def _job_cleanup_announcements(self, payload):
+        await self.bot.wait_until_ready()
+        guild = self.bot.get_guild(payload['guild_id'])
+        battles_cog = self.bot.get_cog('Battles')
+        if not guild or not battles_cog:
+            return
+        await battles_cog.cleanup_pool_announcements(guild, payload['genre'], payload['pool_amount'], payload['battle_id'])
+
+    async def _job_delete_channel(self, payload):
+        await self.bot.wait_until_ready()
+        channel = self.bot.get_channel(payload['channel_id'])
+        if channel:
+            try:
+                await channel.delete()
+            except discord.NotFound:
+                pass
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         """Handle reaction-based voting."""
-        if payload.user_id == self.bot.user.id:
+        if VOTING_MODE != 'reactions' or payload.user_id == self.bot.user.id:
+            return
+
+        # Reactions on messages that aren't battle entries are none of our business
+        entry = self.message_index.get(payload.message_id)
+        if not entry:
             return
 
         if str(payload.emoji) != "✅":
             # Remove invalid reactions
-            guild = self.bot.get_guild(payload.guild_id)
-            channel = guild.get_channel(payload.channel_id)
-            if not channel: return
-            try:
-                message = await channel.fetch_message(payload.message_id)
-                user = self.bot.get_user(payload.user_id)
-                if user:
-                    await message.remove_reaction(payload.emoji, user)
-            except (discord.NotFound, discord.Forbidden):
-                pass
-            return
+            return await self._reject_reaction(payload)
 
-        async with get_db() as db:
-            # Check if this message is a battle submission or an announcement
-            cursor = await db.execute(
-                "SELECT entrant_id, battle_id FROM entrants WHERE submission_message_id = ? OR announcement_message_id = ?",
-                (payload.message_id, payload.message_id)
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return
+        self.reactions.observe(payload.message_id, payload.user_id, 1)
+        entrant_id, battle_id, _ = entry
 
-            entrant_id, battle_id = row
+        if self.ledger.record(battle_id, payload.user_id, entrant_id):
+            logger.info(f"Recorded reaction vote from {payload.user_id} for entrant {entrant_id}")
+            self._mark_stats_dirty(self.message_index.genre_of(battle_id))
+        else:
+            # If they already voted elsewhere in this battle, remove the new reaction
+            await self._reject_reaction(payload)
 
-            # Insert vote (Unique constraint battle_id, voter_id handles double voting)
-            try:
-                await db.execute(
-                    "INSERT INTO votes (battle_id, voter_id, entrant_id) VALUES (?, ?, ?)",
-                    (battle_id, payload.user_id, entrant_id)
-                )
-                await db.commit()
-                logger.info(f"Recorded reaction vote from {payload.user_id} for entrant {entrant_id}")
-            except Exception as e:
-                # If they already voted elsewhere in this battle, remove the new reaction
-                guild = self.bot.get_guild(payload.guild_id)
-                channel = guild.get_channel(payload.channel_id)
-                if not channel: return
-                try:
-                    message = await channel.fetch_message(payload.message_id)
-                    user = self.bot.get_user(payload.user_id)
-                    if user:
-                        await message.remove_reaction("✅", user)
-                except (discord.NotFound, discord.Forbidden):
-                    pass
+    async def _reject_reaction(self, payload):
+        await self.remove_reaction(payload.channel_id, payload.message_id, payload.user_id, payload.emoji, payload.guild_id)
+
+    async def remove_reaction(self, channel_id, message_id, user_id, emoji, guild_id=None):
+        """Remove a reaction in one REST call, straight from the ids."""
+        key = (message_id, user_id, str(emoji))
+        if key in self._rejections:
+            self.rejections_deduped += 1
+            return
+        self._rejections.add(key)
+        channel = self.bot.get_partial_messageable(channel_id, guild_id=guild_id)
+        try:
+            await channel.get_partial_message(message_id).remove_reaction(emoji, discord.Object(id=user_id))
+            self.rejections_sent += 1
+        except (discord.NotFound, discord.Forbidden):
+            # No remove event will follow
+            self._rejections.discard(key)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
         """Handle reaction removal to sync votes."""
-        if payload.user_id == self.bot.user.id:
+        if VOTING_MODE != 'reactions' or payload.user_id == self.bot.user.id:
+            return
+
+        if str(payload.emoji) == "✅":
+            self.reactions.observe(payload.message_id, payload.user_id, -1)
+
+        key = (payload.message_id, payload.user_id, str(payload.emoji))
+        if key in self._rejections:
+            # Our own removal of a rejected reaction; the voter's real vote stands
+            self._rejections.discard(key)
             return
 
         if str(payload.emoji) != "✅":
             return
 
-        async with get_db() as db:
-            cursor = await db.execute(
-                "SELECT entrant_id FROM entrants WHERE submission_message_id = ? OR announcement_message_id = ?",
-                (payload.message_id, payload.message_id)
-            )
-            row = await cursor.fetchone()
-            if not row:
-                return
+        entry = self.message_index.get(payload.message_id)
+        if not entry:
+            return
 
-            entrant_id = row[0]
-            await db.execute(
-                "DELETE FROM votes WHERE entrant_id = ? AND voter_id = ?",
-                (entrant_id, payload.user_id)
-            )
-            await db.commit()
+        entrant_id, battle_id, _ = entry
+        if self.ledger.retract(battle_id, payload.user_id, entrant_id):
             logger.info(f"Removed reaction vote from {payload.user_id} for entrant {entrant_id}")
+            self._mark_stats_dirty(self.message_index.genre_of(battle_id))
 
 async def setup(bot):
     await bot.add_cog(Voting(bot))
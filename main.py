@@ -51,6 +51,9 @@ class MusicBattlesBot(commands.Bot):
             help_command=None,
             tree_cls=GlobalDeferTree # Use our custom tree
         )
+        from utils.jobs import JobQueue
+        from utils.constants import JOB_WORKERS
+        self.jobs = JobQueue(workers=JOB_WORKERS)
 
     async def setup_hook(self):
         from utils.database import init_db
@@ -66,6 +69,9 @@ class MusicBattlesBot(commands.Bot):
                     logger.info(f'Loaded extension: {filename}')
                 except Exception as e:
                     logger.error(f'Failed to load extension {filename}: {e}')
+
+        # Start after the cogs have registered their job handlers
+        await self.jobs.start()
         
         # Manual sync via /sync is preferred to avoid startup delays
         # but we do one first sync if the tree is empty
@@ -75,6 +81,12 @@ class MusicBattlesBot(commands.Bot):
         # except Exception as e:
         #     logger.error(f"Failed to sync command tree: {e}")
 
+    async def close(self):
+        await self.jobs.stop()
+        await super().close()
+        from utils.database import close_db
+        await close_db()
+
     async def on_ready(self):
         logger.info(f'Logged in as {self.user.name} ({self.user.id})')
         logger.info(f'Process ID (PID): {os.getpid()}') # Added PID logging
@@ -0,0 +1,22 @@
+import asyncio
+import pytest
+
+from utils import database
+from utils.user_cache import user_cache
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop."""
+    return asyncio.run
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """Point get_db() at an empty database file that only this test sees.
+
+    The pool is module-global, so each test gets its own; call init_db() inside the
+    test's event loop and close_db() before it ends.
+    """
+    monkeypatch.setattr(database, '_pool', database.ConnectionPool(str(tmp_path / 'music_battles.db'), 2))
+    user_cache.clear()
+    yield
+    user_cache.clear()
@@ -0,0 +1,93 @@
+"""A local stand-in for the parts of the PayPal REST API the bot uses.
+
+Point PayPalClient (or PAYPAL_API_BASE) at `stub.base_url`. Every request is counted per
+endpoint, issued tokens honour `expires_in`, and orders move from APPROVED to COMPLETED
+when captured. Webhook signatures verify when the transmission signature is 'valid'.
+"""
+import asyncio
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+class PayPalStub:
+    def __init__(self, expires_in=3600, token_delay=0.0):
+        self.expires_in = expires_in
+        self.token_delay = token_delay
+        self.calls = Counter()
+        self.orders = {}  # order_id -> status
+        self.revoked = set()  # tokens that now get a 401
+        self.fail_token = False
+        self._tokens = itertools.count(1)
+        self.current_token = None
+        self._runner = None
+        self.base_url = None
+
+    async def start(self):
+        app = web.Application()
+        app.add_routes([
+            web.post('/v1/oauth2/token', self.token),
+            web.post('/v2/checkout/orders', self.create_order),
+            web.get('/v2/checkout/orders/{order_id}', self.get_order),
+            web.post('/v2/checkout/orders/{order_id}/capture', self.capture_order),
+            web.post('/v1/notifications/verify-webhook-signature', self.verify_webhook),
+        ])
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    async def token(self, request):
+        self.calls['token'] += 1
+        if request.headers.get('Authorization', '').split(' ')[0] != 'Basic':
+            return web.json_response({'error': 'invalid_client'}, status=401)
+        if self.fail_token:
+            return web.json_response({'error': 'invalid_client'}, status=401)
+        await asyncio.sleep(self.token_delay)
+        self.current_token = f"token-{next(self._tokens)}"
+        return web.json_response({'access_token': self.current_token, 'token_type': 'Bearer', 'expires_in': self.expires_in})
+
+    def _authorised(self, request):
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        return token.startswith('token-') and token not in self.revoked
+
+    async def create_order(self, request):
+        self.calls['create_order'] += 1
+        if not self._authorised(request):
+            return web.json_response({'message': 'unauthorised'}, status=401)
+        order_id = f"ORDER-{len(self.orders) + 1}"
+        self.orders[order_id] = 'CREATED'
+        return web.json_response({'id': order_id, 'status': 'CREATED', 'links': []}, status=201)
+
+    async def get_order(self, request):
+        self.calls['get_order'] += 1
+        if not self._authorised(request):
+            return web.json_response({'message': 'unauthorised'}, status=401)
+        order_id = request.match_info['order_id']
+        if order_id not in self.orders:
+            return web.json_response({'name': 'RESOURCE_NOT_FOUND'}, status=404)
+        return web.json_response({'id': order_id, 'status': self.orders[order_id]})
+
+    async def capture_order(self, request):
+        self.calls['capture_order'] += 1
+        if not self._authorised(request):
+            return web.json_response({'message': 'unauthorised'}, status=401)
+        order_id = request.match_info['order_id']
+        if self.orders.get(order_id) != 'APPROVED':
+            return web.json_response({'name': 'UNPROCESSABLE_ENTITY'}, status=422)
+        self.orders[order_id] = 'COMPLETED'
+        return web.json_response({'id': order_id, 'status': 'COMPLETED'}, status=201)
+
+    async def verify_webhook(self, request):
+        self.calls['verify_webhook'] += 1
+        if not self._authorised(request):
+            return web.json_response({'message': 'unauthorised'}, status=401)
+        body = await request.json()
+        verified = body.get('transmission_sig') == 'valid' and body.get('webhook_id') is not None
+        return web.json_response({'verification_status': 'SUCCESS' if verified else 'FAILURE'})
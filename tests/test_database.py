@@ -0,0 +1,41 @@
+import asyncio
+
+from utils.database import ConnectionPool
+
+def test_discarded_connection_wakes_a_waiter(tmp_path, run):
+    async def scenario():
+        pool = ConnectionPool(str(tmp_path / 'pool.db'), 1)
+        conn = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        # A connection whose rollback fails is closed instead of going back to the pool
+        await conn.execute("BEGIN")
+        async def broken_rollback():
+            raise RuntimeError("disk I/O error")
+        conn.rollback = broken_rollback
+        await pool.release(conn)
+
+        replacement = await asyncio.wait_for(waiter, 1)
+        assert replacement is not conn
+        assert pool.stats()['open'] == 1
+        await pool.release(replacement)
+        await pool.close()
+    run(scenario())
+
+def test_waiters_get_returned_connections_in_turn(tmp_path, run):
+    async def scenario():
+        pool = ConnectionPool(str(tmp_path / 'pool.db'), 2)
+
+        async def borrow():
+            async with pool.connection() as db:
+                await db.execute("SELECT 1")
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(asyncio.gather(*(borrow() for _ in range(10))), 5)
+        stats = pool.stats()
+        assert (stats['open'], stats['in_use'], stats['idle']) == (2, 0, 2)
+        assert stats['waits'] == 8
+        await pool.close()
+    run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+
+from utils.paypal import PayPalClient, PayPalError
+from tests.paypal_stub import PayPalStub
+
+async def _client(stub_kwargs=None, refresh_margin=120):
+    stub = await PayPalStub(**(stub_kwargs or {})).start()
+    client = PayPalClient('client-id', 'client-secret', stub.base_url, refresh_margin=refresh_margin)
+    return stub, client
+
+async def _close(stub, client):
+    await client.close()
+    await stub.close()
+
+def test_token_is_fetched_once_and_reused(run):
+    async def scenario():
+        stub, client = await _client()
+        try:
+            order = await client.create_order(5, "5 coins")
+            stub.orders[order['id']] = 'APPROVED'
+            assert await client.get_order_status(order['id']) == 'APPROVED'
+            assert await client.capture_order(order['id']) == 'COMPLETED'
+            assert await client.get_order_status(order['id']) == 'COMPLETED'
+            assert stub.calls['token'] == 1
+            stats = client.stats()
+            assert (stats['token_misses'], stats['token_hits']) == (1, 3)
+            assert set(stats['latency']) == {'token', 'create_order', 'get_order', 'capture_order'}
+            assert stats['latency']['get_order']['calls'] == 2
+        finally:
+            await _close(stub, client)
+    run(scenario())
+
+def test_concurrent_callers_share_one_refresh(run):
+    async def scenario():
+        stub, client = await _client({'token_delay': 0.05})
+        try:
+            stub.orders['ORDER-1'] = 'APPROVED'
+            statuses = await asyncio.gather(*(client.get_order_status('ORDER-1') for _ in range(20)))
+            assert statuses == ['APPROVED'] * 20
+            assert stub.calls['token'] == 1
+            assert client.stats()['token_misses'] == 1
+        finally:
+            await _close(stub, client)
+    run(scenario())
+
+def test_token_is_refreshed_before_it_expires(run):
+    async def scenario():
+        # A 1s token with a 0.5s margin is only reused for the first half second
+        stub, client = await _client({'expires_in': 1}, refresh_margin=0.5)
+        try:
+            stub.orders['ORDER-1'] = 'APPROVED'
+            await client.get_order_status('ORDER-1')
+            await client.get_order_status('ORDER-1')
+            assert stub.calls['token'] == 1
+            await asyncio.sleep(0.6)
+            await client.get_order_status('ORDER-1')
+            assert stub.calls['token'] == 2
+        finally:
+            await _close(stub, client)
+    run(scenario())
+
+def test_revoked_token_is_replaced_and_the_call_retried(run):
+    async def scenario():
+        stub, client = await _client()
+        try:
+            stub.orders['ORDER-1'] = 'APPROVED'
+            await client.get_order_status('ORDER-1')
+            stub.revoked.add(stub.current_token)
+            assert await client.get_order_status('ORDER-1') == 'APPROVED'
+            assert stub.calls['token'] == 2
+            assert stub.calls['get_order'] == 3
+        finally:
+            await _close(stub, client)
+    run(scenario())
+
+def test_token_failure_raises(run):
+    async def scenario():
+        stub, client = await _client()
+        stub.fail_token = True
+        try:
+            with pytest.raises(PayPalError):
+                await client.create_order(5, "5 coins")
+            assert stub.calls['create_order'] == 0
+        finally:
+            await _close(stub, client)
+    run(scenario())
+
+def test_one_session_is_reused(run):
+    async def scenario():
+        stub, client = await _client()
+        try:
+            stub.orders['ORDER-1'] = 'APPROVED'
+            await client.get_order_status('ORDER-1')
+            session = client._session
+            await client.capture_order('ORDER-1')
+            assert client._session is session
+        finally:
+            await _close(stub, client)
+        assert client._session.closed
+    run(scenario())
@@ -0,0 +1,182 @@
+"""Replays fixture Stripe and PayPal events against a running WebhookServer."""
+import asyncio
+import hashlib
+import hmac
+import socket
+import time
+from pathlib import Path
+
+import aiohttp
+import pytest
+
+from cogs.payments import Payments
+from utils.database import init_db, close_db, get_db
+from utils.paypal import PayPalClient
+from utils.user_cache import get_balance
+from utils.webhooks import WebhookServer
+from tests.paypal_stub import PayPalStub
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+STRIPE_SECRET = 'whsec_test_secret'
+PAYPAL_WEBHOOK_ID = 'WH-TEST'
+
+def fixture(name):
+    return (FIXTURES / name).read_text()
+
+def stripe_signature(payload, secret=STRIPE_SECRET, timestamp=None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def paypal_headers(signature='valid'):
+    return {
+        'paypal-auth-algo': 'SHA256withRSA',
+        'paypal-cert-url': 'https://api.paypal.com/v1/notifications/certs/CERT-TEST',
+        'paypal-transmission-id': 'transmission-1',
+        'paypal-transmission-sig': signature,
+        'paypal-transmission-time': '2024-06-10T12:00:00Z',
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class _User:
+    def __init__(self, dms):
+        self._dms = dms
+
+    async def send(self, embed):
+        self._dms.append(embed.description)
+
+class _Bot:
+    def __init__(self):
+        self.dms = []
+
+    def get_user(self, user_id):
+        return _User(self.dms)
+
+class Harness:
+    """Webhook server wired to Payments.credit_purchase, with PayPal served by the stub."""
+
+    async def __aenter__(self):
+        await init_db()
+        self.stub = await PayPalStub().start()
+        self.bot = _Bot()
+        self.payments = Payments(self.bot)
+        self.payments.paypal = PayPalClient('client-id', 'client-secret', self.stub.base_url)
+        port = free_port()
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = WebhookServer(
+            '127.0.0.1', port, self.payments.credit_purchase,
+            stripe_secret=STRIPE_SECRET, paypal=self.payments.paypal, paypal_webhook_id=PAYPAL_WEBHOOK_ID
+        )
+        self.task = asyncio.create_task(self.server.serve())
+        while not (self.server._server and self.server._server.started):
+            assert not self.task.done(), "webhook server failed to start"
+            await asyncio.sleep(0.01)
+        self.http = aiohttp.ClientSession()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.close()
+        self.server.stop()
+        await self.task
+        await self.payments.paypal.close()
+        await self.stub.close()
+        await close_db()
+
+    async def post(self, path, data, headers):
+        async with self.http.post(f"{self.url}{path}", data=data, headers=headers) as resp:
+            return resp.status
+
+    async def credited(self):
+        async with get_db() as db:
+            cursor = await db.execute("SELECT provider, payment_id, user_id, coins FROM processed_payments ORDER BY payment_id")
+            return await cursor.fetchall()
+
+@pytest.mark.usefixtures('scratch_db')
+def test_stripe_replays_credit_once(run):
+    async def scenario():
+        async with Harness() as h:
+            payload = fixture('stripe_checkout_session_completed.json')
+            for _ in range(3):
+                assert await h.post('/webhooks/stripe', payload, {'stripe-signature': stripe_signature(payload)}) == 200
+            assert await h.credited() == [('stripe', 'cs_test_a1B2c3D4e5F6', 424242, 10)]
+            assert await get_balance(424242) == 10
+            assert len(h.bot.dms) == 1
+            # The verify button racing the webhook is a no-op too
+            assert await h.payments.credit_purchase('stripe', 'cs_test_a1B2c3D4e5F6', 424242, 10, notify=False) is False
+            assert await get_balance(424242) == 10
+    run(scenario())
+
+@pytest.mark.usefixtures('scratch_db')
+def test_stripe_rejects_bad_signatures_and_ignores_unpaid_sessions(run):
+    async def scenario():
+        async with Harness() as h:
+            payload = fixture('stripe_checkout_session_completed.json')
+            assert await h.post('/webhooks/stripe', payload, {'stripe-signature': stripe_signature(payload, 'whsec_wrong')}) == 400
+            assert await h.post('/webhooks/stripe', payload, {}) == 400
+            stale = stripe_signature(payload, timestamp=int(time.time()) - 3600)
+            assert await h.post('/webhooks/stripe', payload, {'stripe-signature': stale}) == 400
+            unpaid = fixture('stripe_checkout_session_unpaid.json')
+            assert await h.post('/webhooks/stripe', unpaid, {'stripe-signature': stripe_signature(unpaid)}) == 200
+            assert await h.credited() == []
+            assert h.server.rejected == 3
+    run(scenario())
+
+@pytest.mark.usefixtures('scratch_db')
+def test_paypal_approval_and_capture_events_credit_once(run):
+    async def scenario():
+        async with Harness() as h:
+            h.stub.orders['ORDER-1'] = 'APPROVED'
+            approved = fixture('paypal_checkout_order_approved.json')
+            captured = fixture('paypal_payment_capture_completed.json')
+            headers = {**paypal_headers(), 'Content-Type': 'application/json'}
+            # PayPal sends both events for one checkout and may redeliver either
+            for payload in (approved, captured, approved, captured):
+                assert await h.post('/webhooks/paypal', payload, headers) == 200
+            assert h.stub.orders['ORDER-1'] == 'COMPLETED'
+            assert await h.credited() == [('paypal', 'ORDER-1', 515151, 20)]
+            assert await get_balance(515151) == 20
+            assert len(h.bot.dms) == 1
+    run(scenario())
+
+@pytest.mark.usefixtures('scratch_db')
+def test_paypal_rejects_unverified_events(run):
+    async def scenario():
+        async with Harness() as h:
+            h.stub.orders['ORDER-1'] = 'APPROVED'
+            payload = fixture('paypal_checkout_order_approved.json')
+            headers = {**paypal_headers('forged'), 'Content-Type': 'application/json'}
+            assert await h.post('/webhooks/paypal', payload, headers) == 400
+            assert h.stub.calls['capture_order'] == 0
+            assert h.stub.orders['ORDER-1'] == 'APPROVED'
+            assert await h.credited() == []
+    run(scenario())
+
+@pytest.mark.usefixtures('scratch_db')
+def test_paypal_rejects_malformed_bodies_and_custom_ids(run):
+    async def scenario():
+        async with Harness() as h:
+            h.stub.orders['ORDER-1'] = 'APPROVED'
+            headers = {**paypal_headers(), 'Content-Type': 'application/json'}
+            assert await h.post('/webhooks/paypal', '{not json', headers) == 400
+            assert await h.post('/webhooks/paypal', '[1, 2]', headers) == 400
+            bad = fixture('paypal_checkout_order_approved.json').replace('515151:20', 'someone:twenty')
+            assert await h.post('/webhooks/paypal', bad, headers) == 400
+            # The order is left uncaptured rather than taking money we can't credit
+            assert h.stub.calls['capture_order'] == 0
+            assert await h.credited() == []
+            assert h.server.rejected == 3
+    run(scenario())
+
+def test_port_in_use_disables_webhooks_without_exiting(run):
+    async def scenario():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            sock.listen()
+            server = WebhookServer('127.0.0.1', sock.getsockname()[1], None, stripe_secret=STRIPE_SECRET)
+            await server.serve()
+            assert server.failed
+    run(scenario())
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from utils.database import get_db
+from utils.constants import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+
+logger = logging.getLogger('music_battles.audio_cache')
+
+class AudioCache:
+    """Content-addressed on-disk store for submitted tracks.
+
+    Files live at <root>/<first two hex chars>/<sha256> and are indexed in the
+    audio_cache table, which also drives LRU eviction once the total size exceeds
+    `max_bytes`. Tracks entered in battles that haven't finished voting are pinned,
+    since starting those battles reads them back from the cache.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _write_atomic(self, path, fileobj):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temp file in the same directory and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(fileobj, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    async def put_file(self, fileobj, digest, size, filename=None):
+        """Store the contents of `fileobj`, whose sha256 hex digest is already known."""
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            fileobj.seek(0)
+            await asyncio.to_thread(self._write_atomic, path, fileobj)
+        async with get_db() as db:
+            await db.execute(
+                "INSERT INTO audio_cache (sha256, size, filename) VALUES (?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET last_access = CURRENT_TIMESTAMP",
+                (digest, size, filename)
+            )
+            await db.commit()
+        await self._evict()
+        return path
+
+    async def get(self, digest):
+        """Return (path, filename) for a cached track, or None on a miss."""
+        async with get_db() as db:
+            cursor = await db.execute("SELECT size, filename FROM audio_cache WHERE sha256 = ?", (digest,))
+            row = await cursor.fetchone()
+            path = self.path_for(digest)
+            if not row or not os.path.exists(path):
+                self.misses += 1
+                if row:
+                    await db.execute("DELETE FROM audio_cache WHERE sha256 = ?", (digest,))
+                    await db.commit()
+                return None
+            await db.execute("UPDATE audio_cache SET last_access = CURRENT_TIMESTAMP WHERE sha256 = ?", (digest,))
+            await db.commit()
+        self.hits += 1
+        self.bytes_saved += row[0]
+        return path, row[1]
+
+    async def _evict(self):
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache")
+            total = (await cursor.fetchone())[0]
+            if total <= self.max_bytes:
+                return
+            # The pinned set is small (entrants of open battles) and SQLite builds it once
+            cursor = await db.execute(
+                "SELECT sha256, size FROM audio_cache WHERE sha256 NOT IN ("
+                "SELECT e.track_sha256 FROM battles b JOIN entrants e ON e.battle_id = b.battle_id "
+                "WHERE b.status IN ('pending', 'active', 'voting') AND e.track_sha256 IS NOT NULL"
+                ") ORDER BY last_access, rowid"
+            )
+            evicted = []
+            async for digest, size in cursor:
+                if total <= self.max_bytes:
+                    break
+                evicted.append(digest)
+                total -= size
+            await db.executemany("DELETE FROM audio_cache WHERE sha256 = ?", [(d,) for d in evicted])
+            await db.commit()
+        if total > self.max_bytes:
+            logger.warning(f"Audio cache holds {total} bytes, over its {self.max_bytes} byte budget; the rest is pinned by open battles")
+        for digest in evicted:
+            try:
+                await asyncio.to_thread(os.remove, self.path_for(digest))
+            except FileNotFoundError:
+                pass
+        self.evictions += len(evicted)
+        logger.info(f"Evicted {len(evicted)} tracks from the audio cache")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes_saved': self.bytes_saved,
+            'evictions': self.evictions,
+        }
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import discord
+
+logger = logging.getLogger('music_battles.chatter')
+
+BULK_DELETE_LIMIT = 100
+
+def _retry_after(error):
+    """Seconds Discord asked us to wait, or None if this wasn't a rate-limit response."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    if isinstance(error, discord.HTTPException) and error.status == 429:
+        try:
+            return float(error.response.headers.get('Retry-After', 1))
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    return None
+
+class ChatterSweeper:
+    """Deletes user messages from pool channels in per-channel bulk batches.
+
+    Message ids collect for `window` seconds after the first one arrives, then go out
+    in bulk-delete calls of up to 100. A rate-limit response puts the unsent ids back
+    and stretches that channel's window (up to `max_backoff`) until a call succeeds.
+    """
+
+    def __init__(self, window=2.0, max_backoff=60.0):
+        self.window = window
+        self.max_backoff = max_backoff
+        self._queues = {}  # channel_id -> [message_id]
+        self._channels = {}
+        self._tasks = {}
+        self._backoff = {}  # channel_id -> seconds, only while rate limited
+        self.queued = 0
+        self.deleted = 0
+        self.api_calls = 0
+        self.coalesced = 0  # deletes that shared a call with another message
+        self.rate_limited = 0
+        self.dropped = 0
+
+    @property
+    def depth(self):
+        return sum(len(ids) for ids in self._queues.values())
+
+    def enqueue(self, message):
+        channel_id = message.channel.id
+        self._queues.setdefault(channel_id, []).append(message.id)
+        self._channels[channel_id] = message.channel
+        self.queued += 1
+        if channel_id not in self._tasks:
+            self._tasks[channel_id] = asyncio.create_task(self._drain(channel_id))
+
+    async def _drain(self, channel_id):
+        swept = calls = 0
+        try:
+            while self._queues.get(channel_id):
+                await asyncio.sleep(self._backoff.get(channel_id, self.window))
+                ids = self._queues.pop(channel_id, [])
+                channel = self._channels[channel_id]
+                for i in range(0, len(ids), BULK_DELETE_LIMIT):
+                    chunk = ids[i:i + BULK_DELETE_LIMIT]
+                    try:
+                        calls += 1
+                        self.api_calls += 1
+                        await channel.delete_messages([discord.Object(id=m) for m in chunk], reason="Pool channel chatter")
+                    except discord.NotFound:
+                        # Single deletes only: the author already removed it
+                        pass
+                    except discord.Forbidden:
+                        logger.warning(f"Permission denied deleting messages in {channel}")
+                        self.dropped += len(ids) - i
+                        break
+                    except (discord.RateLimited, discord.HTTPException) as e:
+                        retry_after = _retry_after(e)
+                        if retry_after is None:
+                            logger.error(f"Failed to delete {len(chunk)} messages in {channel}: {e}")
+                            self.dropped += len(chunk)
+                            continue
+                        self.rate_limited += 1
+                        self._queues[channel_id] = ids[i:] + self._queues.get(channel_id, [])
+                        backoff = max(retry_after, 2 * self._backoff.get(channel_id, self.window))
+                        self._backoff[channel_id] = min(backoff, self.max_backoff)
+                        logger.warning(f"Rate limited deleting chatter in {channel}; retrying "
+                                       f"{len(self._queues[channel_id])} messages in {self._backoff[channel_id]:.1f}s")
+                        break
+                    else:
+                        swept += len(chunk)
+                        self.deleted += len(chunk)
+                        self.coalesced += len(chunk) - 1
+                else:
+                    self._backoff.pop(channel_id, None)
+        except Exception as e:
+            logger.error(f"Chatter sweep for channel {channel_id} failed: {e}")
+            self.dropped += len(self._queues.pop(channel_id, []))
+        finally:
+            self._tasks.pop(channel_id, None)
+            if not self._queues.get(channel_id):
+                self._channels.pop(channel_id, None)
+                self._backoff.pop(channel_id, None)
+        if swept > calls:
+            logger.info(f"Swept {swept} messages from channel {channel_id} in {calls} API calls")
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'queued': self.queued,
+            'deleted': self.deleted,
+            'api_calls': self.api_calls,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,136 @@
+import logging
+import time
+from utils.database import get_db
+from utils.user_cache import user_cache
+
+logger = logging.getLogger('music_battles.coins')
+
+# Reason codes recorded with every balance movement
+REASON_OPENING = 'opening_balance'
+REASON_PURCHASE = 'purchase'
+REASON_ENTRY_FEE = 'entry_fee'
+REASON_REFUND = 'refund'
+REASON_PAYOUT = 'payout'
+REASON_ADMIN_GRANT = 'admin_grant'
+
+async def apply_coins(db, user_id, delta, reason, reference=None):
+    """Change a user's balance and journal the movement, inside the caller's transaction.
+
+    Every coin mutation goes through here so users.coins always equals the journal total.
+    Commit with database.commit(db) so the cached balance is written through.
+    """
+    cursor = await db.execute("UPDATE users SET coins = coins + ? WHERE user_id = ? RETURNING coins", (delta, user_id))
+    row = await cursor.fetchone()
+    if row is not None:
+        user_cache.stage(db, user_id, row[0])
+    await db.execute(
+        "INSERT INTO coin_transactions (user_id, delta, reason, reference) VALUES (?, ?, ?, ?)",
+        (user_id, delta, reason, reference)
+    )
+
+async def debit_coins(db, user_id, amount, reason, reference=None):
+    """Take `amount` coins only if the balance covers it. Returns the new balance, or None.
+
+    The balance check and the deduction are one statement, so concurrent debits can't
+    overdraw an account.
+    """
+    cursor = await db.execute(
+        "UPDATE users SET coins = coins - ? WHERE user_id = ? AND coins >= ? RETURNING coins",
+        (amount, user_id, amount)
+    )
+    row = await cursor.fetchone()
+    if row is None:
+        return None
+    user_cache.stage(db, user_id, row[0])
+    await db.execute(
+        "INSERT INTO coin_transactions (user_id, delta, reason, reference) VALUES (?, ?, ?, ?)",
+        (user_id, -amount, reason, reference)
+    )
+    return row[0]
+
+async def take_snapshots():
+    """Roll every user's snapshot forward to the newest journal entry. Returns users updated.
+
+    Only entries after each user's previous snapshot are summed, so the cost tracks recent
+    activity rather than the size of the journal.
+    """
+    async with get_db() as db:
+        cursor = await db.execute("SELECT MAX(txn_id) FROM coin_transactions")
+        high = (await cursor.fetchone())[0]
+        if high is None:
+            return 0
+        cursor = await db.execute(
+            """
+            INSERT INTO coin_snapshots (user_id, txn_id, balance)
+            SELECT t.user_id, MAX(t.txn_id), COALESCE(s.balance, 0) + SUM(t.delta)
+            FROM coin_transactions t
+            LEFT JOIN coin_snapshots s ON s.user_id = t.user_id
+            WHERE t.txn_id > COALESCE(s.txn_id, 0) AND t.txn_id <= ?
+            GROUP BY t.user_id
+            ON CONFLICT(user_id) DO UPDATE SET
+                txn_id = excluded.txn_id, balance = excluded.balance, taken_at = CURRENT_TIMESTAMP
+            """,
+            (high,)
+        )
+        await db.commit()
+        return cursor.rowcount
+
+async def check_integrity(full=False):
+    """Compare balances with the journal and return a report of any mismatches.
+
+    The default check adds the journal tail after each snapshot to the snapshot balance.
+    `full=True` replays the whole journal in one grouped pass instead, and also checks that
+    every snapshot equals the journal total up to its txn_id.
+    """
+    started = time.perf_counter()
+    async with get_db() as db:
+        if full:
+            balance_sql = """
+                SELECT u.user_id, u.coins, COALESCE(j.total, 0)
+                FROM users u
+                LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM coin_transactions GROUP BY user_id) j
+                    ON j.user_id = u.user_id
+                WHERE u.coins != COALESCE(j.total, 0)
+            """
+        else:
+            balance_sql = """
+                SELECT u.user_id, u.coins, COALESCE(s.balance, 0) + COALESCE(
+                    (SELECT SUM(t.delta) FROM coin_transactions t
+                     WHERE t.user_id = u.user_id AND t.txn_id > COALESCE(s.txn_id, 0)), 0) AS expected
+                FROM users u
+                LEFT JOIN coin_snapshots s ON s.user_id = u.user_id
+                WHERE u.coins != expected
+            """
+        cursor = await db.execute(balance_sql)
+        balance_mismatches = await cursor.fetchall()
+
+        snapshot_mismatches = []
+        if full:
+            # Journal total up to a snapshot = full total minus the entries after it
+            cursor = await db.execute(
+                """
+                SELECT s.user_id, s.balance, COALESCE(j.total, 0) - COALESCE(
+                    (SELECT SUM(t.delta) FROM coin_transactions t
+                     WHERE t.user_id = s.user_id AND t.txn_id > s.txn_id), 0) AS expected
+                FROM coin_snapshots s
+                LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM coin_transactions GROUP BY user_id) j
+                    ON j.user_id = s.user_id
+                WHERE s.balance != expected
+                """
+            )
+            snapshot_mismatches = await cursor.fetchall()
+
+        cursor = await db.execute("SELECT COUNT(*) FROM coin_transactions")
+        journal_rows = (await cursor.fetchone())[0]
+
+    report = {
+        'full': full,
+        'journal_rows': journal_rows,
+        'balance_mismatches': balance_mismatches,
+        'snapshot_mismatches': snapshot_mismatches,
+        'seconds': time.perf_counter() - started,
+    }
+    if balance_mismatches or snapshot_mismatches:
+        logger.warning(f"Coin integrity check found {len(balance_mismatches)} balance and "
+                       f"{len(snapshot_mismatches)} snapshot mismatches")
+    return report
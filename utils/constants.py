@@ -14,6 +14,58 @@ PLATFORM_FEE_PERCENT = 0.30
 WINNER_PAYOUT_PERCENT = 0.70
 VOTING_DURATION_HOURS = 24
 
+# How people vote on submissions: 'reactions' (✅) or 'buttons' (a Vote button with ephemeral
+# feedback). Pick one per deployment; reaction votes are ignored in button mode.
+VOTING_MODE = os.getenv('VOTING_MODE', 'reactions').lower()
+
+# Reaction votes are held in memory and written to the votes table in batches this often
+VOTE_FLUSH_SECONDS = float(os.getenv('VOTE_FLUSH_SECONDS', '2'))
+
+# How long a rejected reaction is remembered, so its removal event and replayed adds are ignored
+REACTION_REJECT_TTL_SECONDS = float(os.getenv('REACTION_REJECT_TTL_SECONDS', '30'))
+
+# Repairing votes from reactions after downtime: concurrent message scans and API calls per run
+REACTION_RECONCILE_CONCURRENCY = int(os.getenv('REACTION_RECONCILE_CONCURRENCY', '4'))
+REACTION_RECONCILE_MAX_CALLS = int(os.getenv('REACTION_RECONCILE_MAX_CALLS', '500'))
+# Every voter's reactions are re-read this often, catching offline adds and removes that cancelled out
+REACTION_RECONCILE_FULL_HOURS = float(os.getenv('REACTION_RECONCILE_FULL_HOURS', '6'))
+
+# A failed voting close (Discord or DB error) is retried after this delay, doubling up to the maximum
+VOTING_CLOSE_RETRY_SECONDS = float(os.getenv('VOTING_CLOSE_RETRY_SECONDS', '30'))
+VOTING_CLOSE_MAX_RETRY_SECONDS = float(os.getenv('VOTING_CLOSE_MAX_RETRY_SECONDS', '900'))
+
+# Background job workers (channel deletion, announcement cleanup, results fan-out)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '3'))
+# How long a finished voting channel stays up so people can see the results
+VOTING_CHANNEL_TTL_SECONDS = int(os.getenv('VOTING_CHANNEL_TTL_SECONDS', '300'))
+
+# Opening a battle: parallel track downloads and the per-download timeout
+TRACK_FETCH_CONCURRENCY = int(os.getenv('TRACK_FETCH_CONCURRENCY', '4'))
+TRACK_FETCH_TIMEOUT_SECONDS = float(os.getenv('TRACK_FETCH_TIMEOUT_SECONDS', '60'))
+
+# Local content-addressed copy of every submitted track
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', 'audio_cache')
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+# Streaming media relay: per-file upload limit, total RAM for in-flight transfers,
+# and how much of each file is kept in memory before spilling to a temp file
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', str(25 * 1024 ** 2)))
+MEDIA_MEMORY_BUDGET_BYTES = int(os.getenv('MEDIA_MEMORY_BUDGET_BYTES', str(32 * 1024 ** 2)))
+MEDIA_SPOOL_BYTES = int(os.getenv('MEDIA_SPOOL_BYTES', str(1024 ** 2)))
+
+# Live stats: changes are coalesced for this long before the board is re-published
+LIVE_STATS_DEBOUNCE_SECONDS = float(os.getenv('LIVE_STATS_DEBOUNCE_SECONDS', '10'))
+# Post one live-stats message per genre so only the changed genre gets edited
+LIVE_STATS_PER_GENRE = os.getenv('LIVE_STATS_PER_GENRE', 'false').lower() == 'true'
+
+# User messages in pool channels are collected this long, then removed with bulk deletes;
+# rate limits stretch the wait up to the maximum
+CHATTER_DELETE_WINDOW_SECONDS = float(os.getenv('CHATTER_DELETE_WINDOW_SECONDS', '2'))
+CHATTER_MAX_BACKOFF_SECONDS = float(os.getenv('CHATTER_MAX_BACKOFF_SECONDS', '60'))
+
+# /setup_server and /delete_setup: how many Discord API calls run at once (rate limits still apply)
+PROVISION_CONCURRENCY = int(os.getenv('PROVISION_CONCURRENCY', '5'))
+
 # Colors
 COLOR_SUCCESS = int(os.getenv('COLOR_SUCCESS', '0x00FF00'), 16)
 COLOR_ERROR = int(os.getenv('COLOR_ERROR', '0xFF0000'), 16)
@@ -25,9 +77,33 @@ VOTER_ROLE_NAME = os.getenv('VOTER_ROLE_NAME', 'Voter')
 
 # Stripe
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 
 # PayPal
 PAYPAL_CLIENT_ID = os.getenv('PAYPAL_CLIENT_ID')
 PAYPAL_CLIENT_SECRET = os.getenv('PAYPAL_CLIENT_SECRET')
 PAYPAL_MODE = os.getenv('PAYPAL_MODE', 'live').lower()
-PAYPAL_API_BASE = "https://api-m.paypal.com" if PAYPAL_MODE == 'live' else "https://api-m.sandbox.paypal.com"
+# PAYPAL_API_BASE overrides the mode's endpoint, e.g. to point at a local stand-in server
+PAYPAL_API_BASE = os.getenv('PAYPAL_API_BASE') or ("https://api-m.paypal.com" if PAYPAL_MODE == 'live' else "https://api-m.sandbox.paypal.com")
+PAYPAL_WEBHOOK_ID = os.getenv('PAYPAL_WEBHOOK_ID')
+
+# Background re-checks of checkouts that were started but never confirmed
+RECONCILE_INTERVAL_SECONDS = int(os.getenv('RECONCILE_INTERVAL_SECONDS', '60'))
+RECONCILE_BATCH_SIZE = int(os.getenv('RECONCILE_BATCH_SIZE', '50'))
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '5'))
+RECONCILE_RATE_PER_SECOND = float(os.getenv('RECONCILE_RATE_PER_SECOND', '5'))
+# Stripe checkout sessions expire after 24 hours; stop checking after that
+PURCHASE_EXPIRE_HOURS = int(os.getenv('PURCHASE_EXPIRE_HOURS', '24'))
+
+# How often each user's coin snapshot is rolled forward to the latest journal entry
+COIN_SNAPSHOT_MINUTES = int(os.getenv('COIN_SNAPSHOT_MINUTES', '60'))
+
+# How often cache, client and pool stats are written to the log
+STATS_LOG_MINUTES = int(os.getenv('STATS_LOG_MINUTES', '60'))
+
+# In-process LRU of user balances; /balance is answered from here when cached
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+
+# Payment webhook receiver; only started when a Stripe secret or PayPal webhook id is configured
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
@@ -1,89 +1,624 @@
 import aiosqlite
+import asyncio
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger('music_battles.database')
 
 DB_PATH = 'music_battles.db'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                coins INTEGER DEFAULT 0
-            )
-        ''')
-        
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS battles (
-                battle_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                genre TEXT,
-                pool_amount REAL,
-                status TEXT, -- 'pending', 'active', 'voting', 'completed'
-                battle_channel_id INTEGER,
-                voting_channel_id INTEGER,
-                voting_ends_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS entrants (
-                entrant_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                battle_id INTEGER,
-                user_id INTEGER,
-                track_link TEXT,
-                payment_status TEXT, -- 'pending', 'paid'
-                stripe_session_id TEXT,
-                paypal_order_id TEXT,
-                submission_message_id INTEGER,
-                announcement_message_id INTEGER,
-                disqualified INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (battle_id) REFERENCES battles (battle_id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Migration: Add announcement_message_id if it doesn't exist
+# Applied to every pooled connection when it is opened.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # ~16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped I/O
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Connection -> [(on_commit, on_abort)] registered with after_commit() in the open transaction
+_commit_hooks = {}
+
+def after_commit(db, on_commit, on_abort=None):
+    """Run `on_commit` once the current transaction on `db` commits through commit(db).
+
+    If it is rolled back instead, or the connection goes back to the pool without commit(db),
+    `on_abort` runs. Used to keep in-process caches in step with committed data only.
+    """
+    _commit_hooks.setdefault(db, []).append((on_commit, on_abort))
+
+def _run_hooks(db, committed):
+    for on_commit, on_abort in _commit_hooks.pop(db, ()):
+        callback = on_commit if committed else on_abort
+        if callback is None:
+            continue
         try:
-            await db.execute("ALTER TABLE entrants ADD COLUMN announcement_message_id INTEGER")
-            await db.commit()
-        except aiosqlite.OperationalError:
-            # Column already exists
-            pass
-            
-        # Migration: Add created_at to entrants if it doesn't exist
+            callback()
+        except Exception as e:
+            logger.error(f"After-commit hook failed: {e}")
+
+async def commit(db):
+    """Commit and fire the hooks registered on this transaction."""
+    try:
+        await db.commit()
+    except Exception:
+        _run_hooks(db, committed=False)
+        raise
+    _run_hooks(db, committed=True)
+
+async def rollback(db):
+    await db.rollback()
+    _run_hooks(db, committed=False)
+
+class ConnectionPool:
+    """Bounded pool of long-lived, pre-configured aiosqlite connections."""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = asyncio.LifoQueue()
+        # Notified whenever a connection goes back to the pool or a slot is freed
+        self._available = asyncio.Condition()
+        self._open_count = 0
+        self._in_use = 0
+        self._acquisitions = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def _open(self):
+        conn = await aiosqlite.connect(self.path)
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    async def acquire(self):
+        self._acquisitions += 1
+        started = None
+        while True:
+            if not self._idle.empty():
+                conn = self._idle.get_nowait()
+                break
+            if self._open_count < self.size:
+                # Reserve the slot before awaiting so concurrent callers can't overshoot the bound
+                self._open_count += 1
+                try:
+                    conn = await self._open()
+                except Exception:
+                    self._open_count -= 1
+                    await self._notify()
+                    raise
+                break
+            if started is None:
+                self._waits += 1
+                started = time.perf_counter()
+            # Wake up for a returned connection or for a slot freed by a discarded one
+            async with self._available:
+                while self._idle.empty() and self._open_count >= self.size:
+                    await self._available.wait()
+        if started is not None:
+            waited = time.perf_counter() - started
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        self._in_use += 1
+        return conn
+
+    async def _notify(self):
+        async with self._available:
+            self._available.notify()
+
+    async def release(self, conn):
+        self._in_use -= 1
+        # Anything not committed through commit() is treated as aborted
+        _run_hooks(conn, committed=False)
         try:
-            await db.execute("ALTER TABLE entrants ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            await db.commit()
-        except aiosqlite.OperationalError:
-            # Column already exists
-            pass
-        
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS votes (
-                vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                battle_id INTEGER,
-                voter_id INTEGER,
-                entrant_id INTEGER,
-                FOREIGN KEY (battle_id) REFERENCES battles (battle_id),
-                FOREIGN KEY (voter_id) REFERENCES users (user_id),
-                FOREIGN KEY (entrant_id) REFERENCES entrants (entrant_id),
-                UNIQUE(battle_id, voter_id)
-            )
-        ''')
-        
+            # Callers that returned early without committing must not leak their writes
+            # into the next borrower's transaction.
+            if conn.in_transaction:
+                await conn.rollback()
+        except Exception as e:
+            logger.error(f"Discarding broken pooled connection: {e}")
+            self._open_count -= 1
+            try:
+                await conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put_nowait(conn)
+        await self._notify()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def close(self):
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            self._open_count -= 1
+            await conn.close()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'open': self._open_count,
+            'in_use': self._in_use,
+            'idle': self._idle.qsize(),
+            'acquisitions': self._acquisitions,
+            'waits': self._waits,
+            'total_wait_seconds': self._total_wait,
+            'avg_wait_seconds': self._total_wait / self._waits if self._waits else 0.0,
+            'max_wait_seconds': self._max_wait,
+        }
+
+_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+
+async def _add_column_if_missing(db, table, column, declaration):
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+async def _migration_001_base_schema(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            coins INTEGER DEFAULT 0
+        )
+    ''')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS battles (
+            battle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            genre TEXT,
+            pool_amount REAL,
+            status TEXT, -- 'pending', 'active', 'voting', 'completed'
+            battle_channel_id INTEGER,
+            voting_channel_id INTEGER,
+            voting_ends_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS entrants (
+            entrant_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            battle_id INTEGER,
+            user_id INTEGER,
+            track_link TEXT,
+            payment_status TEXT, -- 'pending', 'paid'
+            stripe_session_id TEXT,
+            paypal_order_id TEXT,
+            submission_message_id INTEGER,
+            announcement_message_id INTEGER,
+            disqualified INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (battle_id) REFERENCES battles (battle_id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Databases created before these columns existed. SQLite can't ADD COLUMN with a
+    # CURRENT_TIMESTAMP default, so legacy rows get a NULL created_at.
+    await _add_column_if_missing(db, 'entrants', 'announcement_message_id', 'INTEGER')
+    await _add_column_if_missing(db, 'entrants', 'created_at', 'TIMESTAMP')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            vote_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            battle_id INTEGER,
+            voter_id INTEGER,
+            entrant_id INTEGER,
+            FOREIGN KEY (battle_id) REFERENCES battles (battle_id),
+            FOREIGN KEY (voter_id) REFERENCES users (user_id),
+            FOREIGN KEY (entrant_id) REFERENCES entrants (entrant_id),
+            UNIQUE(battle_id, voter_id)
+        )
+    ''')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS pool_totals (
+            genre TEXT,
+            pool_type REAL,
+            total_amount REAL DEFAULT 0,
+            entrant_count INTEGER DEFAULT 0,
+            PRIMARY KEY (genre, pool_type)
+        )
+    ''')
+
+async def _migration_002_hot_query_indexes(db):
+    # Reaction routing: entrants by submission OR announcement message id
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_entrants_submission_msg ON entrants (submission_message_id, battle_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_entrants_announcement_msg ON entrants (announcement_message_id, battle_id)")
+    # Voting deadline sweep: battles by status, voting_ends_at
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_battles_status_ends ON battles (status, voting_ends_at, voting_channel_id, genre, pool_amount)")
+    # Pending/live battle lookup per genre pool
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_battles_genre_pool_status ON battles (genre, pool_amount, status, created_at)")
+    # 24h entry restriction: entrants by user and entry time
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_entrants_user_created ON entrants (user_id, created_at, battle_id)")
+    # Entrant lists per battle
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_entrants_battle ON entrants (battle_id, payment_status, disqualified)")
+    # Vote removal and per-entrant tallies
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_votes_entrant ON votes (entrant_id, voter_id)")
+
+async def _migration_003_stats_messages(db):
+    # One row per published live-stats message; section is '' for the combined board
+    # or the genre name when the board is split per genre.
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS stats_messages (
+            guild_id INTEGER,
+            section TEXT,
+            channel_id INTEGER,
+            message_id INTEGER,
+            content_hash TEXT,
+            PRIMARY KEY (guild_id, section)
+        )
+    ''')
+
+async def _migration_004_jobs(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT,
+            payload TEXT,
+            run_at TIMESTAMP,
+            status TEXT DEFAULT 'pending', -- 'pending', 'running', 'failed'
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)")
+
+async def _migration_005_audio_cache(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS audio_cache (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER,
+            filename TEXT,
+            last_access TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_last_access ON audio_cache (last_access)")
+    await _add_column_if_missing(db, 'entrants', 'track_sha256', 'TEXT')
+
+async def _migration_006_processed_payments(db):
+    # One row per credited checkout; the primary key makes crediting idempotent
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS processed_payments (
+            payment_id TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            coins INTEGER NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+async def _migration_007_pending_purchases(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS pending_purchases (
+            payment_id TEXT PRIMARY KEY,
+            provider TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            coins INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_check_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_pending_purchases_status_next ON pending_purchases (status, next_check_at)")
+
+async def _migration_008_coin_journal(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS coin_transactions (
+            txn_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            reference TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Covering index: per-user sums and snapshot tails are answered without touching the table
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_coin_transactions_user ON coin_transactions (user_id, txn_id, delta)")
+    # The journal is append-only; corrections are new entries, never edits
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS coin_transactions_no_update BEFORE UPDATE ON coin_transactions
+        BEGIN SELECT RAISE(ABORT, 'coin_transactions is append-only'); END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS coin_transactions_no_delete BEFORE DELETE ON coin_transactions
+        BEGIN SELECT RAISE(ABORT, 'coin_transactions is append-only'); END
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS coin_snapshots (
+            user_id INTEGER PRIMARY KEY,
+            txn_id INTEGER NOT NULL,
+            balance INTEGER NOT NULL,
+            taken_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Balances that predate the journal become opening entries so the totals line up
+    await db.execute(
+        "INSERT INTO coin_transactions (user_id, delta, reason, reference) "
+        "SELECT user_id, coins, 'opening_balance', 'migration:8' FROM users WHERE coins != 0"
+    )
+
+async def _migration_009_atomic_entries(db):
+    # Fold any duplicate pending battles into the oldest one before enforcing uniqueness
+    cursor = await db.execute(
+        "SELECT genre, pool_amount, MIN(battle_id) FROM battles WHERE status = 'pending' "
+        "GROUP BY genre, pool_amount HAVING COUNT(*) > 1"
+    )
+    for genre, pool_amount, keeper in await cursor.fetchall():
+        await db.execute(
+            "UPDATE entrants SET battle_id = ? WHERE battle_id IN "
+            "(SELECT battle_id FROM battles WHERE genre = ? AND pool_amount = ? AND status = 'pending' AND battle_id != ?)",
+            (keeper, genre, pool_amount, keeper)
+        )
+        await db.execute(
+            "DELETE FROM battles WHERE genre = ? AND pool_amount = ? AND status = 'pending' AND battle_id != ?",
+            (genre, pool_amount, keeper)
+        )
+    await db.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_battles_one_pending ON battles (genre, pool_amount) WHERE status = 'pending'"
+    )
+
+    # Last entry per (user, genre, pool) for the 24h cooldown, instead of joining entrants to battles
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS entry_cooldowns (
+            user_id INTEGER NOT NULL,
+            genre TEXT NOT NULL,
+            pool_amount REAL NOT NULL,
+            last_entry_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, genre, pool_amount)
+        )
+    ''')
+    await db.execute(
+        "INSERT OR REPLACE INTO entry_cooldowns (user_id, genre, pool_amount, last_entry_at) "
+        "SELECT e.user_id, b.genre, b.pool_amount, MAX(e.created_at) FROM entrants e "
+        "JOIN battles b ON e.battle_id = b.battle_id WHERE e.created_at IS NOT NULL "
+        "GROUP BY e.user_id, b.genre, b.pool_amount"
+    )
+
+async def _migration_010_battle_results(db):
+    from utils.constants import WINNER_PAYOUT_PERCENT, PLATFORM_FEE_PERCENT
+    # Written once at settlement; only the paid_out flag may change afterwards
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS battle_results (
+            battle_id INTEGER PRIMARY KEY,
+            genre TEXT NOT NULL,
+            pool_amount REAL NOT NULL,
+            winner_entrant_id INTEGER,
+            winner_user_id INTEGER,
+            winner_name TEXT,
+            winner_votes INTEGER NOT NULL DEFAULT 0,
+            total_votes INTEGER NOT NULL DEFAULT 0,
+            entrant_count INTEGER NOT NULL DEFAULT 0,
+            total_pool REAL NOT NULL DEFAULT 0,
+            payout REAL NOT NULL DEFAULT 0,
+            payout_coins INTEGER NOT NULL DEFAULT 0,
+            fee REAL NOT NULL DEFAULT 0,
+            paid_out INTEGER NOT NULL DEFAULT 0,
+            settled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS battle_results_immutable
+        BEFORE UPDATE OF battle_id, genre, pool_amount, winner_entrant_id, winner_user_id, winner_name, winner_votes,
+            total_votes, entrant_count, total_pool, payout, payout_coins, fee, settled_at ON battle_results
+        BEGIN SELECT RAISE(ABORT, 'battle_results rows are immutable'); END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS battle_results_no_delete BEFORE DELETE ON battle_results
+        BEGIN SELECT RAISE(ABORT, 'battle_results rows are immutable'); END
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_battle_results_unpaid ON battle_results (paid_out, battle_id)")
+
+    # Backfill completed battles: tally votes once and rank within each battle, keyed by
+    # battle so the join below is a lookup. Winners were already credited coins at settlement,
+    # but nothing recorded the cash payout, so every backfilled winner starts out owed.
+    await db.execute("CREATE TEMP TABLE backfill_winners (battle_id INTEGER PRIMARY KEY, entrant_id INTEGER, votes INTEGER, total INTEGER)")
+    await db.execute(
+        """
+        INSERT INTO backfill_winners (battle_id, entrant_id, votes, total)
+        SELECT battle_id, entrant_id, n, total FROM (
+            SELECT battle_id, entrant_id, n, SUM(n) OVER (PARTITION BY battle_id) AS total,
+                   ROW_NUMBER() OVER (PARTITION BY battle_id ORDER BY n DESC, entrant_id) AS rn
+            FROM (SELECT battle_id, entrant_id, COUNT(*) AS n FROM votes GROUP BY battle_id, entrant_id)
+        ) WHERE rn = 1
+        """
+    )
+    await db.execute(
+        """
+        INSERT OR IGNORE INTO battle_results (
+            battle_id, genre, pool_amount, winner_entrant_id, winner_user_id, winner_name, winner_votes,
+            total_votes, entrant_count, total_pool, payout, payout_coins, fee, paid_out, settled_at
+        )
+        SELECT battle_id, genre, pool_amount, entrant_id, user_id, username, COALESCE(votes, 0), COALESCE(total, 0),
+               paid, paid * pool_amount,
+               CASE WHEN entrant_id IS NULL THEN 0 ELSE paid * pool_amount * ? END,
+               CASE WHEN entrant_id IS NULL THEN 0 ELSE CAST(paid * pool_amount * ? AS INTEGER) END,
+               paid * pool_amount * ?, 0, settled_at
+        FROM (
+            SELECT b.battle_id, b.genre, b.pool_amount, w.entrant_id, e.user_id, u.username, w.votes, w.total,
+                   (SELECT COUNT(*) FROM entrants p WHERE p.battle_id = b.battle_id AND p.payment_status = 'paid') AS paid,
+                   COALESCE(b.voting_ends_at, b.created_at, CURRENT_TIMESTAMP) AS settled_at
+            FROM battles b
+            LEFT JOIN backfill_winners w ON w.battle_id = b.battle_id
+            LEFT JOIN entrants e ON e.entrant_id = w.entrant_id
+            LEFT JOIN users u ON u.user_id = e.user_id
+            WHERE b.status = 'completed'
+        )
+        """,
+        (WINNER_PAYOUT_PERCENT, WINNER_PAYOUT_PERCENT, PLATFORM_FEE_PERCENT)
+    )
+    await db.execute("DROP TABLE backfill_winners")
+
+async def _migration_011_guild_resources(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS guild_resources (
+            guild_id INTEGER NOT NULL,
+            kind TEXT NOT NULL, -- 'pool', 'channel', 'category', 'role'
+            name TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, kind, name)
+        )
+    ''')
+
+async def _migration_012_reaction_checkpoints(db):
+    # ✅ reactor count per tracked message as of the last reaction reconciliation
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS reaction_checkpoints (
+            message_id INTEGER PRIMARY KEY,
+            battle_id INTEGER NOT NULL,
+            reactors INTEGER NOT NULL,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reaction_checkpoints_battle ON reaction_checkpoints (battle_id)")
+
+# Ordered schema migrations. Append new steps to the end; never edit one that has shipped.
+MIGRATIONS = [
+    (1, "base schema", _migration_001_base_schema),
+    (2, "hot query indexes", _migration_002_hot_query_indexes),
+    (3, "live stats message ids", _migration_003_stats_messages),
+    (4, "post-settlement job queue", _migration_004_jobs),
+    (5, "audio cache index", _migration_005_audio_cache),
+    (6, "processed payments", _migration_006_processed_payments),
+    (7, "pending purchases", _migration_007_pending_purchases),
+    (8, "coin journal and snapshots", _migration_008_coin_journal),
+    (9, "atomic entries", _migration_009_atomic_entries),
+    (10, "battle results", _migration_010_battle_results),
+    (11, "guild resource registry", _migration_011_guild_resources),
+    (12, "reaction checkpoints", _migration_012_reaction_checkpoints),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Hot query shapes that must be served by an index. Checked with EXPLAIN QUERY PLAN
+# whenever migrations run.
+HOT_QUERIES = {
+    'voting_deadlines': (
+        "SELECT battle_id, voting_ends_at FROM battles WHERE status = 'voting'",
+        (),
+    ),
+    'entry_cooldown': (
+        "SELECT 1 FROM entry_cooldowns WHERE user_id = ? AND genre = ? AND pool_amount = ? "
+        "AND last_entry_at > datetime('now', '-24 hours')",
+        (0, '', 0.0),
+    ),
+    'pending_battle': (
+        "SELECT battle_id FROM battles WHERE genre = ? AND pool_amount = ? AND status = 'pending'",
+        ('', 0.0),
+    ),
+    'battle_entrants': (
+        "SELECT e.entrant_id, u.username, e.track_link, e.track_sha256 FROM entrants e JOIN users u ON e.user_id = u.user_id "
+        "WHERE e.battle_id = ? AND e.payment_status = 'paid' AND e.disqualified = 0",
+        (0,),
+    ),
+    'user_balance': (
+        "SELECT coins FROM users WHERE user_id = ?",
+        (0,),
+    ),
+    'due_purchases': (
+        "SELECT payment_id FROM pending_purchases WHERE status = 'pending' AND next_check_at <= ? ORDER BY next_check_at LIMIT 50",
+        ('',),
+    ),
+    'payouts_page': (
+        "SELECT battle_id FROM battle_results WHERE battle_id < ? AND winner_user_id IS NOT NULL "
+        "ORDER BY battle_id DESC LIMIT 10",
+        (0,),
+    ),
+    'unpaid_payouts_page': (
+        "SELECT battle_id FROM battle_results WHERE paid_out = 0 AND battle_id < ? AND winner_user_id IS NOT NULL "
+        "ORDER BY battle_id DESC LIMIT 10",
+        (0,),
+    ),
+    'due_job': (
+        "SELECT job_id FROM jobs WHERE status = 'pending' AND run_at <= ? ORDER BY run_at, job_id LIMIT 1",
+        ('',),
+    ),
+    'vote_flush_delete': (
+        "DELETE FROM votes WHERE battle_id = ? AND voter_id = ?",
+        (0, 0),
+    ),
+    'stale_checkpoints': (
+        "DELETE FROM reaction_checkpoints WHERE battle_id IN (SELECT battle_id FROM battles WHERE status = 'completed')",
+        (),
+    ),
+    'audio_cache_lookup': (
+        "SELECT size, filename FROM audio_cache WHERE sha256 = ?",
+        ('',),
+    ),
+    'pinned_tracks': (
+        "SELECT e.track_sha256 FROM battles b JOIN entrants e ON e.battle_id = b.battle_id "
+        "WHERE b.status IN ('pending', 'active', 'voting') AND e.track_sha256 IS NOT NULL",
+        (),
+    ),
+}
+
+async def assert_indexed_query_plans(db):
+    """Raise AssertionError if any hot query falls back to a full table scan."""
+    offenders = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        for row in await cursor.fetchall():
+            detail = row[-1]
+            if detail.startswith('SCAN ') and detail != 'SCAN CONSTANT ROW':
+                offenders.append(f"{name}: {detail}")
+    assert not offenders, f"Full table scans in hot queries: {offenders}"
+
+async def init_db():
+    async with get_db() as db:
         await db.execute('''
-            CREATE TABLE IF NOT EXISTS pool_totals (
-                genre TEXT,
-                pool_type REAL,
-                total_amount REAL DEFAULT 0,
-                entrant_count INTEGER DEFAULT 0,
-                PRIMARY KEY (genre, pool_type)
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
-        await db.commit()
+        cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        current = (await cursor.fetchone())[0]
+        if current >= SCHEMA_VERSION:
+            return
+
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            # DDL runs in autocommit mode unless a transaction is opened explicitly
+            await db.execute("BEGIN")
+            try:
+                await migrate(db)
+                await db.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            logger.info(f"Applied schema migration {version}: {description}")
+
+        await assert_indexed_query_plans(db)
 
 def get_db():
-    return aiosqlite.connect(DB_PATH)
+    """Borrow a pooled connection: `async with get_db() as db:`."""
+    return _pool.connection()
+
+def get_pool_stats():
+    return _pool.stats()
+
+async def close_db():
+    stats = _pool.stats()
+    logger.info(f"Closing DB pool ({stats['open']} open, {stats['waits']} waits, max wait {stats['max_wait_seconds']:.3f}s)")
+    await _pool.close()
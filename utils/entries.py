@@ -0,0 +1,90 @@
+import logging
+from utils.database import get_db, commit, rollback
+from utils.user_cache import ensure_user, get_balance
+from utils.coins import debit_coins, REASON_ENTRY_FEE
+
+logger = logging.getLogger('music_battles.entries')
+
+ENTRY_OK = 'ok'
+ENTRY_COOLDOWN = 'cooldown'
+ENTRY_INSUFFICIENT = 'insufficient'
+
+async def precheck_entry(user_id, genre, pool_amount):
+    """Read-only version of record_entry's checks, to turn entries away before any upload work.
+
+    Returns the same (status, data) shapes; record_entry still re-checks both atomically.
+    """
+    async with get_db() as db:
+        cursor = await db.execute(
+            "SELECT 1 FROM entry_cooldowns WHERE user_id = ? AND genre = ? AND pool_amount = ? "
+            "AND last_entry_at > datetime('now', '-24 hours')",
+            (user_id, genre, pool_amount)
+        )
+        if await cursor.fetchone():
+            return ENTRY_COOLDOWN, None
+    balance = await get_balance(user_id)
+    if balance < int(pool_amount):
+        return ENTRY_INSUFFICIENT, balance
+    return ENTRY_OK, None
+
+async def record_entry(user_id, username, genre, pool_amount, track_url, track_sha256=None):
+    """Enter a user into the pending battle for a pool, all in one write transaction.
+
+    Returns (ENTRY_OK, (battle_id, entrant_id)), (ENTRY_COOLDOWN, None) if the user entered
+    this pool in the last 24 hours, or (ENTRY_INSUFFICIENT, balance). BEGIN IMMEDIATE takes
+    the write lock up front, so the cooldown check, the conditional debit and the
+    find-or-create of the pending battle can't interleave with another entry.
+    """
+    required_coins = int(pool_amount)
+    async with get_db() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        await ensure_user(db, user_id, username)
+
+        cursor = await db.execute(
+            "SELECT 1 FROM entry_cooldowns WHERE user_id = ? AND genre = ? AND pool_amount = ? "
+            "AND last_entry_at > datetime('now', '-24 hours')",
+            (user_id, genre, pool_amount)
+        )
+        if await cursor.fetchone():
+            await rollback(db)
+            return ENTRY_COOLDOWN, None
+
+        cursor = await db.execute(
+            "SELECT battle_id FROM battles WHERE genre = ? AND pool_amount = ? AND status = 'pending'",
+            (genre, pool_amount)
+        )
+        row = await cursor.fetchone()
+        if row:
+            battle_id = row[0]
+        else:
+            # idx_battles_one_pending guarantees at most one pending battle per pool
+            cursor = await db.execute(
+                "INSERT INTO battles (genre, pool_amount, status) VALUES (?, ?, 'pending')",
+                (genre, pool_amount)
+            )
+            battle_id = cursor.lastrowid
+
+        cursor = await db.execute(
+            "INSERT INTO entrants (battle_id, user_id, track_link, track_sha256, payment_status) VALUES (?, ?, ?, ?, 'paid')",
+            (battle_id, user_id, track_url, track_sha256)
+        )
+        entrant_id = cursor.lastrowid
+
+        if await debit_coins(db, user_id, required_coins, REASON_ENTRY_FEE, f"entrant:{entrant_id}") is None:
+            cursor = await db.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
+            balance = (await cursor.fetchone())[0]
+            await rollback(db)
+            return ENTRY_INSUFFICIENT, balance
+
+        await db.execute(
+            "INSERT INTO pool_totals (genre, pool_type, total_amount, entrant_count) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(genre, pool_type) DO UPDATE SET total_amount = total_amount + ?, entrant_count = entrant_count + 1",
+            (genre, pool_amount, pool_amount, pool_amount)
+        )
+        await db.execute(
+            "INSERT INTO entry_cooldowns (user_id, genre, pool_amount, last_entry_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(user_id, genre, pool_amount) DO UPDATE SET last_entry_at = excluded.last_entry_at",
+            (user_id, genre, pool_amount)
+        )
+        await commit(db)
+    return ENTRY_OK, (battle_id, entrant_id)
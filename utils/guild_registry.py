@@ -0,0 +1,238 @@
+import logging
+import discord
+from utils.database import get_db
+from utils.constants import GENRES, CREATOR_ROLE_NAME, VOTER_ROLE_NAME
+from utils.provisioning import INFO_CATEGORY, INFO_CHANNELS
+
+logger = logging.getLogger('music_battles.guild_registry')
+
+# Kinds stored in the guild_resources table
+KIND_POOL = 'pool'
+KIND_CHANNEL = 'channel'
+KIND_CATEGORY = 'category'
+KIND_ROLE = 'role'
+
+TRACKED_CHANNELS = frozenset(INFO_CHANNELS)
+TRACKED_CATEGORIES = frozenset([INFO_CATEGORY, *GENRES, *(f"{genre} Battles" for genre in GENRES)])
+TRACKED_ROLES = frozenset([CREATOR_ROLE_NAME, VOTER_ROLE_NAME])
+
+def parse_pool_channel(channel):
+    """(genre, pool) if `channel` is a '<amount>-pool' channel under a genre category, else None."""
+    category = getattr(channel, 'category', None)
+    if not isinstance(channel, discord.TextChannel) or category is None or category.name not in GENRES:
+        return None
+    amount, sep, suffix = channel.name.partition('-')
+    if not sep or suffix != 'pool' or not amount.isdigit():
+        return None
+    return category.name, int(amount)
+
+def _pool_name(genre, pool):
+    return f"{genre}|{int(pool)}"
+
+class GuildResources:
+    """Name -> id maps for the objects the bot looks up in one guild."""
+
+    def __init__(self):
+        self.pools = {}  # (genre, pool) -> channel_id
+        self.channels = {}
+        self.categories = {}
+        self.roles = {}
+
+    def table(self, kind):
+        return {KIND_CHANNEL: self.channels, KIND_CATEGORY: self.categories, KIND_ROLE: self.roles}[kind]
+
+class GuildRegistry:
+    """Per-guild index of pool channels, well-known channels, categories and roles.
+
+    Built from the guild cache once (or loaded from guild_resources at startup) and kept
+    current from channel and role events, so lookups are dict hits instead of name scans.
+    `pool_channel_ids` spans every guild, letting on_message drop non-pool channels with
+    one set-membership test.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+        self._pool_channels = {}  # channel_id -> (guild_id, genre, pool)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def pool_channel_ids(self):
+        return self._pool_channels.keys()
+
+    def _resources(self, guild_id):
+        resources = self._guilds.get(guild_id)
+        if resources is None:
+            resources = self._guilds[guild_id] = GuildResources()
+        return resources
+
+    async def load(self):
+        """Restore the last persisted registry so lookups work before guilds are available."""
+        async with get_db() as db:
+            cursor = await db.execute("SELECT guild_id, kind, name, resource_id FROM guild_resources")
+            rows = await cursor.fetchall()
+        self._guilds.clear()
+        self._pool_channels.clear()
+        for guild_id, kind, name, resource_id in rows:
+            if kind == KIND_POOL:
+                genre, _, pool = name.rpartition('|')
+                self._set_pool(guild_id, genre, int(pool), resource_id)
+            else:
+                self._resources(guild_id).table(kind)[name] = resource_id
+        logger.info(f"Loaded {len(rows)} guild resources for {len(self._guilds)} guilds")
+
+    def _set_pool(self, guild_id, genre, pool, channel_id):
+        self._resources(guild_id).pools[(genre, pool)] = channel_id
+        self._pool_channels[channel_id] = (guild_id, genre, pool)
+
+    def _rows(self, guild_id):
+        resources = self._guilds.get(guild_id)
+        if resources is None:
+            return []
+        rows = [(guild_id, KIND_POOL, _pool_name(g, p), cid) for (g, p), cid in resources.pools.items()]
+        for kind in (KIND_CHANNEL, KIND_CATEGORY, KIND_ROLE):
+            rows += [(guild_id, kind, name, rid) for name, rid in resources.table(kind).items()]
+        return rows
+
+    async def _persist(self, guild_id):
+        rows = self._rows(guild_id)
+        async with get_db() as db:
+            await db.execute("DELETE FROM guild_resources WHERE guild_id = ?", (guild_id,))
+            await db.executemany(
+                "INSERT INTO guild_resources (guild_id, kind, name, resource_id) VALUES (?, ?, ?, ?)", rows
+            )
+            await db.commit()
+
+    def _index(self, guild):
+        self.drop(guild.id)
+        resources = self._resources(guild.id)
+        # Channels in sidebar order so duplicate names resolve like discord.utils.get did
+        for channel in sorted(guild.channels, key=lambda c: (c.position, c.id)):
+            self._add_channel(resources, guild.id, channel)
+        for role in guild.roles:
+            if role.name in TRACKED_ROLES:
+                resources.roles.setdefault(role.name, role.id)
+
+    async def rebuild(self, guild):
+        """Re-index `guild` from the gateway cache and persist the result."""
+        self._index(guild)
+        await self._persist(guild.id)
+        resources = self._guilds[guild.id]
+        logger.info(
+            f"Indexed {guild.name}: {len(resources.pools)} pool channels, {len(resources.channels)} channels, "
+            f"{len(resources.categories)} categories, {len(resources.roles)} roles"
+        )
+
+    def drop(self, guild_id):
+        resources = self._guilds.pop(guild_id, None)
+        if resources:
+            for channel_id in resources.pools.values():
+                self._pool_channels.pop(channel_id, None)
+
+    async def forget(self, guild_id):
+        self.drop(guild_id)
+        await self._persist(guild_id)
+
+    def _add_channel(self, resources, guild_id, channel):
+        if isinstance(channel, discord.CategoryChannel):
+            if channel.name in TRACKED_CATEGORIES:
+                resources.categories.setdefault(channel.name, channel.id)
+            return
+        pool = parse_pool_channel(channel)
+        if pool and pool not in resources.pools:
+            self._set_pool(guild_id, *pool, channel.id)
+        elif isinstance(channel, discord.TextChannel) and channel.name in TRACKED_CHANNELS:
+            resources.channels.setdefault(channel.name, channel.id)
+
+    def _remove_id(self, guild_id, resource_id):
+        """Drop every entry pointing at `resource_id`. Returns True if anything was indexed."""
+        resources = self._guilds.get(guild_id)
+        if resources is None:
+            return False
+        removed = False
+        pool = self._pool_channels.pop(resource_id, None)
+        if pool:
+            resources.pools.pop(pool[1:], None)
+            removed = True
+        for table in (resources.channels, resources.categories, resources.roles):
+            for name, rid in list(table.items()):
+                if rid == resource_id:
+                    del table[name]
+                    removed = True
+        return removed
+
+    def _tracks(self, obj):
+        if isinstance(obj, discord.Role):
+            return obj.name in TRACKED_ROLES
+        if isinstance(obj, discord.CategoryChannel):
+            return obj.name in TRACKED_CATEGORIES
+        return parse_pool_channel(obj) is not None or obj.name in TRACKED_CHANNELS
+
+    async def resource_changed(self, before, after):
+        """Apply a channel or role create (before=None), delete (after=None) or update."""
+        guild = (after or before).guild
+        if guild.id not in self._guilds:
+            return await self.rebuild(guild)
+        previous = self._rows(guild.id)
+        was_indexed = before is not None and self._remove_id(guild.id, before.id)
+        renamed_category = (isinstance(after, discord.CategoryChannel) and before is not None
+                            and before.name != after.name)
+        if renamed_category or (was_indexed and (after is None or not self._tracks(after))):
+            # Renaming a category changes which children are pool channels, and losing an
+            # indexed object may expose another one with the same name
+            self._index(guild)
+        elif after is not None and self._tracks(after):
+            resources = self._guilds[guild.id]
+            if isinstance(after, discord.Role):
+                resources.roles.setdefault(after.name, after.id)
+            else:
+                self._add_channel(resources, guild.id, after)
+        if self._rows(guild.id) != previous:
+            await self._persist(guild.id)
+
+    def _lookup(self, guild_id, kind, name):
+        resources = self._guilds.get(guild_id)
+        resource_id = resources.table(kind).get(name) if resources else None
+        if resource_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return resource_id
+
+    def pool_of(self, channel_id):
+        """(genre, pool) for a pool channel id, or None."""
+        entry = self._pool_channels.get(channel_id)
+        return entry[1:] if entry else None
+
+    def pool_channel(self, guild, genre, pool):
+        resources = self._guilds.get(guild.id)
+        channel_id = resources.pools.get((genre, int(pool))) if resources else None
+        if channel_id is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return guild.get_channel(channel_id)
+
+    def channel(self, guild, name):
+        channel_id = self._lookup(guild.id, KIND_CHANNEL, name)
+        return guild.get_channel(channel_id) if channel_id else None
+
+    def category(self, guild, name):
+        category_id = self._lookup(guild.id, KIND_CATEGORY, name)
+        return guild.get_channel(category_id) if category_id else None
+
+    def role(self, guild, name):
+        role_id = self._lookup(guild.id, KIND_ROLE, name)
+        return guild.get_role(role_id) if role_id else None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'guilds': len(self._guilds),
+            'pool_channels': len(self._pool_channels),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+guild_registry = GuildRegistry()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from utils.database import get_db
+
+logger = logging.getLogger('music_battles.jobs')
+
+class JobQueue:
+    """Durable queue for delayed follow-up work, persisted in the jobs table.
+
+    Handlers are registered per job kind and receive the job's JSON payload. Jobs left
+    'running' by a crash are re-queued on start, so pending work survives restarts.
+    """
+
+    def __init__(self, workers=3, max_attempts=5):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind, payload, delay=0, db=None):
+        """Queue a job to run after `delay` seconds. Pass `db` to enqueue inside the caller's transaction."""
+        run_at = (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+        params = (kind, json.dumps(payload), run_at)
+        sql = "INSERT INTO jobs (kind, payload, run_at) VALUES (?, ?, ?)"
+        if db is not None:
+            await db.execute(sql, params)
+        else:
+            async with get_db() as conn:
+                await conn.execute(sql, params)
+                await conn.commit()
+        self._wakeup.set()
+
+    def notify(self):
+        """Wake idle workers, e.g. after the caller committed jobs enqueued with `db`."""
+        self._wakeup.set()
+
+    async def start(self):
+        async with get_db() as db:
+            await db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+            await db.commit()
+            cursor = await db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'")
+            pending = (await cursor.fetchone())[0]
+        logger.info(f"Starting {self.workers} job workers ({pending} pending jobs)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def stats(self):
+        async with get_db() as db:
+            cursor = await db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            return dict(await cursor.fetchall())
+
+    async def _claim(self):
+        now = datetime.utcnow().isoformat()
+        async with get_db() as db:
+            cursor = await db.execute(
+                """
+                UPDATE jobs SET status = 'running', attempts = attempts + 1
+                WHERE job_id = (
+                    SELECT job_id FROM jobs WHERE status = 'pending' AND run_at <= ?
+                    ORDER BY run_at, job_id LIMIT 1
+                )
+                RETURNING job_id, kind, payload, attempts
+                """,
+                (now,)
+            )
+            row = await cursor.fetchone()
+            await db.commit()
+        return row
+
+    async def _seconds_until_next(self):
+        async with get_db() as db:
+            cursor = await db.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'pending'")
+            next_run = (await cursor.fetchone())[0]
+        if next_run is None:
+            return None
+        return max(0.0, (datetime.fromisoformat(next_run) - datetime.utcnow()).total_seconds())
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                await asyncio.sleep(5)
+                continue
+
+            if not job:
+                timeout = await self._seconds_until_next()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload, attempts = job
+            await self._run(job_id, kind, json.loads(payload), attempts)
+
+    async def _run(self, job_id, kind, payload, attempts):
+        handler = self._handlers.get(kind)
+        try:
+            if not handler:
+                raise LookupError(f"No handler registered for job kind '{kind}'")
+            await handler(payload)
+        except Exception as e:
+            if attempts < self.max_attempts:
+                retry_at = (datetime.utcnow() + timedelta(seconds=30 * 2 ** (attempts - 1))).isoformat()
+                status = 'pending'
+            else:
+                retry_at = None
+                status = 'failed'
+            logger.error(f"Job #{job_id} ({kind}) failed on attempt {attempts}: {e}")
+            async with get_db() as db:
+                await db.execute(
+                    "UPDATE jobs SET status = ?, run_at = COALESCE(?, run_at), last_error = ? WHERE job_id = ?",
+                    (status, retry_at, str(e), job_id)
+                )
+                await db.commit()
+            return
+
+        async with get_db() as db:
+            await db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            await db.commit()
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import logging
+import tempfile
+from utils.constants import MEDIA_MAX_BYTES, MEDIA_MEMORY_BUDGET_BYTES, MEDIA_SPOOL_BYTES
+
+logger = logging.getLogger('music_battles.media_relay')
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 16
+
+class MediaRejected(Exception):
+    """Raised when an upload is empty, too large or doesn't look like audio."""
+
+def sniff_audio(head):
+    """Recognise common audio containers from the first few bytes of a file."""
+    if head.startswith((b'ID3', b'fLaC', b'OggS', b'\x1aE\xdf\xa3')):  # mp3 tag, flac, ogg, webm/mka
+        return True
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return True
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return True
+    if head[4:8] == b'ftyp':  # mp4/m4a
+        return True
+    # Bare MPEG audio / ADTS AAC frame sync
+    return len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0
+
+class MemoryBudget:
+    """Global cap on bytes buffered in RAM across all concurrent transfers."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, n):
+        async with self._condition:
+            # A single request larger than the whole budget may still proceed on its own
+            await self._condition.wait_for(lambda: self.in_use + n <= self.limit or self.in_use == 0)
+            self.in_use += n
+            self.peak = max(self.peak, self.in_use)
+
+    async def release(self, n):
+        if not n:
+            return
+        async with self._condition:
+            self.in_use -= n
+            self._condition.notify_all()
+
+class RelayedMedia:
+    """A streamed download held in a spooled temp file. Close it to free its memory reservation."""
+
+    def __init__(self, file, size, sha256, budget, reserved):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self._budget = budget
+        self._reserved = reserved
+
+    async def close(self):
+        self.file.close()
+        await self._budget.release(self._reserved)
+        self._reserved = 0
+
+class MediaRelay:
+    """Streams remote media into spooled temp files under a shared memory budget.
+
+    Small files stay in memory up to `spool_bytes`, larger ones roll over to disk, and
+    only in-memory bytes count against the budget. Uploads are checked for size up front
+    and sniffed from their first bytes, so rejected files are never fully downloaded.
+    """
+
+    def __init__(self, max_bytes, memory_budget, spool_bytes):
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self.budget = MemoryBudget(memory_budget)
+        self.transfers = 0
+        self.rejected = 0
+
+    async def fetch(self, session, url, declared_size=None):
+        if declared_size == 0:
+            self.rejected += 1
+            raise MediaRejected("File is empty.")
+        if declared_size is not None and declared_size > self.max_bytes:
+            self.rejected += 1
+            raise MediaRejected(f"File is {declared_size / 1024 ** 2:.1f} MB; the limit is {self.max_bytes / 1024 ** 2:.0f} MB.")
+
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        digest = hashlib.sha256()
+        size = 0
+        reserved = 0
+        head = b''
+        try:
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+                if resp.content_length is not None and resp.content_length > self.max_bytes:
+                    raise MediaRejected(f"File is larger than {self.max_bytes / 1024 ** 2:.0f} MB.")
+
+                # Reserve the whole in-memory part of the spool before reading, so concurrent
+                # transfers are admitted whole instead of deadlocking on partial reservations
+                expected = resp.content_length if resp.content_length is not None else self.spool_bytes
+                reserved = min(expected, self.spool_bytes)
+                await self.budget.acquire(reserved)
+
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                        if len(head) >= SNIFF_BYTES and not sniff_audio(head):
+                            raise MediaRejected("File doesn't look like an audio track.")
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaRejected(f"File is larger than {self.max_bytes / 1024 ** 2:.0f} MB.")
+                    if size > self.spool_bytes:
+                        # This write rolls the spool over to disk, or it already has
+                        await asyncio.to_thread(spool.write, chunk)
+                    else:
+                        spool.write(chunk)
+                    digest.update(chunk)
+                    if size > self.spool_bytes and reserved:
+                        # Spool rolled over to disk; its memory is no longer ours
+                        await self.budget.release(reserved)
+                        reserved = 0
+
+            if not size:
+                raise MediaRejected("File is empty.")
+            if not sniff_audio(head):
+                raise MediaRejected("File doesn't look like an audio track.")
+            if reserved > size:
+                # Content-Length was missing or wrong; keep only what is actually buffered
+                await self.budget.release(reserved - size)
+                reserved = size
+        except BaseException as e:
+            if isinstance(e, MediaRejected):
+                self.rejected += 1
+            spool.close()
+            await self.budget.release(reserved)
+            raise
+
+        spool.seek(0)
+        self.transfers += 1
+        return RelayedMedia(spool, size, digest.hexdigest(), self.budget, reserved)
+
+    def stats(self):
+        return {
+            'transfers': self.transfers,
+            'rejected': self.rejected,
+            'buffered_bytes': self.budget.in_use,
+            'peak_buffered_bytes': self.budget.peak,
+        }
+
+media_relay = MediaRelay(MEDIA_MAX_BYTES, MEDIA_MEMORY_BUDGET_BYTES, MEDIA_SPOOL_BYTES)
@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import logging
+import time
+import aiohttp
+
+logger = logging.getLogger('music_battles.paypal')
+
+class PayPalError(Exception):
+    """Raised when PayPal rejects a request or no access token can be obtained."""
+
+class PayPalClient:
+    """PayPal REST client on one pooled session with a cached OAuth token.
+
+    The token is reused until `refresh_margin` seconds before its `expires_in`, and concurrent
+    callers that find it stale share a single refresh. `base_url` can point at a local stand-in.
+    """
+
+    def __init__(self, client_id, client_secret, base_url, refresh_margin=120, timeout=30):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url.rstrip('/')
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self._session = None
+        self._token = None
+        self._token_expires = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self.token_hits = 0
+        self.token_misses = 0
+        self._latency = {}  # endpoint -> [calls, total_seconds, max_seconds]
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    def _record(self, endpoint, elapsed):
+        entry = self._latency.setdefault(endpoint, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+
+    def _token_valid(self):
+        return self._token is not None and time.monotonic() < self._token_expires - self.refresh_margin
+
+    async def get_token(self):
+        if self._token_valid():
+            self.token_hits += 1
+            return self._token
+        async with self._refresh_lock:
+            # Someone else may have refreshed while we waited on the lock
+            if self._token_valid():
+                self.token_hits += 1
+                return self._token
+            self.token_misses += 1
+            auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+            start = time.perf_counter()
+            async with self._get_session().post(
+                f"{self.base_url}/v1/oauth2/token",
+                headers={"Authorization": f"Basic {auth}"},
+                data={"grant_type": "client_credentials"}
+            ) as resp:
+                data = await resp.json()
+            self._record('token', time.perf_counter() - start)
+            if resp.status != 200:
+                logger.error(f"PayPal Token Error: {resp.status} - {data}")
+                raise PayPalError("Failed to get PayPal access token.")
+            self._token = data['access_token']
+            self._token_expires = time.monotonic() + float(data.get('expires_in', 0))
+            return self._token
+
+    def invalidate_token(self):
+        self._token = None
+
+    async def _request(self, endpoint, method, path, json=None):
+        """Authorised call; a 401 drops the cached token and retries once. Returns (status, body)."""
+        for attempt in range(2):
+            token = await self.get_token()
+            headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+            start = time.perf_counter()
+            async with self._get_session().request(method, f"{self.base_url}{path}", headers=headers, json=json) as resp:
+                data = await resp.json()
+            self._record(endpoint, time.perf_counter() - start)
+            if resp.status == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            return resp.status, data
+
+    async def create_order(self, amount, desc, custom_id=None):
+        unit = {"amount": {"currency_code": "USD", "value": str(amount)}, "description": desc}
+        if custom_id:
+            unit["custom_id"] = custom_id
+        status, data = await self._request('create_order', 'POST', "/v2/checkout/orders", json={
+            "intent": "CAPTURE",
+            "purchase_units": [unit]
+        })
+        if status not in (200, 201):
+            logger.error(f"PayPal Order Error: {status} - {data}")
+            raise PayPalError(f"PayPal API error: {data.get('message', 'Unknown error')}")
+        return data
+
+    async def get_order_status(self, order_id):
+        status, data = await self._request('get_order', 'GET', f"/v2/checkout/orders/{order_id}")
+        return data.get('status')
+
+    async def capture_order(self, order_id):
+        status, data = await self._request('capture_order', 'POST', f"/v2/checkout/orders/{order_id}/capture")
+        return data.get('status')
+
+    async def verify_webhook_signature(self, headers, event, webhook_id):
+        """Ask PayPal whether a webhook delivery carries a valid signature for our webhook id."""
+        status, data = await self._request('verify_webhook', 'POST', "/v1/notifications/verify-webhook-signature", json={
+            "auth_algo": headers.get('paypal-auth-algo'),
+            "cert_url": headers.get('paypal-cert-url'),
+            "transmission_id": headers.get('paypal-transmission-id'),
+            "transmission_sig": headers.get('paypal-transmission-sig'),
+            "transmission_time": headers.get('paypal-transmission-time'),
+            "webhook_id": webhook_id,
+            "webhook_event": event,
+        })
+        return status == 200 and data.get('verification_status') == 'SUCCESS'
+
+    def stats(self):
+        lookups = self.token_hits + self.token_misses
+        return {
+            'token_hits': self.token_hits,
+            'token_misses': self.token_misses,
+            'token_hit_rate': self.token_hits / lookups if lookups else 0.0,
+            'latency': {
+                endpoint: {'calls': calls, 'avg_ms': total / calls * 1000, 'max_ms': worst * 1000}
+                for endpoint, (calls, total, worst) in self._latency.items()
+            },
+        }
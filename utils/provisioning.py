@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+import discord
+from utils.constants import GENRES, POOLS
+
+logger = logging.getLogger('music_battles.provisioning')
+
+INFO_CATEGORY = "Battle Information"
+INFO_CHANNELS = ["live-stats", "results-winners", "announcements"]
+
+def pool_channel_name(pool):
+    return f"{int(pool)}-pool"
+
+def desired_layout():
+    """Category name -> channel names that /setup_server should leave in the guild."""
+    layout = {INFO_CATEGORY: list(INFO_CHANNELS)}
+    for genre in GENRES:
+        layout[genre] = [pool_channel_name(pool) for pool in POOLS]
+    return layout
+
+def _info_overwrites(guild):
+    return {
+        guild.default_role: discord.PermissionOverwrite(send_messages=False),
+        guild.me: discord.PermissionOverwrite(send_messages=True),
+    }
+
+def _info_permissions_ok(guild, channel):
+    return (channel.overwrites_for(guild.default_role).send_messages is False
+            and channel.overwrites_for(guild.me).send_messages is True)
+
+class ProvisionOp:
+    """A single change in a plan. `calls` is the number of API requests it costs."""
+
+    def __init__(self, action, name, category=None, calls=1, target=None, pool=None):
+        self.action = action
+        self.name = name
+        self.category = category
+        self.calls = calls
+        self.target = target
+        self.pool = pool
+
+    def describe(self):
+        where = f" in '{self.category}'" if self.category else ""
+        return f"{self.action} '{self.name}'{where}"
+
+class ProvisionPlan:
+    """Ordered phases of operations. Inside a phase, ops run concurrently except where
+    they share a lane (see `_lane`)."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.phases = []
+
+    def add_phase(self, ops):
+        if ops:
+            self.phases.append(ops)
+
+    @property
+    def ops(self):
+        return [op for phase in self.phases for op in phase]
+
+    @property
+    def api_calls(self):
+        return sum(op.calls for op in self.ops)
+
+    def is_empty(self):
+        return not self.phases
+
+    def summary(self, limit=25):
+        ops = self.ops
+        if not ops:
+            return "Nothing to do, the server already matches the expected layout."
+        lines = [f"{len(ops)} operations, {self.api_calls} API calls in {len(self.phases)} phases:"]
+        lines += [f"- {op.describe()}" for op in ops[:limit]]
+        if len(ops) > limit:
+            lines.append(f"...and {len(ops) - limit} more")
+        return "\n".join(lines)
+
+def plan_setup(guild, role_names):
+    """Diff the guild against desired_layout() and return only the missing work."""
+    plan = ProvisionPlan('setup')
+    categories = {c.name: c for c in guild.categories}
+    existing_roles = {r.name for r in guild.roles}
+
+    first = [ProvisionOp('create_role', name) for name in role_names if name not in existing_roles]
+    second = []
+    for cat_name, channel_names in desired_layout().items():
+        category = categories.get(cat_name)
+        if not category:
+            first.append(ProvisionOp('create_category', cat_name))
+        existing = {ch.name: ch for ch in category.text_channels} if category else {}
+        is_info = cat_name == INFO_CATEGORY
+        for index, ch_name in enumerate(channel_names):
+            channel = existing.get(ch_name)
+            if channel is None:
+                # Info channels get their overwrites in the create call; pool channels get a welcome post
+                second.append(ProvisionOp('create_channel', ch_name, category=cat_name, calls=1 if is_info else 2,
+                                          pool=None if is_info else POOLS[index]))
+            elif is_info and not _info_permissions_ok(guild, channel):
+                second.append(ProvisionOp('set_permissions', ch_name, category=cat_name, calls=2, target=channel))
+
+    plan.add_phase(first)
+    plan.add_phase(second)
+    return plan
+
+def plan_teardown(guild):
+    """Everything /delete_setup removes: the info, genre and '<genre> Battles' categories with their channels."""
+    plan = ProvisionPlan('teardown')
+    wanted = {INFO_CATEGORY} | set(GENRES) | {f"{genre} Battles" for genre in GENRES}
+    channels, categories = [], []
+    for category in guild.categories:
+        if category.name not in wanted:
+            continue
+        channels += [ProvisionOp('delete_channel', ch.name, category=category.name, target=ch) for ch in category.channels]
+        categories.append(ProvisionOp('delete_category', category.name, target=category))
+    plan.add_phase(channels)
+    plan.add_phase(categories)
+    return plan
+
+def _lane(op):
+    """Ops in the same lane run one after another, in plan order.
+
+    Discord appends each new role, category and channel at the bottom of its list, so
+    creates that land in the same list stay serial to keep the sidebar order the same on
+    every run. Channels in different categories, and deletes, don't affect each other.
+    """
+    if op.action == 'create_role':
+        return 'roles'
+    if op.action == 'create_category':
+        return 'categories'
+    if op.action == 'create_channel':
+        return ('channels', op.category)
+    return id(op)
+
+async def apply_plan(plan, guild, call, concurrency=5, welcome_embed=None):
+    """Run a plan phase by phase, with lanes in a phase running concurrently.
+
+    `call` wraps each API request (the cog's retry helper). Pacing comes from discord.py's
+    HTTP client, which waits on the per-route rate-limit buckets from the response headers,
+    so there are no fixed sleeps here. Returns the number of operations that failed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    categories = {c.name: c for c in guild.categories}
+    failures = 0
+
+    async def run(op):
+        async with semaphore:
+            if op.action == 'create_role':
+                await call(guild.create_role, name=op.name, color=discord.Color.blue())
+            elif op.action == 'create_category':
+                categories[op.name] = await call(guild.create_category, op.name)
+            elif op.action == 'create_channel':
+                category = categories.get(op.category)
+                if category is None:
+                    raise RuntimeError(f"category '{op.category}' is missing")
+                if op.category == INFO_CATEGORY:
+                    await call(guild.create_text_channel, op.name, category=category, overwrites=_info_overwrites(guild))
+                else:
+                    channel = await call(guild.create_text_channel, op.name, category=category)
+                    if channel and welcome_embed:
+                        await call(channel.send, embed=welcome_embed(op.category, op.pool))
+            elif op.action == 'set_permissions':
+                await call(op.target.set_permissions, guild.default_role, send_messages=False)
+                await call(op.target.set_permissions, guild.me, send_messages=True)
+            elif op.action in ('delete_channel', 'delete_category'):
+                await call(op.target.delete)
+
+    async def run_lane(ops):
+        nonlocal failures
+        for op in ops:
+            try:
+                await run(op)
+            except Exception as e:
+                failures += 1
+                logger.error(f"Provisioning step failed ({op.describe()}): {e}")
+
+    start = time.perf_counter()
+    for phase in plan.phases:
+        lanes = {}
+        for op in phase:
+            lanes.setdefault(_lane(op), []).append(op)
+        await asyncio.gather(*(run_lane(ops) for ops in lanes.values()))
+    logger.info(f"Applied {plan.kind} plan for guild {guild.id}: {len(plan.ops)} ops, ~{plan.api_calls} API calls, "
+                f"{failures} failed, {time.perf_counter() - start:.1f}s")
+    return failures
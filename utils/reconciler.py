@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from utils.database import get_db
+
+logger = logging.getLogger('music_battles.reconciler')
+
+class RateLimiter:
+    """Spaces call starts at least 1/rate seconds apart across all concurrent callers."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class PurchaseReconciler:
+    """Re-checks checkouts recorded in pending_purchases that no webhook or button has settled.
+
+    `check(provider, payment_id)` returns 'paid', 'pending' or 'void'; `credit(provider,
+    payment_id, user_id, coins)` must be idempotent. Records still pending are retried with
+    per-record exponential back-off and expire after `expire_after` seconds.
+    """
+
+    def __init__(self, check, credit, batch_size=50, concurrency=5, rate=5.0,
+                 base_delay=120, max_delay=3600, expire_after=86400):
+        self.check = check
+        self.credit = credit
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expire_after = expire_after
+        self.checked = 0
+        self.credited = 0
+        self.expired = 0
+
+    async def record(self, provider, payment_id, user_id, coins):
+        """Remember a checkout as soon as it is created; first re-check after `base_delay`."""
+        next_check = (datetime.utcnow() + timedelta(seconds=self.base_delay)).isoformat()
+        async with get_db() as db:
+            await db.execute(
+                "INSERT OR IGNORE INTO pending_purchases (payment_id, provider, user_id, coins, next_check_at) VALUES (?, ?, ?, ?, ?)",
+                (payment_id, provider, user_id, coins, next_check)
+            )
+            await db.commit()
+
+    def _backoff(self, attempts):
+        return min(self.base_delay * 2 ** attempts, self.max_delay)
+
+    async def run_once(self):
+        """Check one batch of due records. Returns how many were checked."""
+        now = datetime.utcnow()
+        async with get_db() as db:
+            cursor = await db.execute(
+                "SELECT payment_id, provider, user_id, coins, attempts, created_at FROM pending_purchases "
+                "WHERE status = 'pending' AND next_check_at <= ? ORDER BY next_check_at LIMIT ?",
+                (now.isoformat(), self.batch_size)
+            )
+            due = await cursor.fetchall()
+        if not due:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def reconcile(row):
+            payment_id, provider, user_id, coins, attempts, created_at = row
+            async with semaphore:
+                await self.limiter.wait()
+                try:
+                    result = await self.check(provider, payment_id)
+                except Exception as e:
+                    logger.warning(f"Could not check {provider} payment {payment_id}: {e}")
+                    result = 'pending'
+            if result == 'paid':
+                if await self.credit(provider, payment_id, user_id, coins):
+                    self.credited += 1
+                return ('credited', now.isoformat(), attempts + 1, payment_id)
+            age = (now - datetime.fromisoformat(created_at)).total_seconds()
+            if result == 'void' or age > self.expire_after:
+                self.expired += 1
+                return ('expired', now.isoformat(), attempts + 1, payment_id)
+            retry_at = (now + timedelta(seconds=self._backoff(attempts + 1))).isoformat()
+            return ('pending', retry_at, attempts + 1, payment_id)
+
+        results = await asyncio.gather(*(reconcile(row) for row in due))
+        self.checked += len(due)
+        async with get_db() as db:
+            await db.executemany(
+                "UPDATE pending_purchases SET status = ?, next_check_at = ?, attempts = ? WHERE payment_id = ? AND status = 'pending'",
+                results
+            )
+            await db.commit()
+        return len(due)
+
+    async def stats(self):
+        """Queue depth and age of the oldest outstanding checkout, plus lifetime counters."""
+        async with get_db() as db:
+            cursor = await db.execute("SELECT COUNT(*), MIN(created_at) FROM pending_purchases WHERE status = 'pending'")
+            depth, oldest = await cursor.fetchone()
+        oldest_age = (datetime.utcnow() - datetime.fromisoformat(oldest)).total_seconds() if oldest else 0.0
+        return {
+            'depth': depth,
+            'oldest_age_seconds': oldest_age,
+            'checked': self.checked,
+            'credited': self.credited,
+            'expired': self.expired,
+        }
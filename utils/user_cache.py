@@ -0,0 +1,111 @@
+import sys
+from collections import OrderedDict
+from utils.constants import USER_CACHE_SIZE
+from utils.database import after_commit, get_db
+
+class UserCache:
+    """Bounded LRU of committed user balances (user_id -> coins).
+
+    Writers stage new balances with after_commit(), so the cache only ever reflects
+    committed rows; aborted transactions invalidate instead. Every write bumps a per-user
+    version so a slow read-through can't overwrite a newer value with an older one.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        coins = self._entries.get(user_id)
+        if coins is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return coins
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def _store(self, user_id, coins):
+        self._entries[user_id] = coins
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._versions.pop(evicted, None)
+            self.evictions += 1
+
+    def fill(self, user_id, coins, version):
+        """Cache a value read from the database, unless a write landed since the read began."""
+        if self.version(user_id) == version:
+            self._store(user_id, coins)
+
+    def set(self, user_id, coins):
+        self._versions[user_id] = self.version(user_id) + 1
+        self._store(user_id, coins)
+
+    def invalidate(self, user_id):
+        self._versions[user_id] = self.version(user_id) + 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        for user_id in list(self._entries):
+            self.invalidate(user_id)
+
+    def stage(self, db, user_id, coins):
+        """Write through once `db`'s transaction commits; invalidate if it doesn't."""
+        after_commit(db, lambda: self.set(user_id, coins), lambda: self.invalidate(user_id))
+
+    def memory_bytes(self):
+        """Approximate footprint of the cached entries and version counters."""
+        total = sys.getsizeof(self._entries) + sys.getsizeof(self._versions)
+        for user_id, coins in self._entries.items():
+            total += sys.getsizeof(user_id) + sys.getsizeof(coins)
+        return total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'memory_bytes': self.memory_bytes(),
+        }
+
+user_cache = UserCache(USER_CACHE_SIZE)
+
+async def ensure_user(db, user_id, username):
+    """Make sure a users row exists, skipping the upsert entirely for cached users."""
+    if user_id in user_cache:
+        return
+    version = user_cache.version(user_id)
+    cursor = await db.execute(
+        "INSERT INTO users (user_id, username) VALUES (?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET username = COALESCE(users.username, excluded.username) RETURNING coins",
+        (user_id, username)
+    )
+    coins = (await cursor.fetchone())[0]
+    after_commit(db, lambda: user_cache.fill(user_id, coins, version))
+
+async def get_balance(user_id):
+    """Cached balance, read through on a miss. Unknown users have 0 coins."""
+    coins = user_cache.get(user_id)
+    if coins is not None:
+        return coins
+    version = user_cache.version(user_id)
+    async with get_db() as db:
+        cursor = await db.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+    if row is None:
+        return 0
+    user_cache.fill(user_id, row[0], version)
+    return row[0]
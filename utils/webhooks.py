@@ -0,0 +1,128 @@
+import contextlib
+import json
+import logging
+import stripe
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+logger = logging.getLogger('music_battles.webhooks')
+
+class _EmbeddedServer(uvicorn.Server):
+    """uvicorn server that leaves SIGINT/SIGTERM to the bot instead of capturing them."""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+    def install_signal_handlers(self):
+        pass
+
+def parse_custom_id(value):
+    """'<user_id>:<coins>' as written into PayPal's purchase_units[].custom_id."""
+    user_id, coins = (value or '').split(':')
+    return int(user_id), int(coins)
+
+class WebhookServer:
+    """Receives signed Stripe and PayPal checkout events inside the bot's event loop.
+
+    `credit` is an async callable `(provider, payment_id, user_id, coins)` that must be
+    idempotent: providers redeliver events, and the verify button may race a webhook.
+    """
+
+    def __init__(self, host, port, credit, stripe_secret=None, paypal=None, paypal_webhook_id=None):
+        self.host = host
+        self.port = port
+        self.credit = credit
+        self.stripe_secret = stripe_secret
+        self.paypal = paypal
+        self.paypal_webhook_id = paypal_webhook_id
+        self.received = 0
+        self.rejected = 0
+        self.failed = False
+        self._server = None
+        self.app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+        if stripe_secret:
+            self.app.add_api_route("/webhooks/stripe", self.stripe_webhook, methods=["POST"])
+        if paypal and paypal_webhook_id:
+            self.app.add_api_route("/webhooks/paypal", self.paypal_webhook, methods=["POST"])
+
+    async def serve(self):
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning", access_log=False)
+        self._server = _EmbeddedServer(config)
+        logger.info(f"Payment webhooks listening on {self.host}:{self.port}")
+        try:
+            await self._server.serve()
+        except SystemExit as e:
+            # uvicorn exits the process when it can't bind; that must not take the bot down with it
+            self.failed = True
+            logger.error(f"Payment webhooks could not start on {self.host}:{self.port} (exit code {e.code}); "
+                         f"running without webhooks")
+
+    def stop(self):
+        if self._server:
+            self._server.should_exit = True
+
+    async def stripe_webhook(self, request: Request):
+        self.received += 1
+        payload = await request.body()
+        try:
+            stripe.Webhook.construct_event(payload, request.headers.get('stripe-signature', ''), self.stripe_secret)
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            self.rejected += 1
+            logger.warning(f"Rejected Stripe webhook: {e}")
+            return Response(status_code=400)
+
+        # Read the verified payload as plain JSON rather than through stripe's object wrappers
+        event = json.loads(payload)
+        if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+            session = event['data']['object']
+            metadata = session.get('metadata') or {}
+            if session.get('payment_status') == 'paid' and 'user_id' in metadata:
+                await self.credit('stripe', session['id'], int(metadata['user_id']), int(metadata['coins']))
+        return Response(status_code=200)
+
+    async def paypal_webhook(self, request: Request):
+        self.received += 1
+        try:
+            event = await request.json()
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            self.rejected += 1
+            logger.warning("Rejected PayPal webhook with a malformed body")
+            return Response(status_code=400)
+        if not await self.paypal.verify_webhook_signature(request.headers, event, self.paypal_webhook_id):
+            self.rejected += 1
+            logger.warning(f"Rejected PayPal webhook {event.get('id')}")
+            return Response(status_code=400)
+
+        event_type = event.get('event_type')
+        resource = event.get('resource') or {}
+        if event_type == 'CHECKOUT.ORDER.APPROVED':
+            # Approved orders still have to be captured before the money moves
+            order_id = resource.get('id')
+            units = resource.get('purchase_units') or [{}]
+            if order_id and units[0].get('custom_id'):
+                # Parse before capturing so a bad custom_id never moves money we can't credit
+                purchase = self._parse_purchase(event, units[0]['custom_id'])
+                if purchase is None:
+                    return Response(status_code=400)
+                status = await self.paypal.capture_order(order_id)
+                if status == 'COMPLETED' or await self.paypal.get_order_status(order_id) == 'COMPLETED':
+                    await self.credit('paypal', order_id, *purchase)
+        elif event_type == 'PAYMENT.CAPTURE.COMPLETED':
+            order_id = (resource.get('supplementary_data') or {}).get('related_ids', {}).get('order_id')
+            if order_id and resource.get('custom_id'):
+                purchase = self._parse_purchase(event, resource['custom_id'])
+                if purchase is None:
+                    return Response(status_code=400)
+                await self.credit('paypal', order_id, *purchase)
+        return Response(status_code=200)
+
+    def _parse_purchase(self, event, custom_id):
+        try:
+            return parse_custom_id(custom_id)
+        except (TypeError, ValueError):
+            self.rejected += 1
+            logger.warning(f"Rejected PayPal webhook {event.get('id')}: bad custom_id {custom_id!r}")
+            return None